@@ -5,10 +5,12 @@
 1. 架构规划：设计系统整体架构
 2. 技术选型：选择合适的工具和框架
 3. 模块划分：将系统拆分为可开发的模块
+4. 并发设计：架构设计、技术选型、模块接口定义只依赖需求文档和子任务，三者同时调用LLM
 """
 from .base_agent import BaseAgent
 from langchain.tools import Tool
-from typing import Dict, List
+from typing import Dict, List, Optional
+import config
 
 
 class ArchitectAgent(BaseAgent):
@@ -22,8 +24,16 @@ class ArchitectAgent(BaseAgent):
     4. 制定开发规范
     """
     
-    def __init__(self, model_name: str = None):
-        """初始化架构设计Agent"""
+    def __init__(self, model_name: str = None, include_analysis: Optional[bool] = None):
+        """
+        初始化架构设计Agent
+        
+        Args:
+            model_name: 使用的LLM模型名称
+            include_analysis: 是否在设计前单独调用一次需求分析（默认 Config.ARCHITECT_ANALYSIS）
+        """
+        self.include_analysis = config.Config.ARCHITECT_ANALYSIS if include_analysis is None else include_analysis
+        
         system_message = """你是一位资深的软件架构师，擅长：
 1. 设计清晰、可扩展的系统架构
 2. 进行合理的技术选型
@@ -69,27 +79,27 @@ class ArchitectAgent(BaseAgent):
             subtasks: 子任务列表
             
         Returns:
-            包含架构设计结果的字典
+            包含架构设计结果的字典（未开启 include_analysis 时 analysis 为None）
         """
-        # 第一步：分析需求
-        analysis = self.think(
-            f"请分析以下需求文档，识别系统的核心模块和技术要求：\n{requirement_doc}"
-        )
-        
-        # 第二步：设计架构
-        architecture = self.create_architecture_design(requirement_doc, subtasks)
-        
-        # 第三步：技术选型
-        tech_stack = self.select_tech_stack(requirement_doc)
+        # 架构设计、技术选型、模块接口定义互不依赖，同时调用LLM
+        calls = {
+            "architecture": lambda: self.create_architecture_design(requirement_doc, subtasks),
+            "tech_stack": lambda: self.select_tech_stack(requirement_doc),
+            "module_interfaces": lambda: self.define_module_interfaces(subtasks),
+        }
+        # 需求分析的结果不被后续步骤使用，只在需要查看时调用
+        if self.include_analysis:
+            calls["analysis"] = lambda: self.think(
+                f"请分析以下需求文档，识别系统的核心模块和技术要求：\n{requirement_doc}"
+            )
         
-        # 第四步：定义模块接口
-        module_interfaces = self.define_module_interfaces(subtasks)
+        results = self.run_concurrently(calls)
         
         return {
-            "analysis": analysis,
-            "architecture": architecture,
-            "tech_stack": tech_stack,
-            "module_interfaces": module_interfaces
+            "analysis": results.get("analysis"),
+            "architecture": results["architecture"],
+            "tech_stack": results["tech_stack"],
+            "module_interfaces": results["module_interfaces"]
         }
     
     def create_architecture_design(self, requirement_doc: str, subtasks: List[str]) -> str:
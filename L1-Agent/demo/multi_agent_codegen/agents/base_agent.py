@@ -5,8 +5,10 @@
 1. Agent的四大核心要素：规划、记忆、工具、执行
 2. Agent的基本结构：角色定义、系统消息、工具配置
 3. Agent间的通信机制
+4. 并发调用：互不依赖的LLM调用同时执行，耗时取决于最慢的一次而不是总和
 """
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional
 from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.tools import BaseTool
@@ -64,6 +66,9 @@ class BaseAgent:
         
         # 任务历史（长期记忆的简化版本）
         self.task_history: List[Dict] = []
+        
+        # 是否并发执行互不依赖的LLM调用
+        self.parallel_calls = config.Config.AGENT_PARALLEL_CALLS
     
     def think(self, task: str, context: Optional[Dict] = None) -> str:
         """
@@ -99,6 +104,23 @@ class BaseAgent:
         
         return response.content
     
+    def run_concurrently(self, calls: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        同时执行一组互不依赖的调用
+        
+        Args:
+            calls: 名称到无参调用的映射（如 {"tech_stack": lambda: self.select_tech_stack(doc)}）
+            
+        Returns:
+            名称到调用结果的映射；任一调用出错时抛出该异常
+        """
+        if not self.parallel_calls or len(calls) <= 1:
+            return {name: call() for name, call in calls.items()}
+        
+        with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            futures = {name: executor.submit(call) for name, call in calls.items()}
+            return {name: future.result() for name, future in futures.items()}
+    
     def execute(self, action: str, parameters: Optional[Dict] = None) -> str:
         """
         Agent执行方法：调用工具执行具体操作
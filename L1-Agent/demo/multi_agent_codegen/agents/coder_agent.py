@@ -9,7 +9,7 @@
 from .base_agent import BaseAgent
 from typing import Optional
 from langchain.tools import Tool
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import os
 
 
@@ -70,7 +70,9 @@ class CoderAgent(BaseAgent):
         task: str,
         architecture: str,
         module_interface: str,
-        tech_stack: str
+        tech_stack: str,
+        file_path: Optional[str] = None,
+        dependencies: Optional[List[Dict]] = None
     ) -> Dict:
         """
         生成代码
@@ -80,15 +82,17 @@ class CoderAgent(BaseAgent):
             architecture: 架构设计
             module_interface: 模块接口定义
             tech_stack: 技术栈
+            file_path: 保存的文件路径（相对工作目录），为None时根据任务推断
+            dependencies: 已完成的上游子任务的代码（generate_code的返回值），写入Prompt供本任务导入使用
             
         Returns:
             包含代码和文件路径的字典
         """
         # 生成代码
-        code = self._generate_code_impl(task, architecture, module_interface, tech_stack)
+        code = self._generate_code_impl(task, architecture, module_interface, tech_stack, dependencies)
         
         # 确定文件路径
-        file_path = self._determine_file_path(task)
+        file_path = file_path or self._determine_file_path(task)
         
         # 保存代码
         full_path = os.path.join(self.work_dir, file_path)
@@ -108,9 +112,16 @@ class CoderAgent(BaseAgent):
         task: str,
         architecture: str,
         module_interface: str,
-        tech_stack: str
+        tech_stack: str,
+        dependencies: Optional[List[Dict]] = None
     ) -> str:
         """生成代码的实现"""
+        dependency_section = ""
+        if dependencies:
+            dependency_section = "\n已完成的依赖模块（直接导入使用，不要重复实现）：\n" + "\n".join(
+                f"文件 {dep['file_path']}：\n```python\n{dep['code']}\n```" for dep in dependencies
+            ) + "\n"
+        
         prompt = f"""请基于以下信息生成完整的代码：
 
 任务描述：{task}
@@ -123,7 +134,7 @@ class CoderAgent(BaseAgent):
 
 技术栈：
 {tech_stack}
-
+{dependency_section}
 要求：
 1. 代码要完整、可运行
 2. 遵循Python PEP 8编码规范
@@ -160,6 +171,30 @@ class CoderAgent(BaseAgent):
             # 默认文件名
             return "module.py"
     
+    def assign_file_paths(self, tasks: List[str]) -> List[str]:
+        """
+        为一组子任务分配互不重复的文件路径
+        
+        推断出的文件名相同时依次加序号（module.py、module_2.py……），
+        避免并发生成时多个子任务写同一个文件
+        
+        Args:
+            tasks: 子任务描述列表
+            
+        Returns:
+            与子任务一一对应的文件路径
+        """
+        counts: Dict[str, int] = {}
+        file_paths = []
+        for task in tasks:
+            file_path = self._determine_file_path(task)
+            counts[file_path] = counts.get(file_path, 0) + 1
+            if counts[file_path] > 1:
+                stem, ext = os.path.splitext(file_path)
+                file_path = f"{stem}_{counts[file_path]}{ext}"
+            file_paths.append(file_path)
+        return file_paths
+    
     def improve_code(self, code: str, feedback: str) -> str:
         """
         根据反馈改进代码
@@ -5,10 +5,36 @@
 1. 任务分解（Planning）：将复杂需求拆解为可执行的子任务
 2. 需求澄清：通过提问补充缺失信息
 3. 需求文档生成：输出结构化的需求文档
+4. 依赖图：子任务带上 depends_on 依赖边，协调器据此调度（互不依赖的子任务并发执行）
+5. 并发调用：需求理解与任务拆解互不依赖，同时调用LLM；需求文档依赖拆解结果，随后生成
 """
 from .base_agent import BaseAgent
 from langchain.tools import Tool
 from typing import List, Dict
+import re
+
+
+# 匹配行尾的依赖标注，如 "（依赖: 1, 2）"、"[依赖：无]"
+_DEPENDS_PATTERN = re.compile(r"[\(\[（【]?\s*依赖\s*[:：]\s*([^\)\]）】]*)[\)\]）】]?\s*$")
+
+
+def _has_cycle(edges: List[List[int]]) -> bool:
+    """判断依赖图是否有环（拓扑排序后仍有节点未出队即有环）"""
+    remaining = [len(upstream) for upstream in edges]
+    dependents: Dict[int, List[int]] = {}
+    for i, upstream in enumerate(edges):
+        for j in upstream:
+            dependents.setdefault(j, []).append(i)
+    ready = [i for i, count in enumerate(remaining) if count == 0]
+    visited = 0
+    while ready:
+        i = ready.pop()
+        visited += 1
+        for k in dependents.get(i, []):
+            remaining[k] -= 1
+            if remaining[k] == 0:
+                ready.append(k)
+    return visited < len(edges)
 
 
 class RequirementAgent(BaseAgent):
@@ -70,20 +96,24 @@ class RequirementAgent(BaseAgent):
         Returns:
             包含需求分析结果的字典
         """
-        # 第一步：理解需求
-        understanding = self.think(
-            f"请分析以下用户需求，识别核心功能点：\n{user_input}"
-        )
-        
-        # 第二步：拆解任务
-        subtasks = self.decompose_requirement(user_input)
+        # 第一步：理解需求、拆解任务（带依赖关系），两者互不依赖，同时调用LLM
+        results = self.run_concurrently({
+            "understanding": lambda: self.think(
+                f"请分析以下用户需求，识别核心功能点：\n{user_input}"
+            ),
+            "subtask_graph": lambda: self.decompose_requirement_graph(user_input),
+        })
+        understanding = results["understanding"]
+        subtask_graph = results["subtask_graph"]
+        subtasks = [node["task"] for node in subtask_graph]
         
-        # 第三步：生成需求文档
+        # 第二步：生成需求文档（依赖拆解结果）
         requirement_doc = self.generate_requirement_doc(user_input, subtasks)
         
         return {
             "understanding": understanding,
             "subtasks": subtasks,
+            "subtask_graph": subtask_graph,
             "requirement_doc": requirement_doc,
             "original_input": user_input
         }
@@ -100,6 +130,18 @@ class RequirementAgent(BaseAgent):
         Returns:
             子任务列表
         """
+        return [node["task"] for node in self.decompose_requirement_graph(requirement)]
+    
+    def decompose_requirement_graph(self, requirement: str) -> List[Dict]:
+        """
+        拆解需求为带依赖关系的子任务图
+        
+        Args:
+            requirement: 用户需求
+            
+        Returns:
+            子任务节点列表，每个节点为 {"id": 序号(从1开始), "task": 任务描述, "depends_on": [依赖的序号]}
+        """
         prompt = f"""请将以下需求拆解为具体的开发任务，每个任务应该是：
 1. 具体可执行的
 2. 有明确的输入输出
@@ -107,26 +149,57 @@ class RequirementAgent(BaseAgent):
 
 需求：{requirement}
 
-请以列表形式输出，格式：
-1. 任务1描述
-2. 任务2描述
+请以列表形式输出，被依赖的任务排在前面，并在每行末尾标注它依赖的任务序号（没有依赖写"无"），格式：
+1. 任务1描述（依赖: 无）
+2. 任务2描述（依赖: 1）
 ..."""
         
         response = self.think(prompt)
+        return self.parse_subtask_graph(response) or [{"id": 1, "task": requirement, "depends_on": []}]
+    
+    @staticmethod
+    def parse_subtask_graph(response: str) -> List[Dict]:
+        """
+        从LLM输出中解析子任务及依赖关系
+        
+        依赖按任务编号引用，忽略不存在的编号和自身；依赖成环时只保留指向排在前面的任务的依赖，
+        保证得到的图无环。没有依赖标注的行视为没有依赖
         
-        # 解析响应，提取任务列表
-        lines = response.split('\n')
-        subtasks = []
-        for line in lines:
+        Args:
+            response: LLM输出的任务列表
+            
+        Returns:
+            子任务节点列表，序号按出现顺序重新编为 1..n
+        """
+        entries = []
+        for line in response.split('\n'):
             line = line.strip()
             if line and (line[0].isdigit() or line.startswith('-') or line.startswith('*')):
+                # 记录原编号，依赖标注引用的是这个编号
+                number = re.match(r"\d+", line)
+                depends = []
+                match = _DEPENDS_PATTERN.search(line)
+                if match:
+                    depends = [int(n) for n in re.findall(r"\d+", match.group(1))]
+                    line = line[:match.start()].rstrip()
                 # 移除编号和符号
                 task = line.split('.', 1)[-1].strip()
                 task = task.lstrip('-* ').strip()
                 if task:
-                    subtasks.append(task)
+                    entries.append((int(number.group()) if number else None, task, depends))
         
-        return subtasks if subtasks else [requirement]
+        position = {number: i for i, (number, _, _) in enumerate(entries) if number is not None}
+        edges = [
+            sorted({position[n] for n in depends if n in position and position[n] != i})
+            for i, (_, _, depends) in enumerate(entries)
+        ]
+        if _has_cycle(edges):
+            edges = [[j for j in upstream if j < i] for i, upstream in enumerate(edges)]
+        
+        return [
+            {"id": i + 1, "task": task, "depends_on": [j + 1 for j in edges[i]]}
+            for i, (_, task, _) in enumerate(entries)
+        ]
     
     def generate_requirement_doc(self, requirement: str, subtasks: List[str]) -> str:
         """
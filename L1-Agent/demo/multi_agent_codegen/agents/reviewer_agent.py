@@ -5,10 +5,88 @@
 1. 代码审查：检查代码质量、规范、安全性
 2. 反馈生成：提供具体的改进建议
 3. 质量评估：评估代码的整体质量
+4. 结构化输出：一次调用返回JSON（问题的严重程度、文件、行号、修复建议和评分），
+   按Schema校验，解析失败时只重问一次；评分由问题列表按固定规则计算，结果可复现
 """
 from .base_agent import BaseAgent
 from langchain.tools import Tool
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
+import config
+import json
+
+
+SEVERITIES = ["严重", "中等", "轻微"]
+
+# 结构化审查结果的JSON Schema（写入Prompt，并用于校验LLM输出）
+REVIEW_SCHEMA = {
+    "type": "object",
+    "required": ["issues", "score"],
+    "properties": {
+        "summary": {"type": "string"},
+        "issues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["severity", "description", "fix"],
+                "properties": {
+                    "severity": {"enum": SEVERITIES},
+                    "file": {"type": "string"},
+                    "line": {"type": ["integer", "null"]},
+                    "description": {"type": "string"},
+                    "fix": {"type": "string"},
+                },
+            },
+        },
+        "score": {"type": "integer", "minimum": 0, "maximum": 100},
+    },
+}
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "null": type(None),
+}
+
+
+def validate_schema(value: Any, schema: Dict, path: str = "$") -> List[str]:
+    """
+    按JSON Schema的子集（type、enum、required、properties、items、minimum、maximum）校验数据
+    
+    Args:
+        value: 待校验的数据
+        schema: JSON Schema
+        path: 当前数据的位置（用于错误信息）
+        
+    Returns:
+        错误信息列表，为空表示校验通过
+    """
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} 应为 {schema['enum']} 之一"]
+    
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        # bool是int的子类，不能当作integer
+        if isinstance(value, bool) or not isinstance(value, tuple(_JSON_TYPES[t] for t in types)):
+            return [f"{path} 应为 {'/'.join(types)} 类型"]
+    
+    errors = []
+    if isinstance(value, dict):
+        errors += [f"{path}.{key} 缺失" for key in schema.get("required", []) if key not in value]
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors += validate_schema(value[key], sub_schema, f"{path}.{key}")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += validate_schema(item, schema["items"], f"{path}[{i}]")
+    elif isinstance(value, int):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path} 不能小于 {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path} 不能大于 {schema['maximum']}")
+    
+    return errors
 
 
 class ReviewerAgent(BaseAgent):
@@ -22,8 +100,16 @@ class ReviewerAgent(BaseAgent):
     4. 提供改进建议
     """
     
-    def __init__(self, model_name: str = None):
-        """初始化代码审查Agent"""
+    def __init__(self, model_name: str = None, structured: Optional[bool] = None):
+        """
+        初始化代码审查Agent
+        
+        Args:
+            model_name: 使用的LLM模型名称
+            structured: 是否使用结构化审查（一次调用返回JSON，默认 Config.STRUCTURED_REVIEW）
+        """
+        self.structured = config.Config.STRUCTURED_REVIEW if structured is None else structured
+        
         system_message = """你是一位严格的代码审查专家，擅长：
 1. 发现代码中的bug和潜在问题
 2. 检查代码是否符合编码规范
@@ -67,17 +153,21 @@ class ReviewerAgent(BaseAgent):
             model_name=model_name
         )
     
-    def review_code(self, code: str, requirements: Optional[str] = None) -> Dict:
+    def review_code(self, code: str, requirements: Optional[str] = None, file_path: Optional[str] = None) -> Dict:
         """
         审查代码
         
         Args:
             code: 要审查的代码
             requirements: 需求文档（可选）
+            file_path: 代码文件路径（结构化审查时写入每个问题的 file 字段）
             
         Returns:
             包含审查结果的字典
         """
+        if self.structured:
+            return self._structured_review(code, requirements, file_path)
+        
         # 全面审查
         review_result = self._comprehensive_review(code, requirements)
         
@@ -107,7 +197,7 @@ class ReviewerAgent(BaseAgent):
 {code}
 ```
 
-{f"需求文档：\n{requirements}" if requirements else ""}
+{self._requirements_section(requirements)}
 
 请从以下方面审查：
 1. **正确性**：逻辑是否正确，是否有bug
@@ -123,6 +213,117 @@ class ReviewerAgent(BaseAgent):
         
         return self.think(prompt)
     
+    @staticmethod
+    def _requirements_section(requirements: Optional[str]) -> str:
+        """Prompt中的需求文档部分（没有需求文档时为空）"""
+        return f"需求文档：\n{requirements}" if requirements else ""
+    
+    def _structured_review(self, code: str, requirements: Optional[str] = None, file_path: Optional[str] = None) -> Dict:
+        """
+        结构化审查：一次调用同时得到问题列表和修复建议
+        
+        输出按 REVIEW_SCHEMA 校验；JSON解析或校验失败时把错误和原输出发回重问一次（不再重复发送代码），
+        仍然失败则退回关键词解析，不再调用LLM
+        """
+        file_name = file_path or "main.py"
+        # 带行号的代码，便于LLM给出准确的行号
+        numbered_code = "\n".join(f"{i}|{line}" for i, line in enumerate(code.split("\n"), 1))
+        schema_text = json.dumps(REVIEW_SCHEMA, ensure_ascii=False, separators=(",", ":"))
+        
+        prompt = f"""请对以下代码进行全面审查，并以JSON格式输出结果：
+
+文件：{file_name}
+代码（每行开头为 行号|）：
+```python
+{numbered_code}
+```
+
+{self._requirements_section(requirements)}
+
+请从正确性、编码规范、代码质量、性能、安全性、文档、测试、需求符合度等方面审查。
+每个问题给出严重程度（严重、中等、轻微）、所在文件和行号（无法定位到行时为null）、问题描述和具体的修复建议，
+最后给出0-100的质量评分。
+
+只输出一个符合以下JSON Schema的JSON对象，不要包含其他说明文字：
+{schema_text}"""
+        
+        response = self.think(prompt)
+        data, error = self._parse_review(response)
+        
+        if error:
+            # 只在解析失败时重问一次
+            repair_prompt = f"""你上一次输出的审查结果无法解析：{error}
+
+上一次的输出：
+{response}
+
+请修正格式，只输出一个符合以下JSON Schema的JSON对象，不要包含其他说明文字：
+{schema_text}"""
+            response = self.think(repair_prompt)
+            data, error = self._parse_review(response)
+        
+        if error:
+            issues = self._extract_issues(response)
+            return {
+                "review_result": response,
+                "issues": issues,
+                "suggestions": response,
+                "score": self._calculate_score(issues),
+                # 没有解析出结构化结果，也就没有LLM给出的评分
+                "model_score": None,
+                "code": code
+            }
+        
+        issues = [
+            {
+                "severity": issue["severity"],
+                "description": issue["description"],
+                "file": issue.get("file") or file_name,
+                "line": issue.get("line"),
+                "fix": issue["fix"]
+            }
+            for issue in data["issues"]
+        ]
+        suggestions = "\n".join(
+            f"{i + 1}. [{issue['severity']}] {issue['file']}"
+            f"{':' + str(issue['line']) if issue['line'] else ''} {issue['description']}\n   修复建议：{issue['fix']}"
+            for i, issue in enumerate(issues)
+        )
+        
+        return {
+            "review_result": json.dumps(data, ensure_ascii=False, indent=2),
+            "issues": issues,
+            "suggestions": suggestions,
+            # 评分按问题列表计算，同样的问题得到同样的分数；LLM给出的评分只作参考
+            "score": self._calculate_score(issues),
+            "model_score": data["score"],
+            "code": code
+        }
+    
+    @staticmethod
+    def _parse_review(response: str):
+        """
+        解析结构化审查输出
+        
+        Returns:
+            (审查结果, 错误信息)，成功时错误信息为None
+        """
+        text = response.strip()
+        # 去掉可能的markdown代码块标记和前后的说明文字
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            return None, "输出中没有JSON对象"
+        
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError as e:
+            return None, f"JSON解析失败: {e}"
+        
+        errors = validate_schema(data, REVIEW_SCHEMA)
+        if errors:
+            return None, "不符合Schema: " + "；".join(errors[:5])
+        return data, None
+    
     def _extract_issues(self, review_result: str) -> List[Dict]:
         """从审查结果中提取问题列表"""
         # 简单的解析逻辑，实际可以使用更复杂的NLP方法
@@ -176,7 +377,7 @@ class ReviewerAgent(BaseAgent):
         return self.think(prompt)
     
     def _calculate_score(self, issues: List[Dict]) -> int:
-        """计算代码质量评分（0-100）"""
+        """计算代码质量评分（0-100），只取决于各问题的严重程度"""
         if not issues:
             return 100
         
@@ -71,13 +71,20 @@ class TesterAgent(BaseAgent):
             model_name=model_name
         )
     
-    def generate_tests(self, code: str, requirements: Optional[str] = None) -> Dict:
+    def generate_tests(
+        self,
+        code: str,
+        requirements: Optional[str] = None,
+        test_file_path: Optional[str] = None
+    ) -> Dict:
         """
         生成测试代码
         
         Args:
             code: 要测试的代码
             requirements: 需求文档（可选）
+            test_file_path: 测试文件路径（相对工作目录，默认 test_generated.py）；
+                同时为多个文件生成测试时应各不相同
             
         Returns:
             包含测试代码和测试计划的字典
@@ -89,7 +96,8 @@ class TesterAgent(BaseAgent):
         test_code = self._generate_test_code(code, test_cases)
         
         # 保存测试文件
-        test_file_path = os.path.join(self.work_dir, "test_generated.py")
+        test_file_path = os.path.join(self.work_dir, test_file_path or "test_generated.py")
+        os.makedirs(os.path.dirname(test_file_path), exist_ok=True)
         with open(test_file_path, 'w', encoding='utf-8') as f:
             f.write(test_code)
         
@@ -99,6 +107,11 @@ class TesterAgent(BaseAgent):
             "test_file_path": test_file_path
         }
     
+    @staticmethod
+    def _requirements_section(requirements: Optional[str]) -> str:
+        """Prompt中的需求文档部分（没有需求文档时为空）"""
+        return f"需求文档：\n{requirements}" if requirements else ""
+    
     def _design_test_cases(self, code: str, requirements: Optional[str] = None) -> str:
         """设计测试用例"""
         prompt = f"""请为以下代码设计全面的测试用例：
@@ -108,7 +121,7 @@ class TesterAgent(BaseAgent):
 {code}
 ```
 
-{f"需求文档：\n{requirements}" if requirements else ""}
+{self._requirements_section(requirements)}
 
 请设计以下类型的测试用例：
 1. **正常情况测试**：测试正常的功能流程
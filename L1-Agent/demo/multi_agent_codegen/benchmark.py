@@ -0,0 +1,383 @@
+"""
+性能评估：用固定延迟的模拟LLM测量工作流各阶段的耗时
+
+核心知识点：
+1. 模拟LLM：每次调用固定等待一段时间后返回，排除网络和模型的随机波动，
+   阶段耗时只取决于调用次数和调度方式
+2. 并发加速比：N 个互不依赖的调用用 W 个线程执行，耗时约为 ⌈N/W⌉ 次调用的延迟
+3. 故障隔离：单个子任务失败不影响其他子任务，结果顺序与子任务顺序一致
+4. 关键路径：子任务有依赖时，并发数足够的情况下耗时约为 关键路径长度 × 单次调用延迟
+5. 流水线：逐阶段执行时总耗时为各阶段最大耗时之和，流式执行时接近最慢的单文件链路
+6. Agent内部并发：需求分析 3次串行调用 → 2级，架构设计 4次串行调用 → 1级
+7. 结构化审查：审查+建议两次调用（各发送一次完整代码）合并为一次JSON输出的调用
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from math import ceil
+from typing import Callable, List, Optional, Sequence, Union
+
+from langchain_core.messages import AIMessage
+
+# 模拟LLM不会发出请求，这里只是让ChatOpenAI能够完成初始化
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import config
+from coordinator import MultiAgentCoordinator, critical_path_length
+
+# 模拟LLM返回的结构化审查结果
+FAKE_REVIEW = {
+    "summary": "函数缺少文档字符串和类型提示",
+    "issues": [
+        {"severity": "中等", "file": "module.py", "line": 2, "description": "函数缺少文档字符串", "fix": "补充文档字符串"},
+        {"severity": "轻微", "file": "module.py", "line": 2, "description": "缺少返回值类型提示", "fix": "添加 -> None"},
+    ],
+    "score": 88,
+}
+
+
+class FakeLLM:
+    """固定延迟的模拟LLM，接口与ChatOpenAI.invoke一致"""
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[str], float]] = 0.5,
+        fail_on: Optional[str] = None,
+        num_subtasks: int = 4
+    ):
+        """
+        初始化模拟LLM
+
+        Args:
+            latency: 每次调用的延迟（秒），也可以是根据Prompt返回延迟的函数
+            fail_on: Prompt中包含该字符串时抛出异常（用于验证故障隔离）
+            num_subtasks: 需求拆解时返回的子任务数量（互不依赖）
+        """
+        self.latency = latency
+        self.fail_on = fail_on
+        self.num_subtasks = num_subtasks
+        self.calls = 0
+        self.prompt_chars = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str) -> AIMessage:
+        """模拟一次LLM调用"""
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency(prompt) if callable(self.latency) else self.latency)
+            if self.fail_on and self.fail_on in prompt:
+                raise RuntimeError(f"模拟LLM调用失败: {self.fail_on}")
+            return AIMessage(content=self._response(prompt))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _response(self, prompt: str) -> str:
+        """按Prompt内容返回占位回答：需求拆解返回子任务列表，代码生成返回带任务描述注释的代码"""
+        if "拆解为具体的开发任务" in prompt:
+            return "\n".join(f"{i + 1}. 实现功能模块 {i + 1}（依赖: 无）" for i in range(self.num_subtasks))
+        if "生成完整的代码" in prompt or "改进后的代码" in prompt:
+            task = re.search(r"任务描述：(.*)", prompt)
+            return f"```python\n# {task.group(1) if task else ''}\ndef handler():\n    return None\n```"
+        if "符合以下JSON Schema" in prompt:
+            return json.dumps(FAKE_REVIEW, ensure_ascii=False)
+        return "1. 模拟回答"
+
+
+def install_fake_llm(coordinator: MultiAgentCoordinator, llm: FakeLLM):
+    """把协调器中所有Agent的LLM替换为模拟LLM"""
+    for agent in (coordinator.requirement_agent, coordinator.architect_agent, coordinator.coder_agent,
+                  coordinator.reviewer_agent, coordinator.tester_agent):
+        agent.llm = llm
+
+
+def benchmark_codegen(num_subtasks: int = 8, latency: float = 0.5, worker_counts: Sequence[int] = (1, 2, 4, 8)):
+    """
+    比较不同并发数下代码生成阶段的耗时，并验证故障隔离
+
+    Args:
+        num_subtasks: 子任务数量
+        latency: 模拟LLM每次调用的延迟（秒）
+        worker_counts: 待评估的并发数
+    """
+    print("=" * 60)
+    print("代码生成阶段并发评估")
+    print("=" * 60)
+
+    work_dir = tempfile.mkdtemp(prefix="codegen_bench_")
+    try:
+        coordinator = MultiAgentCoordinator(work_dir=work_dir)
+        requirements = {"subtasks": [f"实现功能模块 {i + 1}" for i in range(num_subtasks)]}
+        architecture = {"architecture": "分层架构", "module_interfaces": "接口定义", "tech_stack": "Python"}
+
+        rows: List[tuple] = []
+        for workers in worker_counts:
+            llm = FakeLLM(latency)
+            install_fake_llm(coordinator, llm)
+            coordinator.codegen_workers = workers
+            started = time.perf_counter()
+            results = coordinator._generate_code(requirements, architecture)
+            elapsed = time.perf_counter() - started
+            assert len(results) == num_subtasks
+            rows.append((workers, elapsed, ceil(num_subtasks / workers) * latency, llm.peak_in_flight))
+
+        # 故障隔离：第3个子任务失败，其余结果仍按子任务顺序返回
+        install_fake_llm(coordinator, FakeLLM(latency, fail_on=requirements["subtasks"][2]))
+        coordinator.codegen_workers = max(worker_counts)
+        results = coordinator._generate_code(requirements, architecture)
+        failed = coordinator.task_state["failed_subtasks"]
+
+        print(f"\n子任务: {num_subtasks}，单次调用延迟: {latency * 1000:.0f}ms")
+        print(f"\n{'并发数':>6} {'耗时(s)':>9} {'理论(s)':>9} {'加速比':>7} {'峰值并发':>8}")
+        for workers, elapsed, expected, peak in rows:
+            print(f"{workers:>6} {elapsed:>9.2f} {expected:>9.2f} {rows[0][1] / elapsed:>7.2f} {peak:>8}")
+        print(f"\n故障隔离: 成功 {len(results)} 个，失败 {len(failed)} 个（子任务 {[item['index'] + 1 for item in failed]}）")
+        print(f"结果文件顺序: {[result['file_path'] for result in results]}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_dag(latency: float = 0.5, workers: int = 8):
+    """
+    按依赖图调度子任务：一条4级依赖链（数据模型→存储层→业务逻辑→命令行界面）加4个独立子任务
+
+    Args:
+        latency: 模拟LLM每次调用的延迟（秒）
+        workers: 并发数
+    """
+    print("=" * 60)
+    print("依赖图调度评估")
+    print("=" * 60)
+
+    graph = [
+        {"id": 1, "task": "实现数据模型", "depends_on": []},
+        {"id": 2, "task": "实现存储层", "depends_on": [1]},
+        {"id": 3, "task": "实现业务逻辑", "depends_on": [2]},
+        {"id": 4, "task": "实现命令行界面入口", "depends_on": [3]},
+        {"id": 5, "task": "实现日志工具", "depends_on": []},
+        {"id": 6, "task": "实现配置加载", "depends_on": []},
+        {"id": 7, "task": "实现输入校验", "depends_on": [1]},
+        {"id": 8, "task": "实现导出功能", "depends_on": [2]},
+    ]
+    requirements = {"subtasks": [node["task"] for node in graph], "subtask_graph": graph}
+    architecture = {"architecture": "分层架构", "module_interfaces": "接口定义", "tech_stack": "Python"}
+
+    work_dir = tempfile.mkdtemp(prefix="codegen_bench_")
+    try:
+        coordinator = MultiAgentCoordinator(work_dir=work_dir)
+
+        rows = []
+        for label, worker_count in (("逐个生成", 1), ("依赖图调度", workers)):
+            install_fake_llm(coordinator, FakeLLM(latency))
+            coordinator.coder_agent.task_history.clear()
+            coordinator.codegen_workers = worker_count
+            started = time.perf_counter()
+            results = coordinator._generate_code(requirements, architecture)
+            elapsed = time.perf_counter() - started
+            # 依赖的上游代码写入了下游Prompt的子任务数
+            with_upstream = sum("已完成的依赖模块" in item["task"] for item in coordinator.coder_agent.task_history)
+            rows.append((label, worker_count, elapsed, len(results), with_upstream))
+
+        # 存储层失败：依赖它的子任务（业务逻辑、命令行界面、导出功能）跳过，其他子任务正常生成
+        install_fake_llm(coordinator, FakeLLM(latency, fail_on="任务描述：实现存储层"))
+        results = coordinator._generate_code(requirements, architecture)
+        failed = coordinator.task_state["failed_subtasks"]
+
+        print(f"\n子任务: {len(graph)}，关键路径长度: {critical_path_length(graph)}，单次调用延迟: {latency * 1000:.0f}ms")
+        print(f"\n{'方式':>8} {'并发数':>6} {'耗时(s)':>9} {'成功数':>6} {'带上游代码':>10}")
+        for label, worker_count, elapsed, succeeded, with_upstream in rows:
+            print(f"{label:>8} {worker_count:>6} {elapsed:>9.2f} {succeeded:>6} {with_upstream:>10}")
+        print(f"\n故障隔离: 成功 {len(results)} 个，失败/跳过 {[item['index'] + 1 for item in failed]}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_pipeline(gen_latencies: Sequence[float] = (0.2, 0.4, 0.6, 0.8),
+                       review_latencies: Sequence[float] = (0.4, 0.3, 0.2, 0.1),
+                       test_latency: float = 0.1, workers: int = 4):
+    """
+    比较逐阶段执行和流式流水线的完整工作流耗时
+
+    第 k 个文件的生成、每次审查调用、每次测试调用分别耗时 gen_latencies[k]、review_latencies[k]、test_latency，
+    生成快的文件审查慢、生成慢的文件审查快；需求分析和架构设计不计延迟。
+    每个文件测试生成2次调用，审查1次调用（结构化审查）或2次调用，不执行生成的测试。
+
+    Args:
+        gen_latencies: 各文件代码生成的延迟（秒）
+        review_latencies: 各文件每次审查调用的延迟（秒）
+        test_latency: 每次测试生成调用的延迟（秒）
+        workers: 各阶段并发数
+    """
+    print("=" * 60)
+    print("流式流水线评估")
+    print("=" * 60)
+
+    num_files = len(gen_latencies)
+
+    def latency(prompt: str) -> float:
+        module = re.search(r"功能模块 (\d+)", prompt)
+        if not module:
+            return 0.0
+        k = int(module.group(1)) - 1
+        # 按各Agent任务Prompt的开头区分调用（系统消息中也可能出现"测试"、"改进建议"等词）
+        if "生成完整的代码" in prompt:
+            return gen_latencies[k]
+        if "请对以下代码进行全面审查" in prompt or "基于以下发现的问题" in prompt:
+            return review_latencies[k]
+        if "设计全面的测试用例" in prompt or "生成完整的pytest测试代码" in prompt:
+            return test_latency
+        return 0.0
+
+    review_calls = 1 if config.Config.STRUCTURED_REVIEW else 2
+    barrier = max(gen_latencies) + max(review_calls * r for r in review_latencies) + 2 * test_latency
+    chain = max(g + max(review_calls * r, 2 * test_latency) for g, r in zip(gen_latencies, review_latencies))
+
+    work_dir = tempfile.mkdtemp(prefix="codegen_bench_")
+    execution = config.Config.ENABLE_CODE_EXECUTION
+    # 只评估调度，不执行生成的测试（pytest进程的耗时与调度方式无关）
+    config.Config.ENABLE_CODE_EXECUTION = False
+    try:
+        rows, outputs = [], []
+        for label, streaming in (("逐阶段", False), ("流式", True)):
+            coordinator = MultiAgentCoordinator(workers, workers, workers, streaming=streaming, work_dir=work_dir)
+            install_fake_llm(coordinator, FakeLLM(latency, num_subtasks=num_files))
+            started = time.perf_counter()
+            result = coordinator.execute_workflow("实现一个示例应用", max_iterations=0)
+            rows.append((label, time.perf_counter() - started))
+            outputs.append(result)
+
+        same = all(
+            [item["file_path"] for item in outputs[0][key]] == [item["file_path"] for item in outputs[1][key]]
+            for key in ("code_files", "review_results", "test_results")
+        ) and outputs[0].keys() == outputs[1].keys()
+
+        print(f"\n文件: {num_files}，并发数: {workers}")
+        print(f"理论耗时 逐阶段(各阶段最大耗时之和): {barrier:.2f}s，流式(最慢单文件链路): {chain:.2f}s")
+        print(f"\n{'方式':>6} {'耗时(s)':>9}")
+        for label, elapsed in rows:
+            print(f"{label:>6} {elapsed:>9.2f}")
+        print(f"\n两种方式结果结构一致: {same}")
+    finally:
+        config.Config.ENABLE_CODE_EXECUTION = execution
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_planning(latency: float = 0.5):
+    """
+    比较需求分析、架构设计阶段串行调用与并发调用（跳过未使用的需求分析调用）的耗时
+
+    Args:
+        latency: 模拟LLM每次调用的延迟（秒）
+    """
+    print("=" * 60)
+    print("需求分析与架构设计阶段评估")
+    print("=" * 60)
+
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="codegen_bench_")
+    try:
+        for label, parallel, include_analysis in (("串行", False, True), ("并发", True, False)):
+            coordinator = MultiAgentCoordinator(work_dir=work_dir)
+            llm = FakeLLM(latency)
+            install_fake_llm(coordinator, llm)
+            coordinator.requirement_agent.parallel_calls = parallel
+            coordinator.architect_agent.parallel_calls = parallel
+            coordinator.architect_agent.include_analysis = include_analysis
+
+            started = time.perf_counter()
+            requirements = coordinator._analyze_requirements("实现一个示例应用")
+            analyzed = time.perf_counter()
+            coordinator._design_architecture(requirements)
+            designed = time.perf_counter()
+            rows.append((label, analyzed - started, designed - analyzed, llm.calls))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n单次调用延迟: {latency * 1000:.0f}ms")
+    print(f"\n{'方式':>4} {'需求分析(s)':>11} {'架构设计(s)':>11} {'LLM调用数':>9}")
+    for label, analyze_seconds, design_seconds, calls in rows:
+        print(f"{label:>4} {analyze_seconds:>11.2f} {design_seconds:>11.2f} {calls:>9}")
+
+
+class MalformedOnceLLM(FakeLLM):
+    """第一次结构化审查返回被截断的JSON，用于验证重问"""
+
+    def _response(self, prompt: str) -> str:
+        response = super()._response(prompt)
+        if "符合以下JSON Schema" in prompt and "无法解析" not in prompt:
+            return response[:len(response) // 2]
+        return response
+
+
+def benchmark_review(num_files: int = 4, latency: float = 0.5, code_lines: int = 200):
+    """
+    比较两次调用的审查与结构化审查的LLM调用数、输入字符数和耗时，并验证评分可复现、解析失败时重问一次
+
+    Args:
+        num_files: 审查的文件数
+        latency: 模拟LLM每次调用的延迟（秒）
+        code_lines: 每个文件的代码行数
+    """
+    from agents.reviewer_agent import ReviewerAgent
+
+    print("=" * 60)
+    print("结构化代码审查评估")
+    print("=" * 60)
+
+    code = "\n".join(f"def handler_{i}(value):\n    return value + {i}" for i in range(code_lines // 2))
+
+    rows, scores = [], {}
+    for label, structured in (("审查+建议", False), ("结构化", True)):
+        reviewer = ReviewerAgent(structured=structured)
+        llm = FakeLLM(latency)
+        reviewer.llm = llm
+        started = time.perf_counter()
+        reviews = [reviewer.review_code(code, file_path=f"module_{i + 1}.py") for i in range(num_files)]
+        elapsed = time.perf_counter() - started
+        scores[label] = {review["score"] for review in reviews}
+        rows.append((label, llm.calls / num_files, llm.prompt_chars / num_files, elapsed / num_files,
+                     len(reviews[0]["issues"])))
+
+    reviewer = ReviewerAgent(structured=True)
+    reviewer.llm = MalformedOnceLLM(latency)
+    repaired = reviewer.review_code(code, file_path="module.py")
+
+    print(f"\n文件: {num_files}，代码行数: {code_lines}，单次调用延迟: {latency * 1000:.0f}ms")
+    print(f"\n{'方式':>6} {'调用数/文件':>10} {'输入字符/文件':>12} {'耗时/文件(s)':>12} {'问题数':>6}")
+    for label, calls, chars, seconds, issues in rows:
+        print(f"{label:>6} {calls:>10.1f} {chars:>12.0f} {seconds:>12.2f} {issues:>6}")
+    print(f"\n结构化审查评分: {sorted(scores['结构化'])}（LLM给出 {FAKE_REVIEW['score']}，按问题严重程度计算）")
+    print(f"JSON被截断时: 调用 {reviewer.llm.calls} 次，重问后得到 {len(repaired['issues'])} 个问题，"
+          f"首个问题位于 {repaired['issues'][0]['file']}:{repaired['issues'][0]['line']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多Agent工作流性能评估（模拟LLM）")
+    parser.add_argument("--subtasks", type=int, default=8, help="子任务数量")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟LLM单次调用延迟（秒）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="待评估的并发数")
+    parser.add_argument("--mode", choices=["codegen", "dag", "pipeline", "planning", "review", "all"], default="all", help="评估项目")
+    args = parser.parse_args()
+
+    if args.mode in ("codegen", "all"):
+        benchmark_codegen(args.subtasks, args.latency, args.workers)
+    if args.mode in ("dag", "all"):
+        benchmark_dag(args.latency, max(args.workers))
+    if args.mode in ("pipeline", "all"):
+        benchmark_pipeline()
+    if args.mode in ("planning", "all"):
+        benchmark_planning(args.latency)
+    if args.mode in ("review", "all"):
+        benchmark_review(latency=args.latency)
@@ -27,6 +27,19 @@ class Config:
     ENABLE_CODE_EXECUTION = True  # 是否启用代码执行
     ENABLE_HUMAN_INPUT = False  # 是否启用人工干预
     
+    # 并发配置：依赖已完成的子任务同时调用LLM（1表示逐个生成）
+    CODEGEN_WORKERS = int(os.getenv("CODEGEN_WORKERS", "4"))
+    REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", "4"))  # 同时审查的文件数
+    TEST_WORKERS = int(os.getenv("TEST_WORKERS", "4"))  # 同时生成测试的文件数
+    # 流式流水线：每个文件生成后立即审查和生成测试（关闭则各阶段全部完成后才进入下一阶段）
+    STREAMING_PIPELINE = os.getenv("STREAMING_PIPELINE", "1") == "1"
+    # Agent内部互不依赖的LLM调用同时执行（如技术选型与模块接口定义）
+    AGENT_PARALLEL_CALLS = os.getenv("AGENT_PARALLEL_CALLS", "1") == "1"
+    # 架构设计前的需求分析调用：结果不被后续步骤使用，默认跳过
+    ARCHITECT_ANALYSIS = os.getenv("ARCHITECT_ANALYSIS", "0") == "1"
+    # 结构化代码审查：一次调用返回JSON（问题、修复建议、评分），关闭则使用审查+建议两次调用
+    STRUCTURED_REVIEW = os.getenv("STRUCTURED_REVIEW", "1") == "1"
+    
     @classmethod
     def validate(cls):
         """验证配置是否完整"""
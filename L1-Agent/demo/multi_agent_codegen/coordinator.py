@@ -6,8 +6,13 @@
 2. 工作流管理：管理任务执行流程
 3. 状态管理：跟踪任务状态和Agent间的通信
 4. 迭代优化：根据反馈进行迭代改进
+5. 依赖图调度：依赖都已完成的子任务进入就绪队列，用线程池同时调用LLM，
+   上游代码写入下游Prompt；代码生成阶段耗时由关键路径长度而不是子任务数量决定
+6. 流式流水线：每个文件生成后立即进入各自的审查和测试任务，不等其他文件，
+   各阶段线程池限制并发；总耗时接近最慢的单文件链路，而不是各阶段最大耗时之和
 """
-from typing import Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 from agents.requirement_agent import RequirementAgent
 from agents.architect_agent import ArchitectAgent
 from agents.coder_agent import CoderAgent
@@ -19,6 +24,28 @@ import json
 from datetime import datetime
 
 
+def critical_path_length(subtask_graph: List[Dict]) -> int:
+    """
+    计算子任务依赖图的关键路径长度（最长依赖链上的子任务数）
+    
+    Args:
+        subtask_graph: 子任务节点列表（见 RequirementAgent.decompose_requirement_graph）
+        
+    Returns:
+        关键路径长度；并发数足够时代码生成阶段约耗时 关键路径长度 × 单次调用延迟
+    """
+    depends = {node["id"]: node["depends_on"] for node in subtask_graph}
+    depth: Dict[int, int] = {}
+    
+    def visit(node_id: int) -> int:
+        if node_id not in depth:
+            depth[node_id] = 0  # 依赖成环时不再递归
+            depth[node_id] = 1 + max((visit(up) for up in depends[node_id] if up in depends), default=0)
+        return depth[node_id]
+    
+    return max((visit(node_id) for node_id in depends), default=0)
+
+
 class MultiAgentCoordinator:
     """
     多Agent协调器
@@ -30,14 +57,37 @@ class MultiAgentCoordinator:
     4. 处理Agent间的通信
     """
     
-    def __init__(self):
-        """初始化协调器"""
+    def __init__(
+        self,
+        codegen_workers: Optional[int] = None,
+        review_workers: Optional[int] = None,
+        test_workers: Optional[int] = None,
+        streaming: Optional[bool] = None,
+        work_dir: Optional[str] = None
+    ):
+        """
+        初始化协调器
+        
+        Args:
+            codegen_workers: 代码生成的并发数（默认 Config.CODEGEN_WORKERS，1表示逐个生成）
+            review_workers: 代码审查的并发数（默认 Config.REVIEW_WORKERS）
+            test_workers: 测试生成的并发数（默认 Config.TEST_WORKERS）
+            streaming: 是否使用流式流水线（默认 Config.STREAMING_PIPELINE），
+                关闭时各阶段全部完成后才进入下一阶段
+            work_dir: 生成代码、测试和状态文件的目录（默认 Config.WORK_DIR）
+        """
+        self.codegen_workers = codegen_workers or config.Config.CODEGEN_WORKERS
+        self.review_workers = review_workers or config.Config.REVIEW_WORKERS
+        self.test_workers = test_workers or config.Config.TEST_WORKERS
+        self.streaming = config.Config.STREAMING_PIPELINE if streaming is None else streaming
+        self.work_dir = work_dir or config.Config.WORK_DIR
+        
         # 创建各个Agent
         self.requirement_agent = RequirementAgent()
         self.architect_agent = ArchitectAgent()
-        self.coder_agent = CoderAgent(work_dir=config.Config.WORK_DIR)
+        self.coder_agent = CoderAgent(work_dir=self.work_dir)
         self.reviewer_agent = ReviewerAgent()
-        self.tester_agent = TesterAgent(work_dir=config.Config.WORK_DIR)
+        self.tester_agent = TesterAgent(work_dir=self.work_dir)
         
         # 任务状态
         self.task_state = {
@@ -46,6 +96,7 @@ class MultiAgentCoordinator:
             "requirements": None,
             "architecture": None,
             "code_files": [],
+            "failed_subtasks": [],
             "review_results": [],
             "test_results": [],
             "iterations": 0
@@ -89,22 +140,29 @@ class MultiAgentCoordinator:
             architecture = self._design_architecture(requirements)
             self.task_state["architecture"] = architecture
             
-            # 步骤3: 代码生成
-            print("\n💻 步骤3: 代码生成")
-            print("-" * 60)
-            code_results = self._generate_code(requirements, architecture)
-            self.task_state["code_files"] = code_results
+            if self.streaming:
+                # 步骤3-5: 代码生成、审查、测试流式执行
+                print("\n💻 步骤3-5: 代码生成 → 代码审查 / 测试生成（流式）")
+                print("-" * 60)
+                code_results, review_results, test_results = self._run_pipeline(requirements, architecture)
+            else:
+                # 步骤3: 代码生成
+                print("\n💻 步骤3: 代码生成")
+                print("-" * 60)
+                code_results = self._generate_code(requirements, architecture)
+                
+                # 步骤4: 代码审查
+                print("\n🔍 步骤4: 代码审查")
+                print("-" * 60)
+                review_results = self._review_code(code_results)
+                
+                # 步骤5: 测试生成
+                print("\n🧪 步骤5: 测试生成")
+                print("-" * 60)
+                test_results = self._generate_tests(code_results, requirements)
             
-            # 步骤4: 代码审查
-            print("\n🔍 步骤4: 代码审查")
-            print("-" * 60)
-            review_results = self._review_code(code_results)
+            self.task_state["code_files"] = code_results
             self.task_state["review_results"] = review_results
-            
-            # 步骤5: 测试生成
-            print("\n🧪 步骤5: 测试生成")
-            print("-" * 60)
-            test_results = self._generate_tests(code_results, requirements)
             self.task_state["test_results"] = test_results
             
             # 步骤6: 迭代优化（如果需要）
@@ -132,6 +190,8 @@ class MultiAgentCoordinator:
                 # 重新审查和测试
                 review_results = self._review_code(code_results)
                 test_results = self._generate_tests(code_results, requirements)
+                self.task_state["review_results"] = review_results
+                self.task_state["test_results"] = test_results
             
             self.task_state["iterations"] = iteration_count
             self.task_state["status"] = "completed"
@@ -191,88 +251,231 @@ class MultiAgentCoordinator:
         
         return result
     
-    def _generate_code(self, requirements: Dict, architecture: Dict) -> List[Dict]:
-        """代码生成阶段"""
+    def _run_pipeline(self, requirements: Dict, architecture: Dict) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        流式流水线：每个文件生成后立即提交各自的审查任务和测试任务
+        
+        审查和测试互不依赖，分别在各自的线程池中执行（并发数为 review_workers、test_workers），
+        单个文件的链路为 生成 → max(审查, 测试)。结果与逐阶段执行时一致，按子任务顺序对齐；
+        单个文件的审查或测试失败只记录在该文件的结果中（带 error 字段），不影响其他文件
+        
+        Returns:
+            (代码生成结果, 审查结果, 测试结果)
+        """
+        # 子任务序号 -> (代码生成结果, 审查/测试任务的Future)
+        reviews: Dict[int, Tuple[Dict, Future]] = {}
+        tests: Dict[int, Tuple[Dict, Future]] = {}
+        
+        with ThreadPoolExecutor(max_workers=self.review_workers) as review_pool, \
+                ThreadPoolExecutor(max_workers=self.test_workers) as test_pool:
+            def on_generated(i: int, code_result: Dict):
+                # 第一个文件生成后审查和测试就已开始
+                if not tests:
+                    self.task_state["status"] = "testing"
+                    self.task_state["current_step"] = "test_generation"
+                reviews[i] = (code_result, review_pool.submit(self._review_file, code_result))
+                tests[i] = (code_result, test_pool.submit(self._test_file, code_result, requirements))
+            
+            code_results = self._generate_code(requirements, architecture, on_generated)
+            # 生成结果只包含成功的子任务，按子任务顺序排列，与 sorted(reviews) 一一对应
+            review_results = self._collect_results([reviews[i] for i in sorted(reviews)], "审查")
+            test_results = self._collect_results([tests[i] for i in sorted(tests)], "测试")
+        
+        return code_results, review_results, test_results
+    
+    def _generate_code(
+        self,
+        requirements: Dict,
+        architecture: Dict,
+        on_generated: Optional[Callable[[int, Dict], None]] = None
+    ) -> List[Dict]:
+        """
+        代码生成阶段
+        
+        按子任务依赖图调度：依赖都已完成的子任务立即提交到线程池并发生成，
+        上游子任务的代码写入下游子任务的Prompt。结果按子任务顺序返回；
+        失败的子任务及其下游子任务只记录到 task_state["failed_subtasks"]，不影响其他子任务
+        
+        Args:
+            requirements: 需求分析结果
+            architecture: 架构设计结果
+            on_generated: 每个子任务生成成功后的回调，参数为 (子任务序号, 生成结果)
+        """
         self.task_state["status"] = "coding"
         self.task_state["current_step"] = "code_generation"
         
-        code_results = []
+        subtasks = requirements["subtasks"]
+        # 没有依赖图时（如外部直接传入子任务列表）视为互不依赖
+        graph = requirements.get("subtask_graph") or [
+            {"id": i + 1, "task": task, "depends_on": []} for i, task in enumerate(subtasks)
+        ]
+        index_of = {node["id"]: i for i, node in enumerate(graph)}
+        upstream = [[index_of[up] for up in node["depends_on"] if up in index_of] for node in graph]
+        downstream: List[List[int]] = [[] for _ in graph]
+        for i, ups in enumerate(upstream):
+            for j in ups:
+                downstream[j].append(i)
         
-        # 为每个子任务生成代码
-        for i, subtask in enumerate(requirements["subtasks"], 1):
-            print(f"\n  生成代码 {i}/{len(requirements['subtasks'])}: {subtask[:50]}...")
-            
-            result = self.coder_agent.generate_code(
-                task=subtask,
+        # 提前分配文件路径，避免并发生成的多个子任务写同一个文件
+        file_paths = self.coder_agent.assign_file_paths([node["task"] for node in graph])
+        workers = max(1, min(self.codegen_workers, len(graph)))
+        print(f"  共 {len(graph)} 个子任务，关键路径长度: {critical_path_length(graph)}，并发数: {workers}")
+        
+        results: List[Optional[Dict]] = [None] * len(graph)
+        failed_subtasks = []
+        remaining = [len(ups) for ups in upstream]
+        
+        def generate(i: int) -> Dict:
+            return self.coder_agent.generate_code(
+                task=graph[i]["task"],
                 architecture=architecture["architecture"],
                 module_interface=architecture["module_interfaces"],
-                tech_stack=architecture["tech_stack"]
+                tech_stack=architecture["tech_stack"],
+                file_path=file_paths[i],
+                dependencies=[results[j] for j in upstream[i]]
             )
-            
-            code_results.append(result)
-            print(f"  ✅ 代码已保存到: {result['file_path']}")
+        
+        def skip_downstream(i: int):
+            """上游失败时，下游子任务不再生成，逐级记录为失败"""
+            for k in downstream[i]:
+                if remaining[k] > 0:
+                    remaining[k] = -1
+                    failed_subtasks.append({
+                        "index": k,
+                        "subtask": graph[k]["task"],
+                        "error": f"依赖的子任务 {graph[i]['id']} 生成失败"
+                    })
+                    print(f"  ⏭️  [{k + 1}/{len(graph)}] {graph[k]['task'][:50]} 因依赖失败跳过")
+                    skip_downstream(k)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {
+                executor.submit(generate, i): i for i in range(len(graph)) if remaining[i] == 0
+            }
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                # 按子任务顺序处理同时完成的任务，使提交顺序可复现
+                for future in sorted(done, key=running.get):
+                    i = running.pop(future)
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        failed_subtasks.append({"index": i, "subtask": graph[i]["task"], "error": str(e)})
+                        print(f"  ❌ [{i + 1}/{len(graph)}] {graph[i]['task'][:50]} 生成失败: {e}")
+                        skip_downstream(i)
+                        continue
+                    
+                    print(f"  ✅ [{i + 1}/{len(graph)}] {graph[i]['task'][:50]} -> {results[i]['file_path']}")
+                    if on_generated:
+                        on_generated(i, results[i])
+                    for k in downstream[i]:
+                        if remaining[k] > 0:
+                            remaining[k] -= 1
+                            if remaining[k] == 0:
+                                running[executor.submit(generate, k)] = k
+        
+        # 依赖成环的子任务永远不会就绪
+        for i, count in enumerate(remaining):
+            if count > 0:
+                failed_subtasks.append({"index": i, "subtask": graph[i]["task"], "error": "子任务依赖成环"})
+        
+        failed_subtasks.sort(key=lambda item: item["index"])
+        self.task_state["failed_subtasks"] = failed_subtasks
+        
+        code_results = [result for result in results if result is not None]
+        if graph and not code_results:
+            raise RuntimeError(f"全部 {len(graph)} 个子任务代码生成失败")
         
         return code_results
     
     def _review_code(self, code_results: List[Dict]) -> List[Dict]:
-        """代码审查阶段"""
+        """代码审查阶段（各文件并发审查，结果按文件顺序返回）"""
         self.task_state["status"] = "reviewing"
         self.task_state["current_step"] = "code_review"
         
-        review_results = []
+        with ThreadPoolExecutor(max_workers=self.review_workers) as executor:
+            futures = [(code_result, executor.submit(self._review_file, code_result)) for code_result in code_results]
+            return self._collect_results(futures, "审查")
+    
+    def _review_file(self, code_result: Dict) -> Dict:
+        """审查单个文件"""
+        review = self.reviewer_agent.review_code(code_result["code"], file_path=code_result["file_path"])
         
-        for code_result in code_results:
-            print(f"\n  审查代码: {code_result['file_path']}")
-            
-            review = self.reviewer_agent.review_code(code_result["code"])
-            review_results.append({
-                "file_path": code_result["file_path"],
-                "review": review
-            })
-            
-            print(f"  ✅ 审查完成，质量评分: {review['score']}/100")
-            print(f"  ⚠️  发现 {len(review['issues'])} 个问题")
+        print(f"  🔍 审查完成: {code_result['file_path']}，质量评分: {review['score']}/100，"
+              f"发现 {len(review['issues'])} 个问题")
         
-        return review_results
+        return {
+            "file_path": code_result["file_path"],
+            "review": review
+        }
     
     def _generate_tests(self, code_results: List[Dict], requirements: Dict) -> List[Dict]:
-        """测试生成阶段"""
+        """测试生成阶段（各文件并发生成测试，结果按文件顺序返回）"""
         self.task_state["status"] = "testing"
         self.task_state["current_step"] = "test_generation"
         
-        test_results = []
+        with ThreadPoolExecutor(max_workers=self.test_workers) as executor:
+            futures = [
+                (code_result, executor.submit(self._test_file, code_result, requirements))
+                for code_result in code_results
+            ]
+            return self._collect_results(futures, "测试")
+    
+    @staticmethod
+    def _collect_results(futures: List[Tuple[Dict, Future]], stage: str) -> List[Dict]:
+        """
+        按文件顺序收集审查或测试结果，单个文件失败时记录为带 error 字段的结果
         
-        for code_result in code_results:
-            print(f"\n  生成测试: {code_result['file_path']}")
-            
-            test_result = self.tester_agent.generate_tests(
-                code_result["code"],
-                requirements.get("requirement_doc")
-            )
+        Args:
+            futures: (代码生成结果, 对应任务的Future) 列表
+            stage: 阶段名称（用于日志）
             
-            test_results.append({
-                "file_path": code_result["file_path"],
-                "test_result": test_result
-            })
+        Returns:
+            与 futures 一一对应的结果列表
+        """
+        results = []
+        for code_result, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"  ❌ {stage}失败: {code_result['file_path']}: {e}")
+                results.append({"file_path": code_result["file_path"], "error": str(e)})
+        return results
+    
+    def _test_file(self, code_result: Dict, requirements: Dict) -> Dict:
+        """为单个文件生成测试并执行"""
+        # 每个文件使用各自的测试文件，避免并发生成时互相覆盖
+        stem = os.path.splitext(os.path.basename(code_result["file_path"]))[0]
+        test_result = self.tester_agent.generate_tests(
+            code_result["code"],
+            requirements.get("requirement_doc"),
+            test_file_path=os.path.join(os.path.dirname(code_result["file_path"]), f"test_{stem}.py")
+        )
+        
+        result = {
+            "file_path": code_result["file_path"],
+            "test_result": test_result
+        }
+        
+        # 执行测试
+        if config.Config.ENABLE_CODE_EXECUTION and os.path.exists(test_result["test_file_path"]):
+            test_execution = self.tester_agent.run_tests(test_result["test_file_path"])
+            result["execution"] = test_execution
             
-            # 执行测试
-            if os.path.exists(test_result["test_file_path"]):
-                print(f"  ✅ 测试代码已生成")
-                test_execution = self.tester_agent.run_tests(test_result["test_file_path"])
-                test_results[-1]["execution"] = test_execution
-                
-                if test_execution["success"]:
-                    print(f"  ✅ 测试通过")
-                else:
-                    print(f"  ⚠️  测试失败: {test_execution['stderr'][:100]}")
+            if test_execution["success"]:
+                print(f"  🧪 测试通过: {code_result['file_path']}")
+            else:
+                print(f"  ⚠️  测试失败: {code_result['file_path']}: {test_execution['stderr'][:100]}")
+        else:
+            print(f"  🧪 测试代码已生成: {test_result['test_file_path']}")
         
-        return test_results
+        return result
     
     def _check_if_needs_iteration(self, review_results: List[Dict], test_results: List[Dict]) -> bool:
         """检查是否需要迭代优化"""
         # 如果审查评分低于80或测试失败，需要迭代
         for review in review_results:
-            if review["review"]["score"] < 80:
+            if "review" in review and review["review"]["score"] < 80:
                 return True
         
         for test in test_results:
@@ -289,7 +492,7 @@ class MultiAgentCoordinator:
             # 获取对应的审查结果
             review = review_results[i] if i < len(review_results) else None
             
-            if review and review["review"]["score"] < 80:
+            if review and "review" in review and review["review"]["score"] < 80:
                 print(f"  改进代码: {code_result['file_path']}")
                 
                 # 生成改进建议
@@ -333,13 +536,23 @@ class MultiAgentCoordinator:
         for code_file in self.task_state['code_files']:
             report += f"- {code_file['file_path']}\n"
         
+        if self.task_state['failed_subtasks']:
+            report += "\n## 生成失败的子任务\n"
+            for failed in self.task_state['failed_subtasks']:
+                report += f"- {failed['subtask'][:50]}: {failed['error'][:100]}\n"
+        
         report += "\n## 代码审查结果\n"
         for review in self.task_state['review_results']:
-            report += f"- {review['file_path']}: 评分 {review['review']['score']}/100\n"
+            if "error" in review:
+                report += f"- {review['file_path']}: 审查失败 ({review['error'][:100]})\n"
+            else:
+                report += f"- {review['file_path']}: 评分 {review['review']['score']}/100\n"
         
         report += "\n## 测试结果\n"
         for test in self.task_state['test_results']:
-            if "execution" in test:
+            if "error" in test:
+                report += f"- {test['file_path']}: 测试生成失败 ({test['error'][:100]})\n"
+            elif "execution" in test:
                 status = "通过" if test["execution"]["success"] else "失败"
                 report += f"- {test['file_path']}: {status}\n"
         
@@ -348,7 +561,7 @@ class MultiAgentCoordinator:
     def save_state(self, file_path: str = None):
         """保存任务状态"""
         if file_path is None:
-            file_path = os.path.join(config.Config.WORK_DIR, "task_state.json")
+            file_path = os.path.join(self.work_dir, "task_state.json")
         
         # 转换不可序列化的对象
         state = {
@@ -356,6 +569,7 @@ class MultiAgentCoordinator:
             "current_step": self.task_state["current_step"],
             "iterations": self.task_state["iterations"],
             "code_files_count": len(self.task_state["code_files"]),
+            "failed_subtasks_count": len(self.task_state["failed_subtasks"]),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -74,7 +74,8 @@ def main():
                 print("📊 结果摘要")
                 print("=" * 60)
                 print(f"✅ 生成代码文件数: {len(result['code_files'])}")
-                print(f"✅ 代码审查平均分: {sum(r['review']['score'] for r in result['review_results']) / len(result['review_results']) if result['review_results'] else 0:.1f}/100")
+                scores = [r['review']['score'] for r in result['review_results'] if 'review' in r]
+                print(f"✅ 代码审查平均分: {sum(scores) / len(scores) if scores else 0:.1f}/100")
                 print(f"✅ 迭代次数: {result['iterations']}")
                 
                 # 保存最终报告
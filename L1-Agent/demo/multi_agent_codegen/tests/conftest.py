@@ -0,0 +1,8 @@
+"""测试配置：把项目目录加入导入路径（与 main.py 相同的导入方式）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试中的LLM都是模拟对象，不会发出请求；这里只是让ChatOpenAI能够完成初始化
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,230 @@
+"""代码生成阶段：并发生成的结果按子任务顺序返回、单个子任务失败不影响其他子任务；
+依赖图调度时上游完成后才生成下游，失败逐级跳过下游，依赖成环的子任务记录为失败；
+流式流水线中单个文件的审查或测试失败只记录在该文件的结果中，结果与生成的文件一一对齐；
+Agent内部互不依赖的LLM调用同时执行，架构设计默认不再单独调用需求分析"""
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agents.architect_agent import ArchitectAgent
+from agents.requirement_agent import RequirementAgent
+from coordinator import MultiAgentCoordinator, critical_path_length
+
+ARCHITECTURE = {"architecture": "分层架构", "module_interfaces": "接口定义", "tech_stack": "Python"}
+
+
+def node(node_id, task, depends_on=()):
+    return {"id": node_id, "task": task, "depends_on": list(depends_on)}
+
+
+class FakeCoder:
+    """记录生成顺序和收到的上游代码，任务名在 fail 中时抛出异常，delays 指定各任务的生成耗时"""
+
+    def __init__(self, fail=(), delays=None):
+        self.fail = set(fail)
+        self.delays = delays or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_code(self, task, architecture, module_interface, tech_stack, file_path=None, dependencies=None):
+        with self._lock:
+            self.calls.append((task, [dep["code"] for dep in dependencies or []]))
+        time.sleep(self.delays.get(task, 0))
+        if task in self.fail:
+            raise RuntimeError(f"{task} 生成失败")
+        return {"file_path": file_path, "code": f"# {task}"}
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    return MultiAgentCoordinator(codegen_workers=4, work_dir=str(tmp_path))
+
+
+def run(coordinator, graph, fail=(), delays=None):
+    coder = FakeCoder(fail, delays)
+    coordinator.coder_agent.generate_code = coder.generate_code
+    requirements = {"subtasks": [item["task"] for item in graph], "subtask_graph": graph}
+    results = coordinator._generate_code(requirements, ARCHITECTURE)
+    return results, coordinator.task_state["failed_subtasks"], coder.calls
+
+
+def test_independent_subtasks_keep_subtask_order(coordinator):
+    # 先提交的子任务最后完成，结果仍按子任务顺序返回，文件路径互不相同
+    graph = [node(1, "模型"), node(2, "存储"), node(3, "接口")]
+    results, failed, _ = run(coordinator, graph, delays={"模型": 0.2, "存储": 0.1})
+
+    assert failed == []
+    assert [result["code"] for result in results] == ["# 模型", "# 存储", "# 接口"]
+    assert len({result["file_path"] for result in results}) == 3
+
+
+def test_failed_subtask_does_not_affect_others(coordinator):
+    graph = [node(1, "模型"), node(2, "存储"), node(3, "接口")]
+    results, failed, _ = run(coordinator, graph, fail={"存储"})
+
+    assert [result["code"] for result in results] == ["# 模型", "# 接口"]
+    assert [(item["index"], item["subtask"], item["error"]) for item in failed] == [(1, "存储", "存储 生成失败")]
+
+
+def test_upstream_code_is_passed_downstream(coordinator):
+    graph = [node(1, "模型"), node(2, "存储", [1]), node(3, "接口", [1, 2]), node(4, "工具")]
+    results, failed, calls = run(coordinator, graph)
+
+    assert failed == []
+    assert [result["code"] for result in results] == ["# 模型", "# 存储", "# 接口", "# 工具"]
+    order = [task for task, _ in calls]
+    assert order.index("模型") < order.index("存储") < order.index("接口")
+    assert dict(calls)["接口"] == ["# 模型", "# 存储"]
+
+
+def test_failure_skips_downstream_transitively(coordinator):
+    graph = [node(1, "模型"), node(2, "存储", [1]), node(3, "接口", [2]), node(4, "工具")]
+    results, failed, calls = run(coordinator, graph, fail={"模型"})
+
+    assert [result["code"] for result in results] == ["# 工具"]
+    assert [(item["index"], item["subtask"]) for item in failed] == [(0, "模型"), (1, "存储"), (2, "接口")]
+    assert failed[1]["error"] == "依赖的子任务 1 生成失败"
+    assert failed[2]["error"] == "依赖的子任务 2 生成失败"
+    # 被跳过的子任务不会调用LLM
+    assert sorted(task for task, _ in calls) == sorted(["模型", "工具"])
+
+
+def test_cycle_is_reported_without_blocking_other_subtasks(coordinator):
+    graph = [node(1, "A", [2]), node(2, "B", [1]), node(3, "C"), node(4, "D", [3])]
+    results, failed, _ = run(coordinator, graph)
+
+    assert [result["code"] for result in results] == ["# C", "# D"]
+    assert [(item["index"], item["error"]) for item in failed] == [(0, "子任务依赖成环"), (1, "子任务依赖成环")]
+
+
+def test_all_subtasks_failing_raises(coordinator):
+    with pytest.raises(RuntimeError):
+        run(coordinator, [node(1, "A"), node(2, "B", [1])], fail={"A"})
+
+
+def test_critical_path_length():
+    assert critical_path_length([]) == 0
+    assert critical_path_length([node(1, "A"), node(2, "B"), node(3, "C")]) == 1
+    assert critical_path_length([node(1, "A"), node(2, "B", [1]), node(3, "C", [2]), node(4, "D", [1])]) == 3
+    # 成环时不会无限递归
+    assert critical_path_length([node(1, "A", [2]), node(2, "B", [1])]) == 2
+
+
+def test_parse_subtask_graph_breaks_cycles():
+    response = "1. 定义模型（依赖: 3）\n2. 实现存储（依赖: 1）\n3. 实现接口（依赖: 2）\n4. 编写工具函数"
+    graph = RequirementAgent.parse_subtask_graph(response)
+
+    assert [item["task"] for item in graph] == ["定义模型", "实现存储", "实现接口", "编写工具函数"]
+    # 有环时只保留指向排在前面的任务的依赖
+    assert [item["depends_on"] for item in graph] == [[], [1], [2], []]
+
+
+class FakeReviewer:
+    """审查耗时按文件递减（后生成的文件先审查完），代码中含 fail 的文件审查时抛出异常"""
+
+    def __init__(self, fail="存储"):
+        self.fail = fail
+
+    def review_code(self, code, file_path=None):
+        time.sleep(0.1 if "模型" in code else 0)
+        if self.fail in code:
+            raise RuntimeError("审查接口超时")
+        return {"score": 90, "issues": []}
+
+
+def fake_generate_tests(code, requirement_doc, test_file_path=None):
+    return {"test_file_path": test_file_path, "test_code": f"# test {code}"}
+
+
+def run_pipeline(coordinator, graph, fail=()):
+    coordinator.coder_agent.generate_code = FakeCoder(fail).generate_code
+    coordinator.reviewer_agent.review_code = FakeReviewer().review_code
+    coordinator.tester_agent.generate_tests = fake_generate_tests
+    requirements = {"subtasks": [item["task"] for item in graph], "subtask_graph": graph, "requirement_doc": "需求"}
+    return coordinator._run_pipeline(requirements, ARCHITECTURE)
+
+
+def test_pipeline_isolates_review_failure(coordinator):
+    graph = [node(1, "模型"), node(2, "存储"), node(3, "接口")]
+    code_results, review_results, test_results = run_pipeline(coordinator, graph)
+
+    files = [result["file_path"] for result in code_results]
+    assert [result["file_path"] for result in review_results] == files
+    assert [result["file_path"] for result in test_results] == files
+    assert review_results[1]["error"] == "审查接口超时"
+    assert [result["review"]["score"] for result in (review_results[0], review_results[2])] == [90, 90]
+    assert all("error" not in result for result in test_results)
+    # 出错的审查结果不会让后续步骤崩溃
+    coordinator._check_if_needs_iteration(review_results, test_results)
+
+
+def test_pipeline_results_align_with_generated_files(coordinator):
+    graph = [node(1, "模型"), node(2, "工具"), node(3, "接口", [2]), node(4, "配置")]
+    code_results, review_results, test_results = run_pipeline(coordinator, graph, fail={"工具"})
+
+    # 生成失败的子任务及其下游没有审查和测试结果，其余结果按子任务顺序对齐
+    assert [result["code"] for result in code_results] == ["# 模型", "# 配置"]
+    files = [result["file_path"] for result in code_results]
+    assert [result["file_path"] for result in review_results] == files
+    assert [result["test_result"]["test_code"] for result in test_results] == ["# test # 模型", "# test # 配置"]
+
+
+class RecordingLLM:
+    """记录收到的Prompt（线程安全），回答固定内容"""
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        return AIMessage(content="1. 定义模型")
+
+
+def test_run_concurrently_overlaps_calls():
+    agent = RequirementAgent()
+    agent.parallel_calls = True
+    barrier = threading.Barrier(3)
+
+    def call(name):
+        # 三个调用都要等到其余调用开始后才能返回，逐个执行时会超时
+        barrier.wait(timeout=2)
+        return name
+
+    results = agent.run_concurrently({name: (lambda name=name: call(name)) for name in ("a", "b", "c")})
+    assert results == {"a": "a", "b": "b", "c": "c"}
+
+
+def test_run_concurrently_serial_and_error_propagation():
+    agent = RequirementAgent()
+    agent.parallel_calls = False
+    order = []
+
+    def call(name):
+        order.append(name)
+        return name
+
+    results = agent.run_concurrently({name: (lambda name=name: call(name)) for name in ("a", "b")})
+    assert results == {"a": "a", "b": "b"}
+    assert order == ["a", "b"]
+
+    def fail():
+        raise RuntimeError("LLM不可用")
+
+    agent.parallel_calls = True
+    with pytest.raises(RuntimeError):
+        agent.run_concurrently({"ok": lambda: "ok", "fail": fail})
+
+
+@pytest.mark.parametrize("include_analysis, expected_calls", [(False, 3), (True, 4)])
+def test_design_system_skips_unused_analysis(include_analysis, expected_calls):
+    architect = ArchitectAgent(include_analysis=include_analysis)
+    architect.llm = RecordingLLM()
+    result = architect.design_system("需求文档", ["定义模型"])
+
+    assert len(architect.llm.prompts) == expected_calls
+    assert (result["analysis"] is not None) == include_analysis
+    assert result["architecture"] and result["tech_stack"] and result["module_interfaces"]
@@ -0,0 +1,101 @@
+"""结构化审查：Schema校验、解析失败时只重问一次、重问仍失败时退回关键词解析"""
+import json
+
+from langchain_core.messages import AIMessage
+
+from agents.reviewer_agent import REVIEW_SCHEMA, ReviewerAgent, validate_schema
+
+CODE = "def add(a, b):\n    return a + b\n"
+
+VALID_REVIEW = {
+    "summary": "缺少文档",
+    "issues": [
+        {"severity": "中等", "file": "calc.py", "line": 1, "description": "缺少文档字符串", "fix": "补充文档字符串"},
+        {"severity": "轻微", "line": None, "description": "缺少类型提示", "fix": "添加类型提示"},
+    ],
+    "score": 85,
+}
+
+
+class ScriptedLLM:
+    """按顺序返回预设的回答，并记录收到的Prompt"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content=self.responses.pop(0))
+
+
+def reviewer_with(*responses):
+    reviewer = ReviewerAgent(structured=True)
+    reviewer.llm = ScriptedLLM(*responses)
+    return reviewer
+
+
+def test_validate_schema_accepts_valid_review():
+    assert validate_schema(VALID_REVIEW, REVIEW_SCHEMA) == []
+
+
+def test_validate_schema_reports_each_violation():
+    review = {
+        "issues": [
+            {"severity": "致命", "line": "3", "description": "x", "fix": "y"},
+            {"severity": "轻微", "description": "缺少修复建议"},
+        ],
+        "score": 120,
+    }
+    assert validate_schema(review, REVIEW_SCHEMA) == [
+        "$.issues[0].severity 应为 ['严重', '中等', '轻微'] 之一",
+        "$.issues[0].line 应为 integer/null 类型",
+        "$.issues[1].fix 缺失",
+        "$.score 不能大于 100",
+    ]
+    assert validate_schema({"issues": []}, REVIEW_SCHEMA) == ["$.score 缺失"]
+    # bool 不能当作 integer
+    assert validate_schema({"issues": [], "score": True}, REVIEW_SCHEMA) == ["$.score 应为 integer 类型"]
+
+
+def test_structured_review_single_call():
+    reviewer = reviewer_with(f"```json\n{json.dumps(VALID_REVIEW, ensure_ascii=False)}\n```")
+    review = reviewer.review_code(CODE, file_path="calc.py")
+
+    assert len(reviewer.llm.prompts) == 1
+    assert "1|def add(a, b):" in reviewer.llm.prompts[0]
+    assert [issue["file"] for issue in review["issues"]] == ["calc.py", "calc.py"]
+    assert review["model_score"] == 85
+    # 评分按问题列表计算，与LLM给出的评分无关
+    assert review["score"] == reviewer_with(json.dumps(dict(VALID_REVIEW, score=10))).review_code(
+        CODE, file_path="calc.py")["score"]
+
+
+def test_malformed_output_is_repaired_once():
+    truncated = json.dumps(VALID_REVIEW, ensure_ascii=False)[:60]
+    reviewer = reviewer_with(truncated, json.dumps(VALID_REVIEW, ensure_ascii=False))
+    review = reviewer.review_code(CODE, file_path="calc.py")
+
+    assert len(reviewer.llm.prompts) == 2
+    repair_prompt = reviewer.llm.prompts[1]
+    assert "无法解析" in repair_prompt and truncated in repair_prompt
+    # 重问时不再重复发送代码
+    assert "1|def add(a, b):" not in repair_prompt
+    assert len(review["issues"]) == 2 and review["model_score"] == 85
+
+
+def test_schema_violation_is_repaired_with_error_message():
+    invalid = json.dumps(dict(VALID_REVIEW, score="高"), ensure_ascii=False)
+    reviewer = reviewer_with(invalid, json.dumps(VALID_REVIEW, ensure_ascii=False))
+    reviewer.review_code(CODE)
+
+    assert "$.score 应为 integer 类型" in reviewer.llm.prompts[1]
+
+
+def test_falls_back_after_second_failure():
+    reviewer = reviewer_with("严重：存在bug", "仍然不是JSON")
+    review = reviewer.review_code(CODE)
+
+    assert len(reviewer.llm.prompts) == 2
+    assert review["model_score"] is None
+    assert set(review) >= {"review_result", "issues", "suggestions", "score", "code"}
@@ -0,0 +1,271 @@
+"""
+批量问答模块：从问题文件批量生成回答，用于制度审计和知识库更新后的回归检查
+
+核心知识点：
+1. 批量检索：一批问题只调用一次Embedding接口，并用一次FAISS矩阵检索完成近邻搜索
+2. 并发生成：LLM调用主要在等待网络，用固定大小的线程池并发请求，同时限制在途任务数量
+3. 流式落盘与断点续跑：每完成一个问题立即追加写入JSONL，崩溃后重新运行会跳过已成功回答的问题
+4. 性能统计：结束时报告吞吐量和延迟分位数（P50/P90/P99）
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Set
+
+import numpy as np
+from langchain.schema import Document
+from rag_chain import RAGChain
+
+
+def read_questions(input_path: str) -> List[Dict]:
+    """
+    读取问题文件
+
+    支持JSONL（每行一个对象，包含 question 字段）和CSV（表头包含 question 列），
+    可选的 id 字段用于断点续跑时识别问题，缺省时使用行号。
+
+    Args:
+        input_path: 问题文件路径（.jsonl 或 .csv）
+
+    Returns:
+        问题列表，每项包含 id 和 question
+    """
+    if input_path.endswith('.csv'):
+        with open(input_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(input_path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    questions = []
+    for i, row in enumerate(rows, 1):
+        question = (row.get("question") or "").strip()
+        if question:
+            question_id = row.get("id")
+            questions.append({"id": str(i if question_id is None else question_id), "question": question})
+    return questions
+
+
+def load_answered_ids(output_path: str) -> Set[str]:
+    """
+    读取结果文件中已成功回答的问题ID
+
+    崩溃时最后一行可能只写了一半，解析失败的行直接忽略；
+    出错的问题不计入，重新运行时会再次尝试。
+
+    Args:
+        output_path: 结果文件路径
+
+    Returns:
+        已回答的问题ID集合
+    """
+    answered = set()
+    if not os.path.exists(output_path):
+        return answered
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                answered.add(record["id"])
+    return answered
+
+
+def truncate_partial_line(output_path: str):
+    """
+    截掉崩溃时写了一半的最后一行，避免新结果接在残行后面
+
+    Args:
+        output_path: 结果文件路径
+    """
+    if not os.path.exists(output_path):
+        return
+
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class BatchRunner:
+    """批量问答执行器"""
+
+    def __init__(self, rag_chain: RAGChain, k: int = 3, concurrency: int = 8, retrieval_batch_size: int = 32):
+        """
+        初始化批量问答执行器
+
+        Args:
+            rag_chain: RAG链
+            k: 每个问题检索的文档数量
+            concurrency: 并发生成的线程数
+            retrieval_batch_size: 每次批量检索的问题数量
+        """
+        self.rag_chain = rag_chain
+        self.k = k
+        self.concurrency = concurrency
+        self.retrieval_batch_size = retrieval_batch_size
+
+        self.latencies: List[float] = []
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.wall_seconds = 0.0
+
+    def run(self, input_path: str, output_path: str) -> Dict:
+        """
+        批量回答问题文件中的问题，结果追加写入JSONL
+
+        Args:
+            input_path: 问题文件路径
+            output_path: 结果文件路径（已存在时跳过其中已回答的问题）
+
+        Returns:
+            统计信息
+        """
+        questions = read_questions(input_path)
+        truncate_partial_line(output_path)
+        answered = load_answered_ids(output_path)
+        pending_questions = [item for item in questions if item["id"] not in answered]
+        self.skipped = len(questions) - len(pending_questions)
+        print(f"📋 共 {len(questions)} 个问题，已回答 {self.skipped} 个，本次处理 {len(pending_questions)} 个")
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        start = time.perf_counter()
+
+        with open(output_path, 'a', encoding='utf-8') as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            running = set()
+            for offset in range(0, len(pending_questions), self.retrieval_batch_size):
+                batch = pending_questions[offset:offset + self.retrieval_batch_size]
+
+                # 整批检索，检索耗时平摊到每个问题
+                started = time.perf_counter()
+                docs_list = self.rag_chain.vector_store_manager.batch_similarity_search(
+                    [item["question"] for item in batch], k=self.k
+                )
+                retrieval_seconds = (time.perf_counter() - started) / len(batch)
+
+                for item, docs in zip(batch, docs_list):
+                    running.add(executor.submit(self._answer, item, docs, retrieval_seconds))
+                    # 在途任务数量有上限，已完成的结果边生成边写出
+                    if len(running) >= self.concurrency * 2:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        self._write(output, done)
+
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                self._write(output, done)
+
+        self.wall_seconds = time.perf_counter() - start
+        stats = self.stats()
+        self.print_stats(stats)
+        return stats
+
+    def _answer(self, item: Dict, docs: List[Document], retrieval_seconds: float) -> Dict:
+        """在工作线程中为单个问题生成回答"""
+        started = time.perf_counter()
+        record = {"id": item["id"], "question": item["question"]}
+        try:
+            result = self.rag_chain.invoke(item["question"], k=self.k, retrieved_docs=docs)
+            record.update({
+                "answer": result["answer"],
+                "sources": [
+                    {
+                        "source": doc.metadata.get("source", "unknown"),
+                        "section": doc.metadata.get("section"),
+                        "chunk_id": doc.metadata.get("chunk_id")
+                    }
+                    for doc in result["retrieved_docs"]
+                ],
+                "cache_hit": result["cache_hit"],
+                "faq_match": result.get("faq_match"),
+                "usage": result["usage"]
+            })
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_ms"] = round((retrieval_seconds + time.perf_counter() - started) * 1000, 1)
+        return record
+
+    def _write(self, output, futures):
+        """把已完成的结果写入文件（只在主线程调用）"""
+        for future in futures:
+            record = future.result()
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if "error" in record:
+                self.failed += 1
+                print(f"❌ [{record['id']}] {record['error']}")
+            else:
+                self.completed += 1
+                self.latencies.append(record["latency_ms"])
+        # 每批结果立即刷盘，崩溃时最多丢失正在生成的问题
+        output.flush()
+
+    def stats(self) -> Dict:
+        """
+        计算吞吐量和延迟分位数
+
+        Returns:
+            统计信息
+        """
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_seconds": round(self.wall_seconds, 2),
+            "throughput_qps": round(self.completed / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "latency_p90_ms": round(float(np.percentile(latencies, 90)), 1),
+            "latency_p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        }
+
+    @staticmethod
+    def print_stats(stats: Dict):
+        """打印统计信息"""
+        print(f"\n✅ 批量问答完成: 成功 {stats['completed']}，失败 {stats['failed']}，跳过 {stats['skipped']}")
+        print(f"  总耗时: {stats['wall_seconds']}s，吞吐量: {stats['throughput_qps']} 问/秒")
+        print(f"  延迟: P50 {stats['latency_p50_ms']}ms | P90 {stats['latency_p90_ms']}ms | "
+              f"P99 {stats['latency_p99_ms']}ms")
+
+
+def run_batch(input_path: str, output_path: str):
+    """
+    按配置加载知识库并批量回答问题文件
+
+    Args:
+        input_path: 问题文件路径（.jsonl 或 .csv）
+        output_path: 结果文件路径（JSONL）
+    """
+    from config import Config
+    from main import create_rag_chain, load_knowledge_base
+
+    print("=" * 60)
+    print("批量问答")
+    print("=" * 60)
+
+    Config.validate()
+    vector_manager = load_knowledge_base()
+    if vector_manager is None:
+        raise RuntimeError("无法加载或构建知识库")
+
+    runner = BatchRunner(
+        create_rag_chain(vector_manager),
+        k=Config.TOP_K,
+        concurrency=Config.BATCH_CONCURRENCY,
+        retrieval_batch_size=Config.BATCH_RETRIEVAL_SIZE
+    )
+    runner.run(input_path, output_path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("用法: python batch_runner.py <问题文件.jsonl|.csv> <结果文件.jsonl>")
+        sys.exit(1)
+    run_batch(sys.argv[1], sys.argv[2])
@@ -0,0 +1,362 @@
+"""
+压缩文本块存储模块：以压缩形式保存文本块内容，并支持按行号随机读取
+
+核心知识点：
+1. 字典压缩：文本块很短（几百字符），单独压缩效果差；先从语料中训练共享字典，
+   再用字典逐块压缩，既有接近整体压缩的压缩率，又能单独解压任意一块
+2. 偏移索引：所有压缩块顺序写入一个数据文件，另存一个偏移数组，读取第 i 块只需一次切片
+3. 按需解压：检索时只解压返回的 top-k 文本块，其余文本始终保持压缩状态
+
+压缩算法优先使用 zstd（需安装 zstandard），未安装时退回标准库 zlib（同样支持预置字典）；
+codec="none" 时不压缩，文本按UTF-8原样连续存放，同样通过偏移数组随机读取。
+"""
+import json
+import mmap
+import os
+import pickle
+import random
+import threading
+import time
+import zlib
+from array import array
+from typing import List, Optional, Union
+
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖
+    zstandard = None
+
+
+class ChunkStore:
+    """压缩文本块存储：共享字典 + 逐块压缩 + 偏移索引"""
+
+    HEADER_FILE = "chunks.json"
+    DICT_FILE = "chunks.dict"
+    OFFSETS_FILE = "chunks.offsets"
+    DATA_FILE = "chunks.data"
+
+    # zlib的预置字典最多使用32KB窗口
+    ZLIB_DICT_SIZE = 32 * 1024
+
+    def __init__(self, codec: str, dictionary: bytes, offsets: array, data: Union[bytes, mmap.mmap]):
+        """
+        初始化压缩文本块存储（通常通过 build 或 open 创建）
+
+        Args:
+            codec: 压缩算法，"zstd"、"zlib" 或 "none"（不压缩）
+            dictionary: 压缩字典
+            offsets: 偏移数组，第 i 块位于 data[offsets[i]:offsets[i+1]]
+            data: 压缩数据（内存字节串或内存映射文件）
+        """
+        self.codec = codec
+        self.dictionary = dictionary
+        self.offsets = offsets
+        self.data = data
+        self._local = threading.local()
+
+    @classmethod
+    def build(cls, texts: List[str], codec: Optional[str] = None, dict_size: int = 16 * 1024) -> 'ChunkStore':
+        """
+        训练字典并逐块压缩文本
+
+        Args:
+            texts: 文本块内容列表
+            codec: 压缩算法，默认在安装了zstandard时使用zstd，否则使用zlib；"none" 表示不压缩
+            dict_size: zstd字典大小（字节）
+
+        Returns:
+            压缩文本块存储
+        """
+        encoded = [text.encode('utf-8') for text in texts]
+        codec, dictionary, compress = cls._make_compressor(codec, encoded, dict_size)
+        blocks = [compress(raw) for raw in encoded]
+        return cls(codec, dictionary, cls._offsets_of(blocks), b"".join(blocks))
+
+    @classmethod
+    def _make_compressor(cls, codec: Optional[str], encoded: List[bytes], dict_size: int = 16 * 1024):
+        """
+        按样本训练字典并返回逐块压缩函数
+
+        Args:
+            codec: 压缩算法，None表示默认算法
+            encoded: UTF-8编码后的样本文本块
+            dict_size: zstd字典大小（字节）
+
+        Returns:
+            (压缩算法, 字典, 压缩函数)
+        """
+        codec = codec or ("zstd" if zstandard is not None else "zlib")
+        if codec == "none":
+            return codec, b"", bytes
+
+        # 随机抽样作为字典训练语料，避免大语料下训练过慢（固定种子保证构建结果可复现）
+        samples = random.Random(0).sample(encoded, min(len(encoded), 2000))
+
+        if codec == "zstd":
+            if zstandard is None:
+                raise ImportError("使用zstd压缩需要安装zstandard: pip install zstandard")
+            try:
+                dictionary = zstandard.train_dictionary(dict_size, samples).as_bytes()
+            except zstandard.ZstdError:
+                # 样本太少时无法训练，直接用样本原文作为字典
+                dictionary = b"".join(samples)[-dict_size:]
+            compressor = zstandard.ZstdCompressor(level=19, dict_data=cls._zstd_dict(dictionary))
+            compress = compressor.compress
+        elif codec == "zlib":
+            dictionary = b"".join(samples)[-cls.ZLIB_DICT_SIZE:]
+
+            def compress(raw: bytes) -> bytes:
+                compressor = zlib.compressobj(level=9, zdict=dictionary)
+                return compressor.compress(raw) + compressor.flush()
+        else:
+            raise ValueError(f"不支持的压缩算法: {codec}")
+
+        return codec, dictionary, compress
+
+    @staticmethod
+    def _offsets_of(blocks: List[bytes]) -> array:
+        """按顺序拼接各块时每块的起始偏移（末尾附加总长度）"""
+        offsets = array('Q', [0])
+        for block in blocks:
+            offsets.append(offsets[-1] + len(block))
+        return offsets
+
+    @staticmethod
+    def _zstd_dict(dictionary: bytes):
+        """构建zstd字典对象；训练得到的字典和原文字典都能正确识别"""
+        return zstandard.ZstdCompressionDict(dictionary, dict_type=zstandard.DICT_TYPE_AUTO)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, i: int) -> str:
+        """
+        解压并返回第 i 个文本块
+
+        Args:
+            i: 文本块行号
+
+        Returns:
+            文本块内容
+        """
+        block = self.data[self.offsets[i]:self.offsets[i + 1]]
+
+        if self.codec == "none":
+            raw = block
+        elif self.codec == "zstd":
+            # ZstdDecompressor不能跨线程共享，每个线程各持有一个
+            decompressor = getattr(self._local, "decompressor", None)
+            if decompressor is None:
+                decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dict(self.dictionary))
+                self._local.decompressor = decompressor
+            raw = decompressor.decompress(block)
+        else:
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            raw = decompressor.decompress(block) + decompressor.flush()
+
+        return raw.decode('utf-8')
+
+    def save(self, save_path: str):
+        """
+        将压缩文本块写入目录
+
+        Args:
+            save_path: 目标目录
+        """
+        with open(os.path.join(save_path, self.HEADER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"codec": self.codec, "count": len(self)}, f)
+        with open(os.path.join(save_path, self.DICT_FILE), 'wb') as f:
+            f.write(self.dictionary)
+        with open(os.path.join(save_path, self.OFFSETS_FILE), 'wb') as f:
+            self.offsets.tofile(f)
+        with open(os.path.join(save_path, self.DATA_FILE), 'wb') as f:
+            f.write(self.data)
+
+    @classmethod
+    def open(cls, load_path: str) -> 'ChunkStore':
+        """
+        打开目录中的压缩文本块；数据文件通过内存映射按需读取
+
+        Args:
+            load_path: 目录路径
+
+        Returns:
+            压缩文本块存储
+        """
+        with open(os.path.join(load_path, cls.HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header["codec"] == "zstd" and zstandard is None:
+            raise ImportError("该索引使用zstd压缩，请先安装zstandard: pip install zstandard")
+
+        with open(os.path.join(load_path, cls.DICT_FILE), 'rb') as f:
+            dictionary = f.read()
+
+        offsets = array('Q')
+        with open(os.path.join(load_path, cls.OFFSETS_FILE), 'rb') as f:
+            offsets.fromfile(f, header["count"] + 1)
+
+        data_path = os.path.join(load_path, cls.DATA_FILE)
+        if os.path.getsize(data_path) == 0:
+            data = b""
+        else:
+            with open(data_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls(header["codec"], dictionary, offsets, data)
+
+    def close(self):
+        """关闭内存映射的数据文件"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def disk_size(self) -> int:
+        """压缩存储落盘后的总字节数"""
+        return len(self.dictionary) + len(self.offsets) * self.offsets.itemsize + len(self.data)
+
+
+class ChunkStoreWriter:
+    """
+    流式写入文本块：逐块压缩后追加到数据文件，内存中只保留偏移数组
+
+    用于语料无法一次放入内存的场景，写完后通过 close 得到内存映射打开的ChunkStore。
+    """
+
+    def __init__(self, save_path: str, codec: Optional[str] = "none", samples: Optional[List[str]] = None,
+                 dict_size: int = 16 * 1024):
+        """
+        初始化写入器
+
+        Args:
+            save_path: 目标目录
+            codec: 压缩算法，"none" 表示不压缩，None表示默认算法
+            samples: 训练压缩字典的样本文本（不压缩时可省略）
+            dict_size: zstd字典大小（字节）
+        """
+        self.save_path = save_path
+        encoded = [text.encode('utf-8') for text in samples or []]
+        self.codec, self.dictionary, self._compress = ChunkStore._make_compressor(codec, encoded, dict_size)
+        self.offsets = array('Q', [0])
+
+        os.makedirs(save_path, exist_ok=True)
+        self._file = open(os.path.join(save_path, ChunkStore.DATA_FILE), 'wb')
+
+    def append(self, text: str):
+        """
+        追加一个文本块
+
+        Args:
+            text: 文本块内容
+        """
+        block = self._compress(text.encode('utf-8'))
+        self._file.write(block)
+        self.offsets.append(self.offsets[-1] + len(block))
+
+    def close(self) -> ChunkStore:
+        """
+        写入头信息、字典和偏移数组
+
+        Returns:
+            以内存映射方式打开的ChunkStore
+        """
+        self._file.close()
+        with open(os.path.join(self.save_path, ChunkStore.HEADER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"codec": self.codec, "count": len(self.offsets) - 1}, f)
+        with open(os.path.join(self.save_path, ChunkStore.DICT_FILE), 'wb') as f:
+            f.write(self.dictionary)
+        with open(os.path.join(self.save_path, ChunkStore.OFFSETS_FILE), 'wb') as f:
+            self.offsets.tofile(f)
+        return ChunkStore.open(self.save_path)
+
+
+def benchmark_chunk_store(scales: List[int] = (1, 100, 1000), hits: int = 1000):
+    """
+    对比原始pickle文档存储与压缩文本块存储的磁盘占用、加载时间和单次命中解压延迟
+
+    语料由 data/hr_policy.txt 的文本块复制 scale 份生成，每份附加不同的修订标记，
+    避免压缩器直接识别出整份重复。
+
+    Args:
+        scales: 语料放大倍数列表
+        hits: 测量解压延迟时的随机读取次数
+    """
+    import tempfile
+    from langchain.schema import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from chunk_table import ChunkTable
+    from document_loader import DocumentLoader
+
+    print("=" * 60)
+    print("压缩文本块存储基准测试")
+    print("=" * 60)
+
+    file_path = os.path.join(os.path.dirname(__file__), "data", "hr_policy.txt")
+    base_chunks = DocumentLoader(chunk_size=500, chunk_overlap=75).load_and_split(file_path)
+
+    rows = []
+    for scale in scales:
+        docs = {}
+        for copy in range(scale):
+            for chunk in base_chunks:
+                doc_id = f"{copy}-{chunk.metadata['chunk_id']}"
+                metadata = dict(chunk.metadata, source=f"hr_policy_{copy}.txt")
+                docs[doc_id] = Document(page_content=f"{chunk.page_content}\n（第{copy}版修订）", metadata=metadata)
+        doc_ids = list(docs)
+        sample_rows = [random.randrange(len(doc_ids)) for _ in range(hits)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # 基线：FAISS默认的pickle文档存储
+            baseline = InMemoryDocstore(docs)
+            pickle_path = os.path.join(tmp, "docstore.pkl")
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(baseline, f)
+            pickle_bytes = os.path.getsize(pickle_path)
+
+            start = time.perf_counter()
+            with open(pickle_path, 'rb') as f:
+                loaded = pickle.load(f)
+            pickle_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for row in sample_rows:
+                loaded.search(doc_ids[row])
+            pickle_hit = (time.perf_counter() - start) / hits
+
+            # 压缩文本块存储（文本块表：行号即ID，元数据列式存放）
+            compressed = ChunkTable.from_docstore(baseline, doc_ids)
+            compressed.chunk_store.save(tmp)
+            light_path = os.path.join(tmp, "compressed.pkl")
+            with open(light_path, 'wb') as f:
+                pickle.dump(compressed, f)
+            compressed_bytes = os.path.getsize(light_path) + sum(
+                os.path.getsize(os.path.join(tmp, name))
+                for name in (ChunkStore.HEADER_FILE, ChunkStore.DICT_FILE, ChunkStore.OFFSETS_FILE, ChunkStore.DATA_FILE)
+            )
+
+            start = time.perf_counter()
+            with open(light_path, 'rb') as f:
+                loaded = pickle.load(f)
+            loaded.attach(tmp)
+            compressed_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for row in sample_rows:
+                loaded.search(row)
+            compressed_hit = (time.perf_counter() - start) / hits
+
+            text_bytes = sum(len(doc.page_content.encode('utf-8')) for doc in docs.values())
+            rows.append((len(docs), text_bytes, pickle_bytes, compressed_bytes,
+                         pickle_load, compressed_load, pickle_hit, compressed_hit))
+            loaded.chunk_store.close()
+
+    codec = "zstd" if zstandard is not None else "zlib"
+    print(f"\n压缩算法: {codec}")
+    print(f"{'文本块数':>10} {'原文(KB)':>10} {'pickle(KB)':>11} {'压缩(KB)':>10} "
+          f"{'pickle加载(ms)':>15} {'压缩加载(ms)':>13} {'pickle命中(µs)':>15} {'压缩命中(µs)':>13}")
+    for n, text_bytes, pb, cb, pl, cl, ph, ch in rows:
+        print(f"{n:>10} {text_bytes / 1024:>10.1f} {pb / 1024:>11.1f} {cb / 1024:>10.1f} "
+              f"{pl * 1000:>15.2f} {cl * 1000:>13.2f} {ph * 1e6:>15.2f} {ch * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    benchmark_chunk_store()
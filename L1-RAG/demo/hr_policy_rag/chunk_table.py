@@ -0,0 +1,387 @@
+"""
+列式文本块表模块：用连续数组代替逐块的Document对象，降低大规模知识库的常驻内存
+
+核心知识点：
+1. 对象开销：每个Document对象、元数据字典、字符串和 index_to_docstore_id 中的映射项
+   都有几十到上百字节的Python对象头，文本块数量达到百万级时开销是文本本身的数倍
+2. 列式存储：文本放在一个连续缓冲区中（偏移数组定位），整数元数据放在int64数组中，
+   字符串元数据（如来源文件、章节）驻留为"词表 + 编号数组"，重复的字符串只存一份
+3. 按需物化：只有检索命中的文本块才构建Document对象返回给调用方
+4. 行号即ID：FAISS的行号直接作为文档ID，不再为每一行保存一个UUID映射
+"""
+import os
+import pickle
+import time
+import tracemalloc
+from array import array
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from chunk_store import ChunkStore
+
+
+class MetadataColumns:
+    """列式元数据：整数列、驻留字符串列，以及无法列式存储的少量其他值"""
+
+    # 整数列中表示"该行没有这个字段"的值
+    MISSING_INT = np.iinfo(np.int64).min
+
+    def __init__(self, count: int, keys: List[str], int_columns: Dict[str, np.ndarray],
+                 str_columns: Dict[str, tuple], extras: Dict[int, Dict]):
+        """
+        初始化列式元数据（通常通过 build 创建）
+
+        Args:
+            count: 行数
+            keys: 字段名（保持原始元数据中的字段顺序）
+            int_columns: 整数字段 -> int64数组
+            str_columns: 字符串字段 -> (词表, int32编号数组，-1表示缺失)
+            extras: 行号 -> 其他类型字段的值
+        """
+        self.count = count
+        self.keys = keys
+        self.int_columns = int_columns
+        self.str_columns = str_columns
+        self.extras = extras
+
+    @classmethod
+    def build(cls, metadatas: List[Dict]) -> 'MetadataColumns':
+        """
+        将元数据字典列表转换为列式存储
+
+        Args:
+            metadatas: 元数据字典列表
+
+        Returns:
+            列式元数据
+        """
+        builder = MetadataColumnsBuilder()
+        for metadata in metadatas:
+            builder.append(metadata)
+        return builder.build()
+
+    def row(self, i: int) -> Dict:
+        """
+        还原第 i 行的元数据字典
+
+        Args:
+            i: 行号
+
+        Returns:
+            元数据字典
+        """
+        extra = self.extras.get(i, {})
+        metadata = {}
+        for key in self.keys:
+            if key in self.int_columns:
+                value = self.int_columns[key][i]
+                if value != self.MISSING_INT:
+                    metadata[key] = int(value)
+            elif key in self.str_columns:
+                vocab, codes = self.str_columns[key]
+                if codes[i] >= 0:
+                    metadata[key] = vocab[codes[i]]
+            elif key in extra:
+                metadata[key] = extra[key]
+        return metadata
+
+    def nbytes(self) -> int:
+        """数组部分占用的字节数（不含词表字符串）"""
+        return sum(column.nbytes for column in self.int_columns.values()) + \
+            sum(codes.nbytes for _, codes in self.str_columns.values())
+
+
+class MetadataColumnsBuilder:
+    """
+    逐行追加元数据，构建过程中只保留列式数组（流式构建大规模索引时使用）
+
+    字段类型由第一次出现的值决定；之后出现其他类型的值时，该字段整体降级为 extras 存储。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.keys: List[str] = []
+        self.int_columns: Dict[str, array] = {}
+        self.str_columns: Dict[str, tuple] = {}
+        self.extras: Dict[int, Dict] = {}
+        self._extra_keys = set()
+
+    def append(self, metadata: Dict):
+        """
+        追加一行元数据
+
+        Args:
+            metadata: 元数据字典
+        """
+        row = self.count
+        for key, value in metadata.items():
+            if key not in self.keys:
+                self.keys.append(key)
+            if value is None:
+                continue
+
+            if key not in self.int_columns and key not in self.str_columns and key not in self._extra_keys:
+                if isinstance(value, int) and not isinstance(value, bool):
+                    self.int_columns[key] = array('q', [MetadataColumns.MISSING_INT]) * row
+                elif isinstance(value, str):
+                    self.str_columns[key] = ({}, array('i', [-1]) * row)
+                else:
+                    self._extra_keys.add(key)
+
+            if key in self.int_columns and isinstance(value, int) and not isinstance(value, bool):
+                self.int_columns[key].append(value)
+            elif key in self.str_columns and isinstance(value, str):
+                vocab, codes = self.str_columns[key]
+                codes.append(vocab.setdefault(value, len(vocab)))
+            else:
+                self._demote(key)
+                self.extras.setdefault(row, {})[key] = value
+
+        self.count += 1
+        # 本行没有的字段补缺失值，保持各列长度一致
+        for column in self.int_columns.values():
+            if len(column) < self.count:
+                column.append(MetadataColumns.MISSING_INT)
+        for _, codes in self.str_columns.values():
+            if len(codes) < self.count:
+                codes.append(-1)
+
+    def _demote(self, key: str):
+        """将已有的整数列或字符串列转为 extras 存储"""
+        self._extra_keys.add(key)
+        if key in self.int_columns:
+            for row, value in enumerate(self.int_columns.pop(key)):
+                if value != MetadataColumns.MISSING_INT:
+                    self.extras.setdefault(row, {})[key] = value
+        elif key in self.str_columns:
+            vocab, codes = self.str_columns.pop(key)
+            words = list(vocab)
+            for row, code in enumerate(codes):
+                if code >= 0:
+                    self.extras.setdefault(row, {})[key] = words[code]
+
+    def build(self) -> MetadataColumns:
+        """
+        生成列式元数据
+
+        Returns:
+            列式元数据
+        """
+        return MetadataColumns(
+            self.count,
+            list(self.keys),
+            {key: np.frombuffer(column, dtype=np.int64) for key, column in self.int_columns.items()},
+            {key: (list(vocab), np.frombuffer(codes, dtype=np.int32))
+             for key, (vocab, codes) in self.str_columns.items()},
+            self.extras
+        )
+
+
+class RowIds:
+    """
+    index_to_docstore_id 的替代：FAISS行号 i 对应的文档ID就是 i
+
+    实现FAISS用到的映射接口，但不为每一行保存任何对象。
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.count:
+            raise KeyError(i)
+        return i
+
+    def get(self, i: int, default=None):
+        return i if 0 <= i < self.count else default
+
+    def __contains__(self, i) -> bool:
+        return isinstance(i, (int, np.integer)) and 0 <= i < self.count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.count))
+
+    def keys(self):
+        return range(self.count)
+
+    def values(self):
+        return range(self.count)
+
+    def items(self):
+        return ((i, i) for i in range(self.count))
+
+
+class ChunkTable(Docstore):
+    """
+    列式文本块表，可直接替换FAISS的InMemoryDocstore（只读）
+
+    文本内容存放在ChunkStore文件中（可压缩也可不压缩），元数据以列式数组随FAISS的index.pkl保存。
+    """
+
+    def __init__(self, metadata: MetadataColumns, chunk_store: Optional[ChunkStore] = None):
+        """
+        初始化文本块表
+
+        Args:
+            metadata: 列式元数据
+            chunk_store: 文本块内容（反序列化后通过 attach 挂载）
+        """
+        self.metadata = metadata
+        self.chunk_store = chunk_store
+
+    @classmethod
+    def from_docstore(cls, docstore: Docstore, doc_ids: List, codec: Optional[str] = None) -> 'ChunkTable':
+        """
+        将现有文档存储按FAISS行号顺序转换为文本块表
+
+        Args:
+            docstore: 原文档存储（如InMemoryDocstore）
+            doc_ids: 每一行对应的文档ID（即 index_to_docstore_id 中的值）
+            codec: 文本压缩算法，"none" 表示不压缩，None表示使用默认压缩算法
+
+        Returns:
+            文本块表
+        """
+        docs = [docstore.search(doc_id) for doc_id in doc_ids]
+        chunk_store = ChunkStore.build([doc.page_content for doc in docs], codec=codec)
+        return cls(MetadataColumns.build([doc.metadata for doc in docs]), chunk_store)
+
+    def attach(self, load_path: str):
+        """
+        挂载目录中的文本块数据文件
+
+        Args:
+            load_path: 向量存储目录
+        """
+        self.chunk_store = ChunkStore.open(load_path)
+
+    def __len__(self) -> int:
+        return self.metadata.count
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        """
+        按行号构建Document对象
+
+        Args:
+            search: 行号（即文档ID），也接受数字字符串；其他ID（如旧索引的UUID）视为不存在
+
+        Returns:
+            Document对象；行号不存在时返回提示字符串（与InMemoryDocstore一致）
+        """
+        try:
+            row = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= row < self.metadata.count:
+            return f"ID {search} not found."
+        return Document(page_content=self.chunk_store.get(row), metadata=self.metadata.row(row))
+
+    def __getstate__(self):
+        # 文本内容保存在ChunkStore文件中，不写入pickle
+        return {"metadata": self.metadata}
+
+    def __setstate__(self, state):
+        self.__init__(state["metadata"])
+
+
+def _measure(build) -> tuple:
+    """返回 (对象, 构建过程中Python堆内存净增长字节数)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def memory_report(scales: List[int] = (10, 100, 1000)):
+    """
+    对比加载后每个文本块的常驻内存：Document对象 + UUID映射 vs 列式文本块表
+
+    语料由 data/hr_policy.txt 的文本块复制 scale 份生成。两种结构都从pickle加载，
+    列式表的文本缓冲区通过内存映射读取，单独列出其字节数。
+
+    Args:
+        scales: 语料放大倍数列表
+    """
+    import tempfile
+    import uuid
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from document_loader import DocumentLoader
+
+    print("=" * 60)
+    print("文本块内存占用报告")
+    print("=" * 60)
+
+    file_path = os.path.join(os.path.dirname(__file__), "data", "hr_policy.txt")
+    base_chunks = DocumentLoader(chunk_size=500, chunk_overlap=75).load_and_split(file_path)
+
+    rows = []
+    for scale in scales:
+        docs = [
+            Document(
+                page_content=f"{chunk.page_content}\n（第{copy}版修订）",
+                metadata=dict(chunk.metadata, source=f"hr_policy_{copy % 50}.txt")
+            )
+            for copy in range(scale)
+            for chunk in base_chunks
+        ]
+        ids = [str(uuid.uuid4()) for _ in docs]
+        docstore = InMemoryDocstore(dict(zip(ids, docs)))
+        mapping = dict(enumerate(ids))
+        text_bytes = sum(len(doc.page_content.encode('utf-8')) for doc in docs)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline_path = os.path.join(tmp, "baseline.pkl")
+            with open(baseline_path, 'wb') as f:
+                pickle.dump((docstore, mapping), f)
+
+            table = ChunkTable.from_docstore(docstore, ids, codec="none")
+            table.chunk_store.save(tmp)
+            table_path = os.path.join(tmp, "table.pkl")
+            with open(table_path, 'wb') as f:
+                pickle.dump((table, RowIds(len(ids))), f)
+
+            def load_baseline():
+                with open(baseline_path, 'rb') as f:
+                    return pickle.load(f)
+
+            def load_table():
+                with open(table_path, 'rb') as f:
+                    loaded, row_ids = pickle.load(f)
+                loaded.attach(tmp)
+                return loaded, row_ids
+
+            baseline, baseline_bytes = _measure(load_baseline)
+            (loaded, row_ids), table_bytes = _measure(load_table)
+
+            # 抽查：两种结构返回的文档一致
+            for i in range(0, len(ids), max(1, len(ids) // 100)):
+                expected = baseline[0].search(baseline[1][i])
+                actual = loaded.search(row_ids[i])
+                assert (expected.page_content, expected.metadata) == (actual.page_content, actual.metadata)
+
+            start = time.perf_counter()
+            for i in range(len(ids)):
+                loaded.search(i)
+            hit_seconds = (time.perf_counter() - start) / len(ids)
+
+            buffer_bytes = len(loaded.chunk_store.data) + len(loaded.chunk_store.offsets) * 8
+            rows.append((len(ids), text_bytes, baseline_bytes, table_bytes, buffer_bytes, hit_seconds))
+            loaded.chunk_store.close()
+
+    print(f"{'文本块数':>10} {'原文(B/块)':>11} {'Document(B/块)':>15} {'列式表(B/块)':>13} "
+          f"{'文本缓冲(B/块)':>15} {'节省':>7} {'命中物化(µs)':>13}")
+    for n, text_bytes, baseline_bytes, table_bytes, buffer_bytes, hit in rows:
+        print(f"{n:>10} {text_bytes / n:>11.0f} {baseline_bytes / n:>15.0f} {table_bytes / n:>13.0f} "
+              f"{buffer_bytes / n:>15.0f} {baseline_bytes / max(1, table_bytes + buffer_bytes):>6.1f}x "
+              f"{hit * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    memory_report()
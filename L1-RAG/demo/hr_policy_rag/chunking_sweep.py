@@ -0,0 +1,288 @@
+"""
+分块参数扫描模块：在 CHUNK_SIZE × CHUNK_OVERLAP 网格上重建索引并评估，用数据选择分块参数
+
+核心知识点：
+1. 分块大小的多重影响：块越大，索引越小、Embedding调用越少，但每个检索结果携带的无关文本越多，
+   Prompt Token越多；块越小，答案越容易被切断或淹没在大量相似的小块中
+2. 与分块无关的标注：不同分块参数下文本块ID各不相同，因此评估集标注的是答案所在的原文片段（evidence），
+   每种配置下包含该片段的文本块就是这组配置的标准答案块（gold chunk）
+3. recall@k：检索到的前 k 个文本块覆盖了多少个答案片段；片段被切断、不完整地落在任何一个块中时记为未召回
+4. 向量缓存：扫描时反复向量化同一语料，使用本地后端或带缓存的Embedding，重复运行时不产生额外调用
+"""
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from langchain.schema import Document
+from document_loader import DocumentLoader
+from embedding_backends import LOCAL_HASH_MODEL, create_embeddings
+from token_counter import TokenCounter
+from vector_store import VectorStoreManager
+
+
+def read_labeled_questions(path: str) -> List[Dict]:
+    """
+    读取标注评估集
+
+    JSONL格式，每行包含 question 和 evidence（答案所在的原文片段列表），可选 id。
+
+    Args:
+        path: 评估集文件路径
+
+    Returns:
+        评估问题列表，每项包含 id、question、evidence
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    questions = []
+    for i, row in enumerate(rows, 1):
+        evidence = row.get("evidence") or []
+        if isinstance(evidence, str):
+            evidence = [evidence]
+        if not row.get("question") or not evidence:
+            raise ValueError(f"评估集第 {i} 行缺少 question 或 evidence")
+        question_id = row.get("id")
+        questions.append({"id": str(i if question_id is None else question_id), "question": row["question"],
+                          "evidence": evidence})
+    return questions
+
+
+def _normalize(text: str) -> str:
+    """去除空白后再比较，避免分块时换行位置不同影响匹配"""
+    return re.sub(r'\s+', '', text)
+
+
+def gold_chunk_ids(documents: List[Document], evidence: str) -> List[int]:
+    """
+    找出完整包含答案片段的文本块
+
+    Args:
+        documents: 当前分块配置下的全部文本块
+        evidence: 答案片段
+
+    Returns:
+        文本块在列表中的序号
+    """
+    target = _normalize(evidence)
+    return [i for i, doc in enumerate(documents) if target in _normalize(doc.page_content)]
+
+
+class ChunkingSweep:
+    """分块参数扫描器"""
+
+    def __init__(
+        self,
+        data_dir: str,
+        questions: List[Dict],
+        embedding_model: str = "local-hash",
+        cache_path: Optional[str] = None,
+        k: int = 3,
+        hierarchical: bool = False,
+        model_name: str = "gpt-3.5-turbo"
+    ):
+        """
+        初始化扫描器
+
+        Args:
+            data_dir: 文档目录
+            questions: 标注评估集（见 read_labeled_questions）
+            embedding_model: Embedding模型名称，"local-hash" 为本地后端
+            cache_path: 向量缓存的SQLite文件路径（云端模型建议开启）
+            k: recall@k 中的 k，也是每个问题检索的文本块数量
+            hierarchical: 是否使用分层检索（与线上配置保持一致）
+            model_name: 计算上下文Token数所用的模型名称
+        """
+        self.file_paths = [
+            os.path.join(data_dir, filename)
+            for filename in sorted(os.listdir(data_dir))
+            if filename.endswith(('.txt', '.pdf', '.md'))
+        ]
+        self.questions = questions
+        self.embedding_model = embedding_model
+        self.cache_path = cache_path
+        self.k = k
+        self.hierarchical = hierarchical
+        self.token_counter = TokenCounter(model_name)
+
+        # 所有配置共用一个Embedding实例（本地后端的投影矩阵只初始化一次，缓存也只打开一次）
+        self.embeddings = create_embeddings(embedding_model, cache_path)
+
+    def evaluate(self, chunk_size: int, chunk_overlap: int) -> Dict:
+        """
+        按一组分块参数重建索引并评估
+
+        Args:
+            chunk_size: 文本块大小
+            chunk_overlap: 文本块重叠大小
+
+        Returns:
+            评估结果：文本块数、recall@k、平均上下文Token数、索引字节数、构建耗时等
+        """
+        # 构建过程的逐步输出对扫描没有意义，只保留最终表格
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            documents = []
+            for file_path in self.file_paths:
+                documents.extend(loader.load_and_split(file_path))
+
+            manager = VectorStoreManager(embeddings=self.embeddings, hierarchical=self.hierarchical)
+            manager.create_vector_store(documents)
+            build_seconds = time.perf_counter() - started
+
+        # 索引字节数：按线上方式保存一个快照后统计磁盘占用
+        tmp = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                version = manager.save_vector_store(tmp)
+            snapshot_dir = os.path.join(tmp, "snapshots", version)
+            index_bytes = sum(
+                os.path.getsize(os.path.join(snapshot_dir, name)) for name in os.listdir(snapshot_dir)
+            )
+        finally:
+            manager.vector_store.docstore.chunk_store.close()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        retrieved = manager.batch_similarity_search([item["question"] for item in self.questions], k=self.k)
+
+        found, total, unreachable, context_tokens, hits = 0, 0, 0, 0, 0
+        for item, docs in zip(self.questions, retrieved):
+            contents = [_normalize(doc.page_content) for doc in docs]
+            covered = 0
+            for evidence in item["evidence"]:
+                total += 1
+                if not gold_chunk_ids(documents, evidence):
+                    unreachable += 1
+                if any(_normalize(evidence) in content for content in contents):
+                    covered += 1
+            found += covered
+            hits += covered == len(item["evidence"])
+            context_tokens += self.token_counter.count("\n\n".join(doc.page_content for doc in docs))
+
+        return {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "num_chunks": len(documents),
+            f"recall@{self.k}": found / max(1, total),
+            "full_hit_rate": hits / max(1, len(self.questions)),
+            "unreachable_evidence": unreachable,
+            "avg_context_tokens": context_tokens / max(1, len(self.questions)),
+            "index_bytes": index_bytes,
+            "build_seconds": build_seconds,
+        }
+
+    def run(self, chunk_sizes: List[int], chunk_overlaps: List[int]) -> List[Dict]:
+        """
+        扫描参数网格（重叠不小于块大小的组合跳过）
+
+        Args:
+            chunk_sizes: 文本块大小列表
+            chunk_overlaps: 文本块重叠大小列表
+
+        Returns:
+            每组参数一行的评估结果
+        """
+        results = []
+        for chunk_size in chunk_sizes:
+            for chunk_overlap in chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                print(f"🔄 评估 chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+                results.append(self.evaluate(chunk_size, chunk_overlap))
+        return results
+
+    def print_results(self, results: List[Dict]):
+        """打印评估表格，recall最高的配置标记为 ★"""
+        recall_key = f"recall@{self.k}"
+        best = max(results, key=lambda row: (row[recall_key], -row["avg_context_tokens"]), default=None)
+
+        print(f"\n{'块大小':>6} {'重叠':>5} {'块数':>6} {recall_key:>9} {'全部命中':>8} {'切断片段':>8} "
+              f"{'上下文Token':>11} {'索引(KB)':>9} {'构建(s)':>8}")
+        for row in results:
+            mark = " ★" if row is best else ""
+            print(f"{row['chunk_size']:>6} {row['chunk_overlap']:>5} {row['num_chunks']:>6} "
+                  f"{row[recall_key]:>9.3f} {row['full_hit_rate']:>8.3f} {row['unreachable_evidence']:>8} "
+                  f"{row['avg_context_tokens']:>11.0f} {row['index_bytes'] / 1024:>9.1f} "
+                  f"{row['build_seconds']:>8.2f}{mark}")
+
+
+def run_sweep(
+    chunk_sizes: List[int],
+    chunk_overlaps: List[int],
+    questions_path: str,
+    output_path: str,
+    embedding_model: str = "local-hash",
+    k: int = 3
+) -> List[Dict]:
+    """
+    扫描命令：评估参数网格，打印表格并把结果写入JSON
+
+    Args:
+        chunk_sizes: 文本块大小列表
+        chunk_overlaps: 文本块重叠大小列表
+        questions_path: 标注评估集路径
+        output_path: JSON结果文件路径
+        embedding_model: Embedding模型名称
+        k: recall@k 中的 k
+
+    Returns:
+        评估结果
+    """
+    from config import Config
+
+    print("=" * 60)
+    print("分块参数扫描")
+    print("=" * 60)
+
+    sweep = ChunkingSweep(
+        Config.DATA_DIR,
+        read_labeled_questions(questions_path),
+        embedding_model=embedding_model,
+        cache_path=None if embedding_model == LOCAL_HASH_MODEL else Config.EMBEDDING_CACHE_PATH,
+        k=k,
+        hierarchical=Config.HIERARCHICAL_RETRIEVAL,
+        model_name=Config.OPENAI_MODEL
+    )
+    results = sweep.run(chunk_sizes, chunk_overlaps)
+    sweep.print_results(results)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "embedding_model": embedding_model,
+            "k": k,
+            "questions": questions_path,
+            "current": {"chunk_size": Config.CHUNK_SIZE, "chunk_overlap": Config.CHUNK_OVERLAP},
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入: {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import Config
+
+    def int_list(value: str) -> List[int]:
+        return [int(item) for item in value.split(",") if item]
+
+    parser = argparse.ArgumentParser(description="分块参数扫描（CHUNK_SIZE × CHUNK_OVERLAP）")
+    parser.add_argument("--sizes", type=int_list, default=[60, 100, 200, 500, 1000], help="文本块大小，逗号分隔")
+    parser.add_argument("--overlaps", type=int_list, default=[0, 20, 75], help="重叠大小，逗号分隔")
+    parser.add_argument("--questions", default=os.path.join(Config.DATA_DIR, "eval_questions.jsonl"),
+                        help="标注评估集（JSONL，包含 question 和 evidence）")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "storage", "chunking_sweep.json"),
+                        help="JSON结果文件")
+    parser.add_argument("--embedding", default="local-hash",
+                        help="Embedding模型（默认本地后端；云端模型会使用向量缓存）")
+    parser.add_argument("-k", type=int, default=Config.TOP_K, help="每个问题检索的文本块数量")
+    args = parser.parse_args()
+
+    run_sweep(args.sizes, args.overlaps, args.questions, args.output, embedding_model=args.embedding, k=args.k)
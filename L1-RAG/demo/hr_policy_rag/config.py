@@ -17,6 +17,10 @@ class Config:
     
     # 向量数据库配置
     VECTOR_STORE_PATH = os.path.join(os.path.dirname(__file__), "storage", "vectorstore")
+    INDEX_VERSION = os.getenv("INDEX_VERSION", "latest")  # 加载的快照版本，"latest"或固定版本号
+    SNAPSHOT_RETENTION = 5  # 保留的历史快照数量
+    COMPRESS_CHUNKS = True  # 是否以字典压缩形式存储文本块内容
+    KB_BUNDLE_PATH = os.getenv("KB_BUNDLE_PATH")  # 单文件知识库包（导出：python kb_bundle.py export），设置后优先于快照加载
     
     # 文档配置
     DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
@@ -25,16 +29,88 @@ class Config:
     CHUNK_SIZE = 500  # 每个文本块的大小（字符数）
     CHUNK_OVERLAP = 75  # 文本块之间的重叠字符数
     
+    # 入库流水线配置
+    INGEST_PIPELINE = True  # 是否使用流式入库（加载分块、向量化、写入索引重叠执行）
+    INGEST_LOAD_WORKERS = 2  # 加载分块的进程数
+    INGEST_EMBED_WORKERS = 4  # 并发调用Embedding接口的线程数
+    INGEST_BATCH_SIZE = 64  # 每次Embedding调用的文本块数量
+    INGEST_QUEUE_SIZE = 8  # 阶段间队列容量（批），决定内存中最多积压的文本块数
+    
+    # 外存构建配置：语料无法放入内存时，向量先落盘，再在样本上训练IVF-PQ并分批写入索引
+    OUT_OF_CORE_BUILD = os.getenv("OUT_OF_CORE_BUILD", "0") == "1"
+    OUT_OF_CORE_WORK_DIR = os.path.join(os.path.dirname(__file__), "storage", "build")
+    IVF_NLIST = 4096  # IVF簇数量（语料较小时自动减少）
+    IVF_NPROBE = 16  # 检索时扫描的簇数量
+    PQ_M = 64  # 每个向量的PQ编码字节数
+    PQ_BITS = 8  # 每个PQ子空间的编码位数
+    OUT_OF_CORE_ADD_BATCH = 10000  # 每次写入索引的向量数量
+    OUT_OF_CORE_TRAIN_SAMPLES = 100000  # 训练簇中心和码本的样本数量
+    
     # 检索配置
     TOP_K = 3  # 检索返回的最相关文档数量
+    HIERARCHICAL_RETRIEVAL = True  # 是否先选章节再检索章节内的文本块
+    TOP_SECTIONS = 3  # 分层检索第一级保留的章节数量
+    CASCADE_SEARCH = os.getenv("CASCADE_SEARCH", "0") == "1"  # 二值编码选候选 + 浮点向量精排（优先于分层检索）
+    CASCADE_CANDIDATES = 400  # 级联检索第一级保留的候选数量
+    
+    # FAQ答案索引配置（离线生成：python faq_index.py）
+    FAQ_INDEX_PATH = os.path.join(os.path.dirname(__file__), "storage", "faq")
+    FAQ_MATCH_THRESHOLD = 0.92  # 用户问题与标准问题的最低余弦相似度
+    FAQ_QUESTIONS = [
+        "年假如何申请？需要提前几天？",
+        "产假有多少天？工资怎么发？",
+        "工资什么时候发放？",
+        "试用期是多长时间？",
+    ]
+    
+    # LLM响应缓存配置（Prompt、模型、温度完全相同时复用回答）
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+    LLM_CACHE_PATH = os.path.join(os.path.dirname(__file__), "storage", "llm_cache.sqlite3")
+    LLM_CACHE_MAX_ENTRIES = 10000  # 最多缓存的回答数量，超出后淘汰最久未使用的条目
+    
+    # Token预算配置
+    MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "3000"))  # 单次请求的Prompt Token上限，超出时裁剪上下文
+    SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0")) or None  # 会话累计Token上限，0表示不限制
+    TOKEN_PRICES = (0.0005, 0.0015)  # 每1K Token价格（美元）：Prompt、回答
+    
+    # 上下文压缩配置：只保留与问题相关的句子（默认关闭；开启前用 python context_compressor.py 在评估集上确认证据句仍被保留）
+    CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "0") == "1"
+    CONTEXT_MAX_TOKENS = 600  # 压缩后上下文句子的Token预算
+    
+    # 延迟SLO配置：截止时间内没有收到首Token时返回原文摘录（0表示不设截止时间）
+    SLO_DEADLINE_SECONDS = float(os.getenv("SLO_DEADLINE_SECONDS", "0")) or None
+    SLO_CHUNK_TIMEOUT_SECONDS = float(os.getenv("SLO_CHUNK_TIMEOUT_SECONDS", "10"))  # 收到首Token后相邻片段的最长间隔
+    EXCERPT_MAX_TOKENS = 200  # 原文摘录的Token预算
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))  # 单次LLM请求的HTTP超时
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # LLM请求失败时的重试次数
+    
+    # 启动配置：知识库在后台加载，就绪前的问题 "lexical" 用FAQ/关键词检索降级回答，"wait" 排队等待
+    STARTUP_FALLBACK = os.getenv("STARTUP_FALLBACK", "lexical")
+    
+    # 批量问答配置
+    BATCH_CONCURRENCY = 8  # 并发生成回答的线程数
+    BATCH_RETRIEVAL_SIZE = 32  # 每次批量检索的问题数量
     
     # Embedding配置
-    EMBEDDING_MODEL = "text-embedding-3-small"  # OpenAI的embedding模型
+    # OpenAI的embedding模型；设为 "local-hash" 使用本地CPU后端（无需网络，适合离线和批量重建索引）
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    # 向量缓存（SQLite）：分块参数扫描等反复重建索引的场景下，相同文本只调用一次Embedding接口
+    EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(__file__), "storage", "embedding_cache.sqlite3")
+    # 向量降维：0表示保存全维向量；"truncate" 为前缀截断（适合text-embedding-3系列），"pca" 在语料上拟合
+    EMBEDDING_REDUCED_DIM = int(os.getenv("EMBEDDING_REDUCED_DIM", "0")) or None
+    EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "truncate")
+    # Embedding接口限额（0表示不限），在线迁移只占用其中 MIGRATION_RATE_SHARE 的比例
+    EMBEDDING_RATE_LIMIT_RPM = int(os.getenv("EMBEDDING_RATE_LIMIT_RPM", "3000")) or None
+    EMBEDDING_RATE_LIMIT_TPM = int(os.getenv("EMBEDDING_RATE_LIMIT_TPM", "1000000")) or None
+    MIGRATION_RATE_SHARE = float(os.getenv("MIGRATION_RATE_SHARE", "0.2"))
+    MIGRATION_BATCH_SIZE = 64  # 迁移时每次Embedding调用的文本块数量
+    # 快照由其他Embedding模型构建（如迁移后尚未修改 EMBEDDING_MODEL）时改用快照记录的模型加载；默认拒绝加载
+    EMBEDDING_FOLLOW_SNAPSHOT = os.getenv("EMBEDDING_FOLLOW_SNAPSHOT", "0") == "1"
     
     @classmethod
     def validate(cls):
-        """验证配置是否完整"""
-        if not cls.OPENAI_API_KEY:
-            raise ValueError("请设置OPENAI_API_KEY环境变量")
+        """验证配置是否完整：只有使用OpenAI的Embedding模型时才要求API密钥（本地哈希后端可离线启动）"""
+        if cls.EMBEDDING_MODEL != "local-hash" and not cls.OPENAI_API_KEY:
+            raise ValueError("请设置OPENAI_API_KEY环境变量（或设置 EMBEDDING_MODEL=local-hash 使用本地Embedding后端）")
         return True
 
@@ -0,0 +1,216 @@
+"""
+上下文压缩模块：在检索和生成之间只保留与问题相关的句子，减少Prompt Token
+
+核心知识点：
+1. 抽取式压缩：按"。！？"和换行把文本块切成句子，只挑选相关的句子原文放入上下文，
+   不改写内容，引用来源（文件、章节、文本块ID）保持不变
+2. 同一向量空间打分：词面重叠（问题的字符二元组在句子中出现的比例）+ 句子与问题的余弦相似度；
+   句子使用知识库的Embedding模型（含降维），问题直接复用检索时缓存的查询向量，不调用LLM
+3. 预算选择：按分数从高到低选句子直到用完Token预算，再按原文顺序拼回各自的文本块
+"""
+import re
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from token_counter import TokenCounter
+
+
+class ContextCompressor:
+    """查询感知的抽取式上下文压缩器"""
+
+    # 句子切分：以中文句末标点或换行结束
+    SENTENCE_PATTERN = re.compile(r'[^。！？!?\n]+[。！？!?]?')
+    # 同一文本块中不相邻的句子之间用省略号连接，提示模型中间有省略
+    GAP = "……"
+
+    def __init__(
+        self,
+        token_counter: TokenCounter,
+        max_tokens: int = 600,
+        lexical_weight: float = 0.5,
+        vector_manager=None
+    ):
+        """
+        初始化上下文压缩器
+
+        Args:
+            token_counter: Token计数器
+            max_tokens: 压缩后全部句子的Token预算
+            lexical_weight: 词面重叠分数的权重，其余为向量相似度的权重
+            vector_manager: 向量存储管理器（提供与检索相同的Embedding模型和查询向量缓存），None时只按词面重叠打分
+        """
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.lexical_weight = lexical_weight
+        self.vector_manager = vector_manager
+
+    def split_sentences(self, text: str) -> List[str]:
+        """
+        将文本切分为句子
+
+        Args:
+            text: 文本块内容
+
+        Returns:
+            去除首尾空白后的非空句子列表
+        """
+        return [sentence.strip() for sentence in self.SENTENCE_PATTERN.findall(text) if sentence.strip()]
+
+    @staticmethod
+    def _terms(text: str) -> set:
+        """词面特征：小写后的字符二元组（中文没有空格分词，二元组是常用的近似）"""
+        text = re.sub(r'\s+', '', text.lower())
+        return {text[i:i + 2] for i in range(len(text) - 1)} or set(text)
+
+    def score_sentences(self, query: str, sentences: List[str]) -> np.ndarray:
+        """
+        计算每个句子与问题的相关度
+
+        Args:
+            query: 用户问题
+            sentences: 句子列表
+
+        Returns:
+            相关度分数数组
+        """
+        query_terms = self._terms(query)
+        lexical = np.array([
+            len(query_terms & self._terms(sentence)) / max(1, len(query_terms))
+            for sentence in sentences
+        ], dtype=np.float32)
+        if self.vector_manager is None:
+            return lexical
+
+        query_vector = _normalize(self.vector_manager.embed_query(query))
+        sentence_vectors = _normalize(self.vector_manager.embed_texts(sentences))
+        semantic = np.clip(sentence_vectors @ query_vector, 0.0, 1.0)
+
+        return self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic
+
+    def compress(self, query: str, docs: List[Document]) -> List[Document]:
+        """
+        压缩检索到的文本块
+
+        Args:
+            query: 用户问题
+            docs: 检索到的文档列表（按相关度排序）
+
+        Returns:
+            与 docs 一一对应的压缩后文档；没有句子入选的文档内容为空字符串
+        """
+        sentences, owners = [], []
+        for doc_index, doc in enumerate(docs):
+            for sentence in self.split_sentences(doc.page_content):
+                sentences.append(sentence)
+                owners.append(doc_index)
+
+        if not sentences:
+            return list(docs)
+
+        scores = self.score_sentences(query, sentences)
+
+        # 按分数从高到低选择句子，直到用完预算（分数最高的句子总是入选）
+        selected = set()
+        used_tokens = 0
+        for i in np.argsort(-scores, kind="stable"):
+            tokens = self.token_counter.count(sentences[i])
+            if selected and used_tokens + tokens > self.max_tokens:
+                continue
+            selected.add(int(i))
+            used_tokens += tokens
+
+        # 按原文顺序拼回各自的文本块，不相邻的句子之间插入省略号
+        parts: List[List[str]] = [[] for _ in docs]
+        last_index: List[Optional[int]] = [None for _ in docs]
+        for i in sorted(selected):
+            doc_index = owners[i]
+            if last_index[doc_index] is not None and last_index[doc_index] != i - 1:
+                parts[doc_index].append(self.GAP)
+            parts[doc_index].append(sentences[i])
+            last_index[doc_index] = i
+
+        return [
+            Document(page_content="\n".join(part), metadata=doc.metadata)
+            for doc, part in zip(docs, parts)
+        ]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按最后一维归一化（前缀截断、PCA降维后的向量不再是单位长度）"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def evaluate_compression(vector_manager, compressor: ContextCompressor, questions: List[dict], k: int = 3) -> dict:
+    """
+    在标注评估集上对比压缩前后：检索到的证据片段有多少仍保留在上下文中，以及上下文Token数
+
+    Args:
+        vector_manager: 向量存储管理器
+        compressor: 上下文压缩器
+        questions: 评估问题（chunking_sweep.read_labeled_questions 的返回值）
+        k: 检索的文档数量
+
+    Returns:
+        包含证据保留数量和压缩前后Token数的统计字典
+    """
+    def contains(docs: List[Document], evidence: str) -> bool:
+        target = re.sub(r'\s+', '', evidence)
+        return any(target in re.sub(r'\s+', '', doc.page_content) for doc in docs)
+
+    stats = {"evidence": 0, "retrieved": 0, "kept": 0, "tokens_before": 0, "tokens_after": 0}
+    for item in questions:
+        docs = vector_manager.similarity_search(item["question"], k=k)
+        compressed = compressor.compress(item["question"], docs)
+        stats["tokens_before"] += sum(compressor.token_counter.count(doc.page_content) for doc in docs)
+        stats["tokens_after"] += sum(compressor.token_counter.count(doc.page_content) for doc in compressed)
+        for evidence in item["evidence"]:
+            stats["evidence"] += 1
+            if contains(docs, evidence):
+                stats["retrieved"] += 1
+                stats["kept"] += contains(compressed, evidence)
+    return stats
+
+
+def demo_context_compression():
+    """演示上下文压缩：对比压缩前后的上下文Token数，并在评估集上检查证据片段是否被保留"""
+    from config import Config
+    from chunking_sweep import read_labeled_questions
+    from document_loader import DocumentLoader
+    from vector_store import VectorStoreManager
+
+    print("=" * 60)
+    print("上下文压缩演示")
+    print("=" * 60)
+
+    documents = DocumentLoader(chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP).load_and_split(
+        f"{Config.DATA_DIR}/hr_policy.txt"
+    )
+    vector_manager = VectorStoreManager(embedding_model="local-hash")
+    vector_manager.create_vector_store(documents)
+
+    counter = TokenCounter(Config.OPENAI_MODEL)
+    compressor = ContextCompressor(counter, max_tokens=Config.CONTEXT_MAX_TOKENS, vector_manager=vector_manager)
+
+    for question in Config.FAQ_QUESTIONS:
+        docs = vector_manager.similarity_search(question, k=Config.TOP_K)
+        compressed = compressor.compress(question, docs)
+        before = sum(counter.count(doc.page_content) for doc in docs)
+        after = sum(counter.count(doc.page_content) for doc in compressed)
+        print(f"\n❓ {question}")
+        print(f"📉 上下文Token: {before} → {after}")
+        for doc in compressed:
+            if doc.page_content:
+                print(f"  [{doc.metadata.get('section', doc.metadata.get('source'))}] "
+                      f"{doc.page_content[:80].replace(chr(10), ' ')}")
+
+    questions = read_labeled_questions(f"{Config.DATA_DIR}/eval_questions.jsonl")
+    stats = evaluate_compression(vector_manager, compressor, questions, k=Config.TOP_K)
+    print(f"\n📊 评估集（{len(questions)} 个问题，{stats['evidence']} 个证据片段）")
+    print(f"  检索命中的证据: {stats['retrieved']}，压缩后仍保留: {stats['kept']}")
+    print(f"  上下文Token: {stats['tokens_before']} → {stats['tokens_after']}")
+
+
+if __name__ == "__main__":
+    demo_context_compression()
@@ -0,0 +1,247 @@
+"""
+向量降维模块：用更少的维度存储文本块向量，降低索引内存和检索耗时
+
+核心知识点：
+1. 前缀截断（Matryoshka）：text-embedding-3 系列按"前面的维度携带主要信息"训练，
+   直接保留前 d 维再重新归一化即可；无需训练，查询和文档做同样的截断
+2. PCA投影：在语料向量上求协方差矩阵的主成分，投影到方差最大的 d 个方向，
+   适用于任何Embedding模型，但需要先用语料拟合
+3. 召回验证：以全维向量的精确检索结果为标准答案，计算降维后的 recall@k，
+   在内存/速度与召回损失之间做有依据的取舍
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class DimensionReducer:
+    """向量降维器：前缀截断（truncate）或PCA投影（pca），输出均为L2归一化向量"""
+
+    STATE_FILE = "reducer.npz"
+    METHODS = ("truncate", "pca")
+
+    def __init__(self, method: str, dimension: int,
+                 mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None):
+        """
+        初始化降维器
+
+        Args:
+            method: "truncate" 或 "pca"
+            dimension: 目标维度
+            mean: PCA的语料均值向量（fit 后得到）
+            components: PCA的主成分矩阵，形状为 (dimension, 原始维度)
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"不支持的降维方法: {method}，可选: {', '.join(self.METHODS)}")
+        self.method = method
+        self.dimension = dimension
+        self.mean = mean
+        self.components = components
+
+    @property
+    def fitted(self) -> bool:
+        """前缀截断无需拟合；PCA需要先调用 fit"""
+        return self.method == "truncate" or self.components is not None
+
+    @property
+    def description(self) -> str:
+        """写入索引元数据的描述，例如 "pca:256" """
+        return f"{self.method}:{self.dimension}"
+
+    def fit(self, vectors: np.ndarray) -> 'DimensionReducer':
+        """
+        用语料向量拟合PCA（前缀截断直接返回）
+
+        协方差矩阵只有 原始维度×原始维度 大小，与语料规模无关，百万级向量也能在内存中完成。
+        向量数少于目标维度时（如小型示例语料）无法拟合，打印警告后退回前缀截断。
+
+        Args:
+            vectors: 语料向量矩阵
+
+        Returns:
+            降维器本身
+        """
+        if self.method == "truncate":
+            return self
+
+        vectors = np.asarray(vectors, dtype=np.float64)
+        if len(vectors) < self.dimension:
+            # 样本数少于目标维度时协方差矩阵秩不足，多出的主成分没有意义，退回前缀截断
+            print(f"⚠️ PCA拟合至少需要 {self.dimension} 个向量，当前只有 {len(vectors)} 个，改用前缀截断")
+            self.method = "truncate"
+            return self
+
+        self.mean = vectors.mean(axis=0)
+        centered = vectors - self.mean
+        covariance = centered.T @ centered / max(1, len(vectors) - 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        # eigh按特征值升序排列，取最大的 dimension 个
+        order = np.argsort(eigenvalues)[::-1][:self.dimension]
+        self.components = eigenvectors[:, order].T.astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        return self
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        降维并重新归一化
+
+        Args:
+            vectors: 原始向量矩阵
+
+        Returns:
+            形状为 (n, dimension) 的float32矩阵
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "truncate":
+            reduced = vectors[:, :self.dimension]
+        else:
+            if self.components is None:
+                raise ValueError("PCA降维器尚未拟合，请先调用 fit")
+            reduced = (vectors - self.mean) @ self.components.T
+
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return np.ascontiguousarray(reduced / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def save(self, save_path: str):
+        """
+        保存降维器参数
+
+        Args:
+            save_path: 向量存储目录
+        """
+        arrays = {"method": np.array(self.method), "dimension": np.array(self.dimension)}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(os.path.join(save_path, self.STATE_FILE), **arrays)
+
+    @classmethod
+    def load(cls, load_path: str) -> Optional['DimensionReducer']:
+        """
+        加载降维器参数
+
+        Args:
+            load_path: 向量存储目录
+
+        Returns:
+            降维器；索引未降维时返回None
+        """
+        state_path = os.path.join(load_path, cls.STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+
+        with np.load(state_path) as state:
+            return cls(
+                str(state["method"]),
+                int(state["dimension"]),
+                state["mean"] if "mean" in state else None,
+                state["components"] if "components" in state else None
+            )
+
+
+def evaluate_reduction(doc_vectors: np.ndarray, query_vectors: np.ndarray,
+                       dimensions: List[int] = (64, 128, 256, 512), k: int = 10,
+                       methods: List[str] = DimensionReducer.METHODS) -> List[Dict]:
+    """
+    以全维向量的精确检索为标准，评估各降维设置的召回率、检索耗时和索引内存
+
+    Args:
+        doc_vectors: 文本块的全维向量
+        query_vectors: 查询的全维向量
+        dimensions: 待评估的目标维度
+        k: recall@k 中的 k
+        methods: 待评估的降维方法
+
+    Returns:
+        每个设置一行的评估结果
+    """
+    import faiss
+
+    doc_vectors = np.ascontiguousarray(doc_vectors, dtype=np.float32)
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    k = min(k, len(doc_vectors))
+
+    def search(docs: np.ndarray, queries: np.ndarray):
+        index = faiss.IndexFlatL2(docs.shape[1])
+        index.add(docs)
+        # 重复多次取最快的一次，减少计时抖动
+        best = float("inf")
+        for _ in range(5):
+            started = time.perf_counter()
+            _, rows = index.search(queries, k)
+            best = min(best, time.perf_counter() - started)
+        return rows, best / len(queries)
+
+    truth, full_latency = search(doc_vectors, query_vectors)
+    results = [{
+        "method": "full", "dimension": doc_vectors.shape[1], "recall": 1.0,
+        "latency_us": full_latency * 1e6, "index_bytes": doc_vectors.nbytes
+    }]
+
+    for method in methods:
+        for dimension in dimensions:
+            if dimension >= doc_vectors.shape[1] or (method == "pca" and dimension > len(doc_vectors)):
+                continue
+            reducer = DimensionReducer(method, dimension).fit(doc_vectors)
+            reduced_docs = reducer.transform(doc_vectors)
+            rows, latency = search(reduced_docs, reducer.transform(query_vectors))
+            recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(rows, truth)])
+            results.append({
+                "method": method, "dimension": dimension, "recall": float(recall),
+                "latency_us": latency * 1e6, "index_bytes": reduced_docs.nbytes
+            })
+
+    return results
+
+
+def print_evaluation(results: List[Dict], k: int):
+    """打印评估结果"""
+    full = results[0]
+    print(f"{'方法':>8} {'维度':>6} {'recall@' + str(k):>10} {'检索(µs/查询)':>15} {'索引(KB)':>10} {'内存缩减':>8} {'加速':>6}")
+    for row in results:
+        print(f"{row['method']:>8} {row['dimension']:>6} {row['recall']:>10.3f} {row['latency_us']:>15.1f} "
+              f"{row['index_bytes'] / 1024:>10.1f} {full['index_bytes'] / row['index_bytes']:>7.1f}x "
+              f"{full['latency_us'] / row['latency_us']:>5.1f}x")
+
+
+def evaluate_knowledge_base(questions_path: Optional[str] = None, k: int = 10):
+    """
+    评估命令：用当前Embedding模型向量化知识库和评估问题，对比各降维设置
+
+    Args:
+        questions_path: 评估问题文件（JSONL/CSV，格式同批量问答），缺省时使用 Config.FAQ_QUESTIONS
+        k: recall@k 中的 k
+    """
+    from config import Config
+    from batch_runner import read_questions
+    from document_loader import DocumentLoader
+    from embedding_backends import create_embeddings
+
+    print("=" * 60)
+    print("向量降维召回评估")
+    print("=" * 60)
+
+    loader = DocumentLoader(chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP)
+    documents = []
+    for filename in sorted(os.listdir(Config.DATA_DIR)):
+        if filename.endswith(('.txt', '.pdf')):
+            documents.extend(loader.load_and_split(os.path.join(Config.DATA_DIR, filename)))
+
+    if questions_path:
+        questions = [item["question"] for item in read_questions(questions_path)]
+    else:
+        questions = Config.FAQ_QUESTIONS
+
+    embeddings = create_embeddings(Config.EMBEDDING_MODEL)
+    doc_vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    query_vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+
+    print(f"\n文本块: {len(documents)}，评估问题: {len(questions)}，原始维度: {doc_vectors.shape[1]}\n")
+    print_evaluation(evaluate_reduction(doc_vectors, query_vectors, k=k), k)
+
+
+if __name__ == "__main__":
+    import sys
+
+    evaluate_knowledge_base(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -5,14 +5,20 @@
 1. 文档加载：支持多种格式（TXT、PDF、Word等）
 2. 文档分块：将长文档切分为适合向量化的文本块
 3. 分块策略：固定窗口、滑动窗口、按段落分块
+4. 章节结构：按Markdown标题层级切分章节，为每个文本块记录章节路径
 """
 import os
+import re
 from typing import List
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain.schema import Document
 
 
+# Markdown标题行，例如 "## 第三章 请假制度"、"### 3.1 年假规定"
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*$', re.MULTILINE)
+
+
 class DocumentLoader:
     """文档加载器：负责加载和分块文档"""
     
@@ -64,18 +70,67 @@ class DocumentLoader:
         documents = loader.load()
         return documents
     
+    def split_by_headings(self, document: Document) -> List[Document]:
+        """
+        按Markdown标题层级将文档切分为章节
+        
+        每个章节保留自己的标题行，并在元数据中记录完整的章节路径
+        （如"第三章 请假制度 > 3.1 年假规定"），供分层检索和引用使用。
+        只有标题、没有正文的章节（如章标题紧跟节标题）会被跳过。
+        
+        Args:
+            document: 原始文档
+            
+        Returns:
+            章节文档列表；没有标题的文档原样作为一个章节返回
+        """
+        text = document.page_content
+        matches = list(HEADING_PATTERN.finditer(text))
+        
+        # 标题之前的内容（或整篇没有标题的文档）作为无标题章节
+        boundaries = [(0, None)] + [(m.start(), m) for m in matches] + [(len(text), None)]
+        
+        sections = []
+        heading_stack = []  # [(标题级别, 标题文本)]
+        for (start, match), (end, _) in zip(boundaries[:-1], boundaries[1:]):
+            body = text[start:end]
+            if match is not None:
+                level = len(match.group(1))
+                while heading_stack and heading_stack[-1][0] >= level:
+                    heading_stack.pop()
+                heading_stack.append((level, match.group(2)))
+                body_without_heading = body[match.end() - start:]
+            else:
+                body_without_heading = body
+            
+            if not body_without_heading.strip():
+                continue
+            
+            metadata = dict(document.metadata)
+            metadata['section'] = " > ".join(title for _, title in heading_stack)
+            metadata['section_id'] = len(sections)
+            sections.append(Document(page_content=body.strip(), metadata=metadata))
+        
+        return sections
+    
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
         将文档分割成文本块
         
+        先按标题切分章节，再在章节内部分块，保证每个文本块只属于一个章节。
+        
         Args:
             documents: 原始文档列表
             
         Returns:
             分割后的文档块列表
         """
+        sections = []
+        for document in documents:
+            sections.extend(self.split_by_headings(document))
+        
         # 使用RecursiveCharacterTextSplitter进行智能分割
-        chunks = self.text_splitter.split_documents(documents)
+        chunks = self.text_splitter.split_documents(sections)
         
         # 为每个块添加元数据（来源信息）
         for i, chunk in enumerate(chunks):
@@ -138,6 +193,7 @@ def demo_document_loading():
             print(f"\n--- 文本块 {i} ---")
             print(f"内容长度: {len(chunk.page_content)} 字符")
             print(f"来源: {chunk.metadata.get('source', 'unknown')}")
+            print(f"章节: {chunk.metadata.get('section') or '-'}")
             print(f"内容预览: {chunk.page_content[:200]}...")
     else:
         print(f"❌ 文件不存在: {file_path}")
@@ -0,0 +1,273 @@
+"""
+Embedding后端模块：统一创建云端或本地的Embedding模型
+
+核心知识点：
+1. 可插拔后端：所有后端都实现LangChain的 Embeddings 接口（embed_documents / embed_query），
+   通过 Config.EMBEDDING_MODEL 选择，向量存储和检索代码无需关心具体实现
+2. 特征哈希 + 随机投影：把字符和相邻字符对哈希到固定维度的稀疏计数向量，
+   再乘以固定种子生成的随机矩阵降到稠密低维（Johnson-Lindenstrauss引理保证距离近似保持），
+   整批文本一次矩阵乘法完成，无需网络，适合离线环境、CI和大规模重建索引
+3. 后端标识：索引元数据记录构建它的后端，不同后端的向量空间互不兼容，加载时必须一致
+4. 向量缓存：以"后端标识 + 文本"的哈希为键把向量存入SQLite，反复重建索引（如调参实验）时
+   相同文本块只调用一次Embedding接口
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# 本地哈希后端在 Config.EMBEDDING_MODEL 中的名称
+LOCAL_HASH_MODEL = "local-hash"
+
+
+class HashingEmbeddings(Embeddings):
+    """本地CPU Embedding：字符n-gram特征哈希 + 随机投影"""
+
+    # 乘法哈希常数（Knuth）
+    _MULTIPLIER = np.uint64(2654435761)
+    _BIGRAM_SHIFT = np.uint64(21)  # Unicode码点不超过21位
+
+    def __init__(self, dimension: int = 256, n_features: int = 2 ** 15, seed: int = 0, batch_size: int = 256):
+        """
+        初始化本地Embedding模型
+
+        Args:
+            dimension: 输出向量维度
+            n_features: 哈希特征空间大小
+            seed: 随机投影矩阵的种子（相同参数在任何机器上得到相同的向量）
+            batch_size: 每次矩阵乘法处理的文本数量，控制内存占用
+        """
+        self.dimension = dimension
+        self.n_features = n_features
+        self.seed = seed
+        self.batch_size = batch_size
+
+        # 稀疏随机投影：每个特征对应一行 ±1/sqrt(dimension)
+        rng = np.random.default_rng(seed)
+        signs = rng.integers(0, 2, size=(n_features, dimension), dtype=np.int8) * 2 - 1
+        self.projection = signs.astype(np.float32) / np.float32(np.sqrt(dimension))
+
+    @property
+    def backend_id(self) -> str:
+        """后端标识：参数不同的本地模型产生的向量也不兼容"""
+        return f"{LOCAL_HASH_MODEL}:dim={self.dimension},features={self.n_features},seed={self.seed}"
+
+    def _hash_features(self, texts: List[str]):
+        """
+        计算整批文本的哈希特征
+
+        Returns:
+            (每个特征所属的文本序号, 特征编号)
+        """
+        codes = [np.frombuffer(text.lower().encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+                 for text in texts]
+        lengths = np.array([len(c) for c in codes], dtype=np.int64)
+        if lengths.sum() == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        chars = np.concatenate(codes)
+        owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        # 单字特征
+        unigrams = (chars * self._MULTIPLIER) % np.uint64(self.n_features)
+
+        # 相邻字符对特征（不跨越文本边界）
+        same_text = owners[1:] == owners[:-1]
+        pairs = (chars[:-1] << self._BIGRAM_SHIFT) | chars[1:]
+        bigrams = ((pairs + np.uint64(1)) * self._MULTIPLIER) % np.uint64(self.n_features)
+
+        features = np.concatenate([unigrams, bigrams[same_text]]).astype(np.int64)
+        feature_owners = np.concatenate([owners, owners[:-1][same_text]])
+        return feature_owners, features
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """一批文本：哈希计数矩阵 × 投影矩阵，再做L2归一化"""
+        owners, features = self._hash_features(texts)
+        counts = np.bincount(owners * self.n_features + features, minlength=len(texts) * self.n_features)
+        # 次线性词频，削弱高频字符的影响
+        counts = np.log1p(counts.astype(np.float32)).reshape(len(texts), self.n_features)
+
+        vectors = counts @ self.projection
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        批量向量化，返回 float32 矩阵
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            形状为 (len(texts), dimension) 的矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack([
+            self._embed_batch(texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化文档"""
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """向量化查询"""
+        return self.embed_array([text])[0].tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """带SQLite持久化缓存的Embedding包装器，后端标识与被包装的后端相同"""
+
+    def __init__(self, embeddings: Embeddings, db_path: str):
+        """
+        初始化缓存包装器
+
+        Args:
+            embeddings: 被包装的Embedding模型
+            db_path: SQLite数据库文件路径
+        """
+        self.embeddings = embeddings
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    @property
+    def backend_id(self) -> str:
+        """缓存不改变向量，索引元数据中记录被包装后端的标识"""
+        return embedding_backend_id(self.embeddings)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.backend_id}\0{text}".encode('utf-8')).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化：命中缓存的直接返回，其余合并为一次调用"""
+        keys = [self._key(text) for text in texts]
+        conn = self._connect()
+        cached = {}
+        # SQLite单条语句的参数个数有上限，分批查询
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            cached.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+
+        # 同一批次中重复的文本只向量化一次
+        first = {key: i for i, key in reversed(list(enumerate(keys)))}
+        missing = [i for key, i in first.items() if key not in cached]
+        if missing:
+            vectors = np.asarray(self.embeddings.embed_documents([texts[i] for i in missing]), dtype=np.float32)
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)",
+                [(keys[i], vector.tobytes()) for i, vector in zip(missing, vectors)]
+            )
+            for i, vector in zip(missing, vectors):
+                cached[keys[i]] = vector
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """向量化查询（与文档共用缓存）"""
+        return self.embed_documents([text])[0]
+
+
+def create_embeddings(model_name: str, cache_path: Optional[str] = None) -> Embeddings:
+    """
+    按模型名称创建Embedding后端
+
+    Args:
+        model_name: "local-hash" 使用本地CPU后端，其他名称视为OpenAI Embedding模型
+        cache_path: 向量缓存的SQLite文件路径，None表示不缓存
+
+    Returns:
+        Embedding模型
+    """
+    if model_name == LOCAL_HASH_MODEL:
+        embeddings = HashingEmbeddings()
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(
+            model=model_name,
+            openai_api_key=os.getenv("OPENAI_API_KEY")
+        )
+
+    if cache_path:
+        return CachedEmbeddings(embeddings, cache_path)
+    return embeddings
+
+
+def embedding_backend_id(embeddings: Embeddings) -> str:
+    """
+    获取Embedding后端标识（写入索引元数据，加载时校验）
+
+    Args:
+        embeddings: Embedding模型
+
+    Returns:
+        后端标识字符串
+    """
+    backend_id = getattr(embeddings, "backend_id", None)
+    if backend_id:
+        return backend_id
+    model = getattr(embeddings, "model", None) or type(embeddings).__name__
+    return f"openai:{model}"
+
+
+def benchmark_embeddings(num_texts: int = 20000, text_length: int = 500):
+    """
+    本地后端吞吐量测试
+
+    Args:
+        num_texts: 文本数量
+        text_length: 每个文本的字符数
+    """
+    import time
+
+    print("=" * 60)
+    print("本地Embedding吞吐量测试")
+    print("=" * 60)
+
+    rng = np.random.default_rng(1)
+    alphabet = np.array(list("公司员工年假病假工资考勤制度规定申请审批流程部门经理人事abcdefg0123456789，。"))
+    texts = ["".join(rng.choice(alphabet, size=text_length)) for _ in range(num_texts)]
+
+    embeddings = HashingEmbeddings()
+    started = time.perf_counter()
+    vectors = embeddings.embed_array(texts)
+    elapsed = time.perf_counter() - started
+
+    print(f"后端: {embeddings.backend_id}")
+    print(f"文本数: {num_texts}，向量形状: {vectors.shape}")
+    print(f"耗时: {elapsed:.2f}s，吞吐量: {num_texts / elapsed:.0f} 条/秒")
+
+
+if __name__ == "__main__":
+    benchmark_embeddings()
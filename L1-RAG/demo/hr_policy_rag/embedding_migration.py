@@ -0,0 +1,367 @@
+"""
+Embedding模型在线迁移模块：服务不中断地把知识库切换到新的Embedding模型
+
+核心知识点：
+1. 双索引：旧模型的索引继续服务，后台按索引行号顺序用新模型重新向量化文本块，写入第二个索引；
+   不同模型的向量处在不同的空间中，两个索引的向量从不混合比较
+2. 双读：迁移期间已迁移的文本块（行号 < 进度）在新索引中检索，未迁移的文本块在旧索引中按行号范围检索，
+   两路结果的距离不可比，按名次融合（RRF），每一路的权重等于它覆盖的文本块比例
+3. 限速：迁移只占用Embedding接口限额（每分钟请求数 / Token数）的一部分，剩余限额留给在线查询
+4. 原子切换：全部迁移完成后，新索引保存为新的快照版本并原子发布，服务中的RAG链一次性切换到新索引
+5. 进度与ETA：按最近一段时间的实际迁移速度估算剩余时间
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from kb_bundle import MappedFlatIndex
+from binary_codes import rerank
+from embedding_backends import embedding_backend_id
+from token_counter import TokenCounter
+from vector_store import VectorStoreManager
+
+
+class RateLimiter:
+    """按每分钟请求数和Token数限速（令牌桶，桶容量为一分钟的限额）"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """
+        初始化限速器
+
+        Args:
+            requests_per_minute: 每分钟最多请求数，None表示不限
+            tokens_per_minute: 每分钟最多Token数，None表示不限
+        """
+        self.limits = [limit / 60 if limit else None for limit in (requests_per_minute, tokens_per_minute)]
+        self.available = [limit * 60 if limit else 0.0 for limit in self.limits]
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0, stop: Optional[threading.Event] = None) -> bool:
+        """
+        等待到额度足够时扣除一次请求和 tokens 个Token
+
+        Args:
+            tokens: 本次请求的Token数
+            stop: 可选的停止事件，置位后立即返回
+
+        Returns:
+            是否获得额度（停止时返回False）
+        """
+        cost = [1, tokens]
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for i, rate in enumerate(self.limits):
+                    if rate:
+                        self.available[i] = min(rate * 60, self.available[i] + (now - self._updated) * rate)
+                self._updated = now
+
+                # 单次请求超过一分钟限额时，只要桶满就放行，避免永远等待
+                wait = 0.0
+                for i, rate in enumerate(self.limits):
+                    if rate and self.available[i] < min(cost[i], rate * 60):
+                        wait = max(wait, (min(cost[i], rate * 60) - self.available[i]) / rate)
+                if wait == 0.0:
+                    for i, rate in enumerate(self.limits):
+                        if rate:
+                            self.available[i] -= cost[i]
+                    return True
+
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class EmbeddingMigration:
+    """后台Embedding模型迁移：双索引读取，完成后原子切换"""
+
+    # RRF融合常数
+    RRF_K = 60
+
+    def __init__(
+        self,
+        source: VectorStoreManager,
+        target: VectorStoreManager,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        rate_share: float = 0.2,
+        batch_size: int = 64,
+        on_complete: Optional[Callable[[VectorStoreManager], None]] = None
+    ):
+        """
+        初始化迁移任务
+
+        Args:
+            source: 正在服务的旧模型向量存储管理器（已加载索引）
+            target: 使用新模型的空向量存储管理器
+            requests_per_minute: Embedding接口的每分钟请求数限额
+            tokens_per_minute: Embedding接口的每分钟Token数限额
+            rate_share: 迁移可以占用的限额比例
+            batch_size: 每次Embedding调用的文本块数量
+            on_complete: 迁移完成后的回调，参数为新索引的管理器（在其中发布快照并切换服务）
+        """
+        if source.vector_store is None:
+            raise ValueError("旧索引未加载，无法迁移")
+
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size
+        self.on_complete = on_complete
+        self.limiter = RateLimiter(
+            requests_per_minute * rate_share if requests_per_minute else None,
+            tokens_per_minute * rate_share if tokens_per_minute else None
+        )
+        self.token_counter = TokenCounter(getattr(target.embeddings, "model", None) or "text-embedding-3-small")
+
+        self.total = source.vector_store.index.ntotal
+        self.state = "idle"  # idle / running / promoting / done / cancelled / failed
+        self.error: Optional[str] = None
+        self.started_at = 0.0
+        self.embedded = 0  # 已完成向量化的文本块（PCA拟合前暂存的也计入）
+        self.embedding_tokens = 0
+        self._samples = deque(maxlen=20)  # (时间, 已向量化数量)，用于估算速度
+
+        # 迁移期间新索引由写入线程修改，读取时加锁
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def migrated(self) -> int:
+        """已写入新索引的文本块数量（新索引第 i 行就是旧索引第 i 行）"""
+        store = self.target.vector_store
+        return store.index.ntotal if store is not None else 0
+
+    @property
+    def active(self) -> bool:
+        """迁移是否仍在进行（读取需要走双索引）"""
+        return self.state in ("running", "promoting")
+
+    def start(self):
+        """启动后台迁移线程，并让旧索引的检索改为双读"""
+        self.state = "running"
+        self.started_at = time.time()
+        self._samples.append((time.monotonic(), 0))
+        self.source.migration = self
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """取消迁移，旧索引恢复单独服务"""
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待迁移线程结束"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _batches(self):
+        """按行号顺序分批读取旧索引中的文本块"""
+        batch = []
+        for doc in self.source.iter_documents():
+            batch.append(doc)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _run(self):
+        """后台线程：限速地重新向量化全部文本块，完成后发布新索引"""
+        try:
+            last_report = 0
+            for batch in self._batches():
+                texts = [doc.page_content for doc in batch]
+                tokens = sum(self.token_counter.count(text) for text in texts)
+                if not self.limiter.acquire(tokens, stop=self._stop):
+                    break
+
+                vectors = self.target.embeddings.embed_documents(texts)
+                with self._lock:
+                    self.target.add_embeddings(
+                        [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in batch],
+                        vectors
+                    )
+                self.embedded += len(batch)
+                self.embedding_tokens += tokens
+                self._samples.append((time.monotonic(), self.embedded))
+
+                # 每迁移约10%报告一次进度
+                if self.embedded - last_report >= max(1, self.total // 10):
+                    last_report = self.embedded
+                    progress = self.progress()
+                    print(f"🔄 Embedding迁移: {progress['migrated']}/{self.total} ({progress['percent']:.0f}%)，"
+                          f"{progress['chunks_per_second']:.1f} 块/秒，预计剩余 {progress['eta_seconds']:.0f}s")
+
+            if self._stop.is_set():
+                self.state = "cancelled"
+                self.source.migration = None
+                print("⏹️ Embedding迁移已取消，继续使用旧索引")
+                return
+
+            self.state = "promoting"
+            # 收尾步骤会替换新索引的文本块存储，在锁内完成，之后保存快照时不再修改
+            with self._lock:
+                self.target.flush()
+                self.target.build_section_index()
+                self.target._ensure_chunk_table()
+            if self.on_complete is not None:
+                self.on_complete(self.target)
+            self.state = "done"
+            self.source.migration = None
+            print(f"✅ Embedding迁移完成（{self.total} 个文本块，耗时 {time.time() - self.started_at:.0f}s）")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            self.source.migration = None
+            print(f"\n❌ Embedding迁移失败，继续使用旧索引: {e}")
+
+    def progress(self) -> Dict:
+        """
+        迁移进度
+
+        Returns:
+            进度字典：状态、已迁移数量、百分比、最近速度、预计剩余秒数
+        """
+        # 速度按最近若干批次到当前时刻计算，限速等待的时间也计入；尚未开始时速度为0
+        rate = 0.0
+        if self._samples:
+            (t0, n0), (t1, n1) = self._samples[0], self._samples[-1]
+            elapsed = (time.monotonic() if self.state == "running" else t1) - t0
+            rate = (n1 - n0) / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.embedded
+        return {
+            "state": self.state,
+            "migrated": self.migrated,
+            "embedded": self.embedded,
+            "total": self.total,
+            "percent": 100.0 * self.embedded / max(1, self.total),
+            "chunks_per_second": rate,
+            "eta_seconds": remaining / rate if rate > 0 else float("inf") if remaining else 0.0,
+            "embedding_tokens": self.embedding_tokens,
+            "error": self.error
+        }
+
+    @staticmethod
+    def _search_rows(manager: VectorStoreManager, query_vector: np.ndarray, k: int,
+                     start: int, stop: int) -> List[Tuple[Document, float]]:
+        """
+        只在行号 [start, stop) 范围内检索
+
+        Args:
+            manager: 向量存储管理器
+            query_vector: 查询向量（该管理器的Embedding空间）
+            k: 返回数量
+            start: 起始行号
+            stop: 结束行号（不含）
+
+        Returns:
+            (文档, L2距离) 元组列表
+        """
+        import faiss
+
+        index = manager.vector_store.index
+        if isinstance(index, MappedFlatIndex):
+            rows, distances = rerank(index.vectors, np.arange(start, stop), query_vector, k)
+        else:
+            selector = faiss.IDSelectorRange(start, stop)
+            params = (faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe) if hasattr(index, "nprobe")
+                      else faiss.SearchParameters(sel=selector))
+            distances, rows = index.search(np.ascontiguousarray(query_vector[None, :]), k, params=params)
+            distances, rows = distances[0], rows[0]
+
+        store = manager.vector_store
+        return [
+            (store.docstore.search(store.index_to_docstore_id[int(row)]), float(distance))
+            for row, distance in zip(rows, distances) if row != -1
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 3) -> List[Tuple[Document, float]]:
+        """
+        双读检索：已迁移部分查新索引，未迁移部分查旧索引，按覆盖比例加权的RRF融合
+
+        Args:
+            query: 查询文本
+            k: 返回的文档数量
+
+        Returns:
+            (文档, L2距离) 元组列表；距离来自各自的索引，排序以融合名次为准
+        """
+        # 查询向量化是网络调用，在锁外完成；锁内只读取已迁移行数并检索新索引
+        target_vector = self.target.embed_query(query) if self.migrated else None
+        new_results = []
+        with self._lock:
+            migrated = self.migrated if target_vector is not None else 0
+            if migrated:
+                new_results = self._search_rows(self.target, target_vector, k, 0, migrated)
+        old_results = []
+        if migrated < self.total:
+            old_results = self._search_rows(self.source, self.source.embed_query(query), k, migrated, self.total)
+        self.source.last_scored_chunks = self.total
+
+        scored = []
+        for results, weight in ((new_results, migrated / self.total), (old_results, 1 - migrated / self.total)):
+            for rank, (doc, distance) in enumerate(results):
+                scored.append((weight / (self.RRF_K + rank + 1), doc, distance))
+        scored.sort(key=lambda item: -item[0])
+        return [(doc, distance) for _, doc, distance in scored[:k]]
+
+
+def migrate_knowledge_base(
+    source: VectorStoreManager,
+    target: VectorStoreManager,
+    save_path: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    rate_share: float = 0.2,
+    batch_size: int = 64,
+    retain: Optional[int] = None,
+    on_promoted: Optional[Callable[[VectorStoreManager], None]] = None
+) -> EmbeddingMigration:
+    """
+    启动在线迁移：完成后把新索引发布为新的快照版本，再通过 on_promoted 切换服务
+
+    Args:
+        source: 正在服务的旧模型向量存储管理器
+        target: 使用新模型的空向量存储管理器（其余参数与线上配置一致）
+        save_path: 快照仓库根目录
+        requests_per_minute: Embedding接口的每分钟请求数限额
+        tokens_per_minute: Embedding接口的每分钟Token数限额
+        rate_share: 迁移可以占用的限额比例
+        batch_size: 每次Embedding调用的文本块数量
+        retain: 保留的历史快照数量
+        on_promoted: 新快照发布后的回调（切换RAG链）
+
+    Returns:
+        已启动的迁移任务
+    """
+    # 级联检索的二值编码在迁移完成后一次生成，迁移期间不随每批写入反复重建
+    cascade, target.cascade = target.cascade, False
+    target_backend = embedding_backend_id(target.embeddings)
+
+    def promote(manager: VectorStoreManager):
+        manager.cascade = cascade
+        manager.save_vector_store(save_path, retain=retain)
+        if on_promoted is not None:
+            on_promoted(manager)
+        print(f"💡 新快照由Embedding模型 {manager.embedding_model} 构建，重启前请同步修改 EMBEDDING_MODEL"
+              f"（或设置 EMBEDDING_FOLLOW_SNAPSHOT=1 按快照记录的模型加载）")
+
+    migration = EmbeddingMigration(
+        source, target,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        rate_share=rate_share,
+        batch_size=batch_size,
+        on_complete=promote
+    )
+    print(f"🚚 开始Embedding迁移: {embedding_backend_id(source.embeddings)} → {target_backend}，"
+          f"共 {migration.total} 个文本块")
+    migration.start()
+    return migration
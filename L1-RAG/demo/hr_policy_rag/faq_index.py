@@ -0,0 +1,248 @@
+"""
+FAQ答案索引模块：离线预生成高频问题的答案，查询时命中即直接返回，无需调用LLM
+
+核心知识点：
+1. 离线预计算：对一组标准问题提前跑完整的RAG流程，把答案和引用的文本块一起保存
+2. 近邻匹配：用户问题与标准问题的向量余弦相似度超过阈值才视为命中，否则走正常RAG流程
+3. 失效检测：每条答案记录来源文本块的内容指纹，知识库更新后只重新生成来源发生变化的条目
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+
+def chunk_key(metadata: Dict) -> str:
+    """文本块的稳定标识：来源文件 + 文件内的文本块ID"""
+    return f"{metadata.get('source', 'unknown')}#{metadata.get('chunk_id', 'unknown')}"
+
+
+def chunk_fingerprint(text: str) -> str:
+    """文本块内容指纹"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class FAQIndex:
+    """FAQ答案索引：标准问题向量 + 预生成答案 + 来源文本块指纹"""
+
+    ENTRIES_FILE = "faq.json"
+    VECTORS_FILE = "faq_vectors.npy"
+
+    def __init__(self, entries: List[Dict], vectors: np.ndarray, index_version: Optional[str] = None,
+                 threshold: float = 0.92):
+        """
+        初始化FAQ索引
+
+        Args:
+            entries: FAQ条目，每项包含 question、answer、sources
+            vectors: 标准问题的归一化向量矩阵
+            index_version: 生成答案时使用的知识库快照版本
+            threshold: 命中所需的最低余弦相似度
+        """
+        self.entries = entries
+        self.vectors = vectors
+        self.index_version = index_version
+        self.threshold = threshold
+        # 完全相同的问题直接命中，连查询向量都不需要计算
+        self._exact = {entry["question"].strip(): i for i, entry in enumerate(entries)}
+
+    @classmethod
+    def build(cls, rag_chain, questions: List[str], k: int = 3, threshold: float = 0.92) -> 'FAQIndex':
+        """
+        离线任务：对每个标准问题执行完整的RAG流程并保存答案
+
+        Args:
+            rag_chain: RAGChain对象
+            questions: 标准问题列表
+            k: 检索的文档数量
+            threshold: 命中所需的最低余弦相似度
+
+        Returns:
+            FAQ索引
+        """
+        entries = [cls._generate_entry(rag_chain, question, k) for question in questions]
+        vectors = cls._embed_questions(rag_chain.vector_store_manager, questions)
+        return cls(entries, vectors, rag_chain.vector_store_manager.index_version, threshold)
+
+    @staticmethod
+    def _generate_entry(rag_chain, question: str, k: int) -> Dict:
+        """对单个问题执行RAG流程，生成FAQ条目"""
+        print(f"\n📝 生成FAQ答案: {question}")
+        result = rag_chain.invoke(question, k=k, use_faq=False)
+        return {
+            "question": question,
+            "answer": result["answer"],
+            "sources": [
+                {
+                    "key": chunk_key(doc.metadata),
+                    "fingerprint": chunk_fingerprint(doc.page_content),
+                    "metadata": doc.metadata,
+                    "preview": doc.page_content[:100]
+                }
+                for doc in result["retrieved_docs"]
+            ]
+        }
+
+    @staticmethod
+    def _embed_questions(vector_manager, questions: List[str]) -> np.ndarray:
+        """计算标准问题的归一化向量"""
+        if not questions:
+            return np.zeros((0, 0), dtype=np.float32)
+        # 与查询向量使用同样的降维，保证FAQ匹配时维度一致
+        vectors = vector_manager.embed_queries(questions)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def lookup_exact(self, query: str) -> Optional[Dict]:
+        """
+        只查找与标准问题完全相同的问题（不需要向量，知识库未就绪时也可用）
+
+        Args:
+            query: 用户问题
+
+        Returns:
+            命中的FAQ条目（附带 score 字段）；未命中返回None
+        """
+        exact = self._exact.get(query.strip())
+        if exact is None:
+            return None
+        return dict(self.entries[exact], score=1.0)
+
+    def lookup(self, query: str, vector_manager) -> Optional[Dict]:
+        """
+        查找与用户问题匹配的FAQ条目
+
+        Args:
+            query: 用户问题
+            vector_manager: 向量存储管理器（用于计算并缓存查询向量）
+
+        Returns:
+            命中的FAQ条目（附带 score 字段）；未命中返回None
+        """
+        if not self.entries:
+            return None
+
+        exact = self.lookup_exact(query)
+        if exact is not None:
+            return exact
+
+        query_vector = vector_manager.embed_query(query)
+        scores = self.vectors @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return dict(self.entries[best], score=float(scores[best]))
+
+    def to_result(self, query: str, entry: Dict) -> Dict:
+        """
+        把命中的FAQ条目转换为与 RAGChain.invoke 相同结构的结果
+
+        Args:
+            query: 用户问题
+            entry: 命中的FAQ条目
+
+        Returns:
+            结果字典
+        """
+        retrieved_docs = [
+            Document(page_content=source["preview"], metadata=source["metadata"])
+            for source in entry["sources"]
+        ]
+        return {
+            "question": query,
+            "retrieved_docs": retrieved_docs,
+            "context": "",
+            "answer": entry["answer"],
+            "cache_hit": False,
+            "faq_match": {"question": entry["question"], "score": entry["score"]}
+        }
+
+    def refresh(self, rag_chain, k: int = 3) -> int:
+        """
+        检查每条FAQ的来源文本块是否发生变化，重新生成失效的条目
+
+        Args:
+            rag_chain: 基于最新知识库的RAGChain对象
+            k: 检索的文档数量
+
+        Returns:
+            重新生成的条目数量
+        """
+        vector_manager = rag_chain.vector_store_manager
+        current = {chunk_key(doc.metadata): chunk_fingerprint(doc.page_content)
+                   for doc in vector_manager.iter_documents()}
+
+        regenerated = 0
+        for i, entry in enumerate(self.entries):
+            stale = any(current.get(source["key"]) != source["fingerprint"] for source in entry["sources"])
+            if stale:
+                self.entries[i] = self._generate_entry(rag_chain, entry["question"], k)
+                regenerated += 1
+
+        # 标准问题向量也按最新知识库重新计算（切换Embedding模型后旧向量不再可比）
+        self.vectors = self._embed_questions(vector_manager, [entry["question"] for entry in self.entries])
+        self.index_version = vector_manager.index_version
+        return regenerated
+
+    def save(self, save_path: str):
+        """
+        保存FAQ索引
+
+        Args:
+            save_path: 保存目录
+        """
+        os.makedirs(save_path, exist_ok=True)
+        with open(os.path.join(save_path, self.ENTRIES_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "index_version": self.index_version,
+                "threshold": self.threshold,
+                "entries": self.entries
+            }, f, ensure_ascii=False, indent=2)
+        np.save(os.path.join(save_path, self.VECTORS_FILE), self.vectors)
+
+    @classmethod
+    def load(cls, load_path: str) -> Optional['FAQIndex']:
+        """
+        加载FAQ索引
+
+        Args:
+            load_path: 保存目录
+
+        Returns:
+            FAQ索引；尚未生成时返回None
+        """
+        entries_file = os.path.join(load_path, cls.ENTRIES_FILE)
+        if not os.path.exists(entries_file):
+            return None
+
+        with open(entries_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(load_path, cls.VECTORS_FILE))
+        return cls(data["entries"], vectors, data["index_version"], data["threshold"])
+
+
+def build_faq_index():
+    """离线任务：基于当前知识库为 Config.FAQ_QUESTIONS 生成FAQ索引"""
+    from config import Config
+    from main import create_vector_manager
+    from rag_chain import RAGChain
+
+    print("=" * 60)
+    print("生成FAQ答案索引")
+    print("=" * 60)
+
+    vector_manager = create_vector_manager()
+    vector_manager.load_vector_store(Config.VECTOR_STORE_PATH, version=Config.INDEX_VERSION)
+    rag = RAGChain(vector_manager, model_name=Config.OPENAI_MODEL)
+
+    faq_index = FAQIndex.build(rag, Config.FAQ_QUESTIONS, k=Config.TOP_K, threshold=Config.FAQ_MATCH_THRESHOLD)
+    faq_index.save(Config.FAQ_INDEX_PATH)
+
+    print(f"\n✅ FAQ索引已保存到: {Config.FAQ_INDEX_PATH}（{len(faq_index.entries)} 条）")
+
+
+if __name__ == "__main__":
+    build_faq_index()
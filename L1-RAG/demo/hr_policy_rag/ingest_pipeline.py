@@ -0,0 +1,301 @@
+"""
+流式入库模块：把"加载分块 → 向量化 → 写入索引"改造成重叠执行的流水线
+
+核心知识点：
+1. 流水线并行：CPU密集的加载分块、网络密集的向量化、单线程的索引写入同时进行，
+   总耗时趋近于最慢的一个阶段，而不是各阶段耗时之和
+2. 有界队列与背压：阶段之间用固定容量的队列连接，下游处理不过来时上游自动阻塞，
+   内存中同时存在的中间文本块数量有上限
+3. 进程与线程的选择：分块是纯Python的CPU计算，放到多进程中绕开GIL；
+   Embedding调用主要在等待网络，用线程并发即可
+4. 确定性写入：批次带上源顺序编号，并发向量化完成的先后不固定，写入阶段按编号重排后
+   再写入，同样的语料每次得到相同的行号（RowId）和索引布局
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from langchain.schema import Document
+from document_loader import DocumentLoader
+from vector_store import VectorStoreManager
+
+
+# 队列结束标记
+_DONE = object()
+
+
+def _load_and_split(file_path: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """子进程中执行的加载分块任务（需要定义在模块顶层才能被pickle）"""
+    loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return loader.load_and_split(file_path)
+
+
+class IngestionPipeline:
+    """
+    流式入库流水线
+
+    阶段划分：
+    1. 加载分块：进程池处理文件，按文件顺序取回结果，文本块按 batch_size 打包并编号后放入 chunk_queue
+    2. 向量化：embed_workers 个线程并发调用Embedding接口，结果放入 vector_queue
+    3. 写入索引：当前线程作为唯一写入者，按批次编号顺序把向量增量写入FAISS
+    """
+
+    def __init__(
+        self,
+        vector_manager: VectorStoreManager,
+        chunk_size: int = 500,
+        chunk_overlap: int = 75,
+        load_workers: int = 2,
+        embed_workers: int = 4,
+        batch_size: int = 64,
+        queue_size: int = 8
+    ):
+        """
+        初始化流水线
+
+        Args:
+            vector_manager: 向量存储管理器（提供Embedding模型并接收写入）
+            chunk_size: 文本块大小
+            chunk_overlap: 文本块重叠大小
+            load_workers: 加载分块的进程数
+            embed_workers: 并发向量化的线程数
+            batch_size: 每次Embedding调用的文本块数量
+            queue_size: 阶段间队列的容量（单位：批）
+        """
+        self.vector_manager = vector_manager
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.load_workers = load_workers
+        self.embed_workers = embed_workers
+        self.batch_size = batch_size
+
+        self.chunk_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.vector_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+
+        # 各阶段的进度指标；busy_seconds为该阶段实际工作的累计时间
+        self.metrics: Dict[str, Dict] = {
+            "load": {"files_total": 0, "files_done": 0, "chunks": 0, "busy_seconds": 0.0},
+            "embed": {"batches": 0, "chunks": 0, "busy_seconds": 0.0},
+            "index": {"batches": 0, "chunks": 0, "busy_seconds": 0.0},
+        }
+        self.wall_seconds = 0.0
+
+    def run(self, file_paths: List[str]) -> VectorStoreManager:
+        """
+        执行流水线
+
+        Args:
+            file_paths: 待入库的文件路径列表
+
+        Returns:
+            写入完成的向量存储管理器
+        """
+        self.metrics["load"]["files_total"] = len(file_paths)
+        start = time.perf_counter()
+
+        loader_thread = threading.Thread(target=self._guard, args=(self._load_stage, file_paths), daemon=True)
+        embed_threads = [
+            threading.Thread(target=self._guard, args=(self._embed_stage,), daemon=True)
+            for _ in range(self.embed_workers)
+        ]
+        loader_thread.start()
+        for thread in embed_threads:
+            thread.start()
+
+        # 当前线程作为唯一的索引写入者
+        self._guard(self._index_stage)
+
+        loader_thread.join()
+        for thread in embed_threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+        self._finish()
+        self.print_summary()
+        return self.vector_manager
+
+    def _write(self, batch: List[Document], vectors: List[List[float]]):
+        """写入一批已向量化的文本块（由索引写入线程调用）"""
+        self.vector_manager.add_embeddings(batch, vectors)
+
+    def _finish(self):
+        """全部批次写入后完成索引"""
+        # 语料少于PCA拟合样本数时，降维器在这里用全部暂存向量拟合
+        self.vector_manager.flush()
+        if self.vector_manager.vector_store is not None:
+            self.vector_manager.build_section_index()
+
+    def _guard(self, stage, *args):
+        """执行一个阶段；任何阶段出错都会通知其他阶段尽快退出"""
+        try:
+            stage(*args)
+        except BaseException as e:
+            with self._lock:
+                self._errors.append(e)
+            self._abort.set()
+
+    def _put(self, q: queue.Queue, item):
+        """带背压的入队：队列满时阻塞，流水线中止时放弃"""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        """出队：流水线中止时返回结束标记"""
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _load_stage(self, file_paths: List[str]):
+        """阶段1：多进程加载分块，按文件顺序打包成编号的批次放入chunk_queue"""
+        metrics = self.metrics["load"]
+        pending_batch: List[Document] = []
+        seq = 0
+
+        try:
+            # 本阶段运行在后台线程中，Linux默认的fork会复制持有锁的其他线程状态，改用spawn启动子进程
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.load_workers, mp_context=context) as executor:
+                remaining = deque(file_paths)
+                running = deque()
+                while remaining or running:
+                    # 最多同时处理 2 × 进程数 个文件，避免分块结果堆积在内存中
+                    while remaining and len(running) < self.load_workers * 2 and not self._abort.is_set():
+                        running.append(executor.submit(_load_and_split, remaining.popleft(),
+                                                       self.chunk_size, self.chunk_overlap))
+                    if self._abort.is_set():
+                        for future in running:
+                            future.cancel()
+                        return
+
+                    # 按提交顺序取回结果，文本块的先后与文件列表一致
+                    started = time.perf_counter()
+                    chunks = running.popleft().result()
+                    metrics["busy_seconds"] += time.perf_counter() - started
+                    metrics["files_done"] += 1
+                    metrics["chunks"] += len(chunks)
+                    for chunk in chunks:
+                        pending_batch.append(chunk)
+                        if len(pending_batch) >= self.batch_size:
+                            self._put(self.chunk_queue, (seq, pending_batch))
+                            seq += 1
+                            pending_batch = []
+
+            if pending_batch:
+                self._put(self.chunk_queue, (seq, pending_batch))
+        finally:
+            # 每个向量化线程各收到一个结束标记
+            for _ in range(self.embed_workers):
+                self._put(self.chunk_queue, _DONE)
+
+    def _embed_stage(self):
+        """阶段2：并发调用Embedding接口，结果放入vector_queue"""
+        metrics = self.metrics["embed"]
+        try:
+            while True:
+                item = self._get(self.chunk_queue)
+                if item is _DONE:
+                    return
+
+                seq, batch = item
+                started = time.perf_counter()
+                vectors = self.vector_manager.embeddings.embed_documents([doc.page_content for doc in batch])
+                elapsed = time.perf_counter() - started
+
+                with self._lock:
+                    metrics["batches"] += 1
+                    metrics["chunks"] += len(batch)
+                    metrics["busy_seconds"] += elapsed
+                self._put(self.vector_queue, (seq, batch, vectors))
+        finally:
+            self._put(self.vector_queue, _DONE)
+
+    def _index_stage(self):
+        """阶段3：单线程按批次编号顺序把向量写入索引（先完成的后续批次暂存，等前面的批次到达）"""
+        metrics = self.metrics["index"]
+        finished_workers = 0
+        next_seq = 0
+        reorder: Dict[int, tuple] = {}
+        while finished_workers < self.embed_workers:
+            item = self._get(self.vector_queue)
+            if item is _DONE:
+                if self._abort.is_set():
+                    return
+                finished_workers += 1
+                continue
+
+            seq, batch, vectors = item
+            reorder[seq] = (batch, vectors)
+            while next_seq in reorder:
+                batch, vectors = reorder.pop(next_seq)
+                next_seq += 1
+                started = time.perf_counter()
+                self._write(batch, vectors)
+                metrics["busy_seconds"] += time.perf_counter() - started
+                metrics["batches"] += 1
+                metrics["chunks"] += len(batch)
+                self.print_progress()
+
+    def print_progress(self):
+        """打印一行进度信息"""
+        load, embed, index = self.metrics["load"], self.metrics["embed"], self.metrics["index"]
+        print(
+            f"📊 加载 {load['files_done']}/{load['files_total']} 文件 ({load['chunks']} 块) | "
+            f"向量化 {embed['chunks']} 块 | 入库 {index['chunks']} 块 | "
+            f"队列 {self.chunk_queue.qsize()}/{self.vector_queue.qsize()}"
+        )
+
+    def print_summary(self):
+        """打印各阶段耗时；流水线的总耗时应接近最慢阶段的耗时"""
+        print(f"\n✅ 流式入库完成，共 {self.metrics['index']['chunks']} 个文本块，总耗时 {self.wall_seconds:.2f}s")
+        # 加载阶段的busy_seconds是等待进程池的时间；向量化阶段是多线程累计时间，需按并发数折算
+        stage_seconds = {
+            "加载分块": self.metrics["load"]["busy_seconds"],
+            "向量化": self.metrics["embed"]["busy_seconds"] / max(1, self.embed_workers),
+            "写入索引": self.metrics["index"]["busy_seconds"],
+        }
+        for name, seconds in stage_seconds.items():
+            print(f"  {name}: {seconds:.2f}s")
+        print(f"  各阶段之和: {sum(stage_seconds.values()):.2f}s, 最慢阶段: {max(stage_seconds.values()):.2f}s")
+
+
+def demo_ingest_pipeline():
+    """演示流式入库"""
+    print("=" * 60)
+    print("流式入库演示")
+    print("=" * 60)
+
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    file_paths = [
+        os.path.join(data_dir, filename)
+        for filename in sorted(os.listdir(data_dir))
+        if filename.endswith(('.txt', '.pdf'))
+    ]
+
+    pipeline = IngestionPipeline(VectorStoreManager())
+    vector_manager = pipeline.run(file_paths)
+
+    results = vector_manager.similarity_search("年假如何申请？", k=1)
+    print(f"\n🔍 检索测试: {results[0].page_content[:100]}...")
+
+
+if __name__ == "__main__":
+    demo_ingest_pipeline()
@@ -0,0 +1,424 @@
+"""
+知识库单文件包模块：把向量、压缩文本、元数据和构建配置打包为一个可直接内存映射的文件
+
+核心知识点：
+1. 单文件分发：一个知识库版本就是一个文件，发布到上百个服务节点只需复制文件，
+   节点上先写临时文件再原子重命名，不会读到复制了一半的包
+2. 页对齐分区：每个分区（向量、文本块、元数据列……）都从4096字节边界开始，
+   向量、文本块和元数据列通过 np.frombuffer 直接映射为数组，打开耗时不随文本块数量增长；
+   只有字符串元数据的词表（如来源文件名、章节名）和少量非列式元数据以JSON保存，需要解析，
+   其大小随不同取值的数量增长
+3. 不使用pickle：分区只有原始数组、字节串和JSON，加载时不会执行任何代码，可以跨信任边界分发；
+   所有偏移在使用前都校验不越界
+4. 校验：文件开头的超级块记录头信息的SHA-256，打开时校验；各分区的CRC32记录在头信息中，
+   分发后可用 verify 做一次完整校验
+
+文件布局：
+  [超级块(1页)] [分区1] [分区2] ... [头信息JSON]
+  超级块 = 魔数 + 格式版本 + 头信息偏移/长度 + 头信息SHA-256
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from chunk_store import ChunkStore
+from chunk_table import ChunkTable, MetadataColumns, RowIds
+from dim_reduction import DimensionReducer
+from embedding_backends import embedding_backend_id
+from section_index import SectionIndex
+
+
+MAGIC = b"HRKBNDL\x00"
+FORMAT_VERSION = 1
+PAGE_SIZE = 4096
+# 魔数、格式版本、保留字段、头信息偏移、头信息长度、头信息SHA-256
+_SUPERBLOCK = struct.Struct("<8sIIQQ32s")
+
+
+def _align(offset: int) -> int:
+    """向上对齐到页边界"""
+    return (offset + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+
+class MappedFlatIndex:
+    """
+    基于内存映射向量矩阵的精确L2检索，实现LangChain FAISS包装类用到的索引接口
+
+    与 faiss.IndexFlatL2 的距离一致（平方L2），向量和预计算的范数都直接映射自包文件。
+    """
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray):
+        """
+        初始化映射索引
+
+        Args:
+            vectors: 形状为 (n, d) 的float32向量矩阵
+            norms: 每个向量的平方范数
+        """
+        self.vectors = vectors
+        self.norms = norms
+        self.ntotal, self.d = vectors.shape
+        self.is_trained = True
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确检索：||x - q||² = ||x||² - 2x·q + ||q||²
+
+        Args:
+            queries: 形状为 (nq, d) 的查询矩阵
+            k: 每个查询返回的数量
+
+        Returns:
+            (距离矩阵, 行号矩阵)，不足 k 个时行号补 -1（与FAISS一致）
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.ntotal == 0:
+            return distances, labels
+
+        scores = self.norms[None, :] - 2 * (queries @ self.vectors.T) + np.einsum('ij,ij->i', queries, queries)[:, None]
+        top = min(k, self.ntotal)
+        for i, row in enumerate(scores):
+            rows = np.argpartition(row, top - 1)[:top] if top < self.ntotal else np.arange(self.ntotal)
+            rows = rows[np.argsort(row[rows], kind="stable")]
+            distances[i, :top] = np.maximum(row[rows], 0)
+            labels[i, :top] = rows
+        return distances, labels
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i])
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return self.vectors[i0:i0 + n]
+
+
+class BundleWriter:
+    """顺序写入页对齐分区，最后写入头信息并回填超级块"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(b"\0" * PAGE_SIZE)  # 超级块占位
+        self.sections: Dict[str, Dict] = {}
+
+    def tell_aligned(self) -> int:
+        """下一个分区的起始偏移"""
+        return _align(self._file.tell())
+
+    def add_bytes(self, name: str, data: bytes, **info) -> int:
+        """
+        写入一个字节串分区
+
+        Args:
+            name: 分区名称
+            data: 分区内容
+            **info: 额外记录在头信息中的字段（如dtype、shape）
+
+        Returns:
+            分区起始偏移
+        """
+        offset = self.tell_aligned()
+        self._file.seek(offset)
+        self._file.write(data)
+        self.sections[name] = dict(info, offset=offset, length=len(data), crc32=zlib.crc32(data))
+        return offset
+
+    def add_array(self, name: str, array: np.ndarray) -> int:
+        """写入一个数组分区（C顺序、小端序）"""
+        array = np.ascontiguousarray(array)
+        dtype = array.dtype.newbyteorder('<')
+        return self.add_bytes(name, array.astype(dtype, copy=False).tobytes(), dtype=dtype.str, shape=list(array.shape))
+
+    def add_json(self, name: str, obj) -> int:
+        """写入一个JSON分区"""
+        return self.add_bytes(name, json.dumps(obj, ensure_ascii=False).encode('utf-8'), dtype="json")
+
+    def close(self, metadata: Dict):
+        """
+        写入头信息并回填超级块
+
+        Args:
+            metadata: 包级元数据（Embedding后端、分块配置等）
+        """
+        header = json.dumps(
+            {"format": FORMAT_VERSION, "metadata": metadata, "sections": self.sections},
+            ensure_ascii=False, sort_keys=True
+        ).encode('utf-8')
+        header_offset = self.tell_aligned()
+        self._file.seek(header_offset)
+        self._file.write(header)
+
+        self._file.seek(0)
+        self._file.write(_SUPERBLOCK.pack(MAGIC, FORMAT_VERSION, 0, header_offset, len(header),
+                                          hashlib.sha256(header).digest()))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+class KnowledgeBundle:
+    """只读打开的知识库单文件包"""
+
+    def __init__(self, path: str):
+        """
+        打开包文件：校验超级块和头信息，各分区按需映射
+
+        Args:
+            path: 包文件路径
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < PAGE_SIZE:
+            raise ValueError(f"不是有效的知识库包: {path}")
+        magic, version, _, header_offset, header_length, digest = _SUPERBLOCK.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的知识库包: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的知识库包格式版本: {version}")
+        if header_offset + header_length > len(self._mmap):
+            raise ValueError(f"知识库包已截断: {path}")
+
+        header = self._mmap[header_offset:header_offset + header_length]
+        if hashlib.sha256(header).digest() != digest:
+            raise ValueError(f"知识库包头信息校验失败: {path}")
+
+        header = json.loads(header)
+        self.metadata: Dict = header["metadata"]
+        self.sections: Dict[str, Dict] = header["sections"]
+        for name, section in self.sections.items():
+            if section["offset"] + section["length"] > header_offset:
+                raise ValueError(f"知识库包分区越界: {name}")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def bytes(self, name: str) -> bytes:
+        """读取字节串分区（复制，仅用于小分区）"""
+        section = self.sections[name]
+        return self._mmap[section["offset"]:section["offset"] + section["length"]]
+
+    def json(self, name: str):
+        """读取JSON分区"""
+        return json.loads(self.bytes(name))
+
+    def array(self, name: str) -> np.ndarray:
+        """把数组分区直接映射为只读数组（零拷贝）"""
+        section = self.sections[name]
+        dtype = np.dtype(section["dtype"])
+        count = int(np.prod(section["shape"])) if section["shape"] else 1
+        if count * dtype.itemsize != section["length"]:
+            raise ValueError(f"知识库包分区大小与形状不一致: {name}")
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=section["offset"]).reshape(section["shape"])
+
+    def verify(self) -> List[str]:
+        """
+        逐个分区校验CRC32（需要读取整个文件，分发后执行一次即可）
+
+        Returns:
+            校验失败的分区名称列表
+        """
+        failed = []
+        for name, section in self.sections.items():
+            view = memoryview(self._mmap)[section["offset"]:section["offset"] + section["length"]]
+            if zlib.crc32(view) != section["crc32"]:
+                failed.append(name)
+            view.release()
+        return failed
+
+    def chunk_store(self) -> ChunkStore:
+        """文本块存储：偏移数组在写入时已转换为文件内的绝对偏移，数据直接读取整个映射文件"""
+        offsets = self.array("chunks.offsets")
+        if len(offsets) and (offsets[0] < self.sections["chunks.data"]["offset"] or
+                             offsets[-1] > self.sections["chunks.data"]["offset"] + self.sections["chunks.data"]["length"]):
+            raise ValueError("知识库包文本块偏移越界")
+        return ChunkStore(self.metadata["codec"], self.bytes("chunks.dict"), offsets, self._mmap)
+
+    def metadata_columns(self) -> MetadataColumns:
+        """列式元数据：整数列和字符串编号列直接映射，词表和少量其他值从JSON读取"""
+        layout = self.json("meta.layout")
+        int_columns = {key: self.array(f"meta.int.{i}") for i, key in enumerate(layout["int"])}
+        str_columns = {
+            key: (vocab, self.array(f"meta.str.{i}"))
+            for i, (key, vocab) in enumerate(zip(layout["str"], layout["vocab"]))
+        }
+        extras = {int(row): values for row, values in layout["extras"].items()}
+        return MetadataColumns(self.metadata["num_documents"], layout["keys"], int_columns, str_columns, extras)
+
+    def section_index(self) -> Optional[SectionIndex]:
+        """章节索引（构建时没有章节索引则返回None）"""
+        if "sections.json" not in self:
+            return None
+        rows = self.array("sections.rows")
+        bounds = self.array("sections.bounds")
+        sections = [
+            dict(section, rows=rows[bounds[i]:bounds[i + 1]])
+            for i, section in enumerate(self.json("sections.json"))
+        ]
+        return SectionIndex(sections, self.array("sections.vectors"))
+
+    def reducer(self) -> Optional[DimensionReducer]:
+        """降维器（未降维时返回None）"""
+        reduction = self.metadata.get("reduction")
+        if not reduction:
+            return None
+        method, dimension = reduction.split(":")
+        if method == "pca":
+            return DimensionReducer(method, int(dimension), self.array("reducer.mean"), self.array("reducer.components"))
+        return DimensionReducer(method, int(dimension))
+
+    def open_vector_store(self, embeddings) -> FAISS:
+        """
+        组装只读的向量存储：映射索引 + 列式文本块表
+
+        Args:
+            embeddings: 当前的Embedding模型
+
+        Returns:
+            LangChain FAISS向量存储对象
+        """
+        index = MappedFlatIndex(self.array("vectors"), self.array("norms"))
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=ChunkTable(self.metadata_columns(), self.chunk_store()),
+            index_to_docstore_id=RowIds(index.ntotal)
+        )
+
+
+def write_bundle(vector_manager, path: str, chunk_size: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None) -> Dict:
+    """
+    把向量存储管理器中的知识库写入单文件包（先写临时文件，完成后原子替换）
+
+    Args:
+        vector_manager: 已创建或加载向量存储的管理器（需要Flat索引）
+        path: 包文件路径
+        chunk_size: 构建时的文本块大小（记录在包中）
+        chunk_overlap: 构建时的文本块重叠大小（记录在包中）
+
+    Returns:
+        包级元数据
+    """
+    vectors = np.ascontiguousarray(vector_manager._flat_vectors(), dtype=np.float32)
+    table = vector_manager._ensure_chunk_table()
+    count = len(vectors)
+
+    # 文本统一压缩存储；已压缩的文本块直接复用字典和压缩数据
+    store = table.chunk_store
+    if store.codec == "none":
+        store = ChunkStore.build([store.get(i) for i in range(count)])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    writer = BundleWriter(tmp_path)
+    try:
+        writer.add_array("vectors", vectors)
+        writer.add_array("norms", np.einsum('ij,ij->i', vectors, vectors))
+        writer.add_array("binary_codes", vector_manager._ensure_binary_codes().columns)
+
+        # 偏移转换为文件内的绝对偏移，打开时文本块存储直接读取整个映射文件，无需逐项修正
+        offsets = np.asarray(store.offsets, dtype=np.uint64)
+        data_offset = writer.add_bytes("chunks.data", bytes(store.data[int(offsets[0]):int(offsets[-1])]))
+        writer.add_array("chunks.offsets", offsets - offsets[0] + np.uint64(data_offset))
+        writer.add_bytes("chunks.dict", store.dictionary)
+
+        metadata = table.metadata
+        layout = {
+            "keys": metadata.keys,
+            "int": list(metadata.int_columns),
+            "str": list(metadata.str_columns),
+            "vocab": [vocab for vocab, _ in metadata.str_columns.values()],
+            "extras": {str(row): values for row, values in metadata.extras.items()},
+        }
+        writer.add_json("meta.layout", layout)
+        for i, column in enumerate(metadata.int_columns.values()):
+            writer.add_array(f"meta.int.{i}", column)
+        for i, (_, codes) in enumerate(metadata.str_columns.values()):
+            writer.add_array(f"meta.str.{i}", codes)
+
+        sections = vector_manager.section_index
+        if sections is not None:
+            writer.add_json("sections.json", [
+                {key: value for key, value in section.items() if key != "rows"} for section in sections.sections
+            ])
+            lengths = [len(section["rows"]) for section in sections.sections]
+            writer.add_array("sections.rows", np.concatenate(
+                [np.asarray(section["rows"], dtype=np.int64) for section in sections.sections]
+            ) if lengths else np.zeros(0, dtype=np.int64))
+            writer.add_array("sections.bounds", np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+            writer.add_array("sections.vectors", sections.section_vectors)
+
+        reducer = vector_manager.reducer
+        if reducer is not None and reducer.components is not None:
+            writer.add_array("reducer.mean", reducer.mean)
+            writer.add_array("reducer.components", reducer.components)
+
+        bundle_metadata = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source_version": vector_manager.index_version,
+            "num_documents": count,
+            "dimension": int(vectors.shape[1]),
+            "embedding_backend": embedding_backend_id(vector_manager.embeddings),
+            "embedding_model": vector_manager.embedding_model,
+            "reduction": reducer.description if reducer is not None else None,
+            "codec": store.codec,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+        }
+        writer.close(bundle_metadata)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return bundle_metadata
+
+
+def print_bundle_info(path: str):
+    """打印包的元数据和各分区大小"""
+    bundle = KnowledgeBundle(path)
+    print(f"📦 {path} ({os.path.getsize(path) / 1024 / 1024:.1f}MB)")
+    for key, value in bundle.metadata.items():
+        print(f"  {key}: {value}")
+    for name, section in sorted(bundle.sections.items(), key=lambda item: item[1]["offset"]):
+        print(f"  [{section['offset']:>12}] {name:<20} {section['length'] / 1024:>10.1f}KB")
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="知识库单文件包")
+    parser.add_argument("command", choices=["export", "info", "verify"],
+                        help="export: 把当前发布的快照导出为包；info: 查看包信息；verify: 完整校验")
+    parser.add_argument("path", nargs="?", default=Config.KB_BUNDLE_PATH or os.path.join(
+        os.path.dirname(__file__), "storage", "knowledge_base.kb"), help="包文件路径")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from main import create_vector_manager
+
+        manager = create_vector_manager()
+        manager.load_vector_store(Config.VECTOR_STORE_PATH, version=Config.INDEX_VERSION)
+        manager.save_bundle(args.path, chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP)
+        print_bundle_info(args.path)
+    elif args.command == "info":
+        print_bundle_info(args.path)
+    else:
+        started = time.perf_counter()
+        failed = KnowledgeBundle(args.path).verify()
+        if failed:
+            print(f"❌ 校验失败的分区: {', '.join(failed)}")
+        else:
+            print(f"✅ 全部分区校验通过 ({time.perf_counter() - started:.2f}s)")
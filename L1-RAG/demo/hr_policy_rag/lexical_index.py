@@ -0,0 +1,94 @@
+"""
+词面检索模块：基于字符二元组的BM25检索，不依赖Embedding
+
+核心知识点：
+1. BM25：按词频、逆文档频率和文档长度归一化打分，是经典的关键词检索算法
+2. 中文分词的近似：中文没有空格，用相邻两个字符（二元组）作为检索词，无需分词词典
+3. 降级检索：向量索引尚未就绪或Embedding接口不可用时，仍然可以找到包含问题关键词的文本块
+"""
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from langchain.schema import Document
+from document_loader import DocumentLoader
+
+
+def tokenize(text: str) -> List[str]:
+    """字符二元组分词（去除空白和标点，英文和数字转小写）"""
+    text = re.sub(r'[\s\W_]+', '', text.lower())
+    return [text[i:i + 2] for i in range(len(text) - 1)] or list(text)
+
+
+class LexicalIndex:
+    """BM25倒排索引"""
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        """
+        构建倒排索引
+
+        Args:
+            documents: 文本块列表
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for doc_id, doc in enumerate(documents):
+            terms = Counter(tokenize(doc.page_content))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+
+        self.avg_length = sum(self.lengths) / max(1, len(self.lengths))
+
+    @classmethod
+    def from_directory(cls, data_dir: str, chunk_size: int = 500, chunk_overlap: int = 75) -> 'LexicalIndex':
+        """
+        直接从文档目录构建（只做加载和分块，不调用Embedding）
+
+        Args:
+            data_dir: 文档目录
+            chunk_size: 文本块大小
+            chunk_overlap: 文本块重叠大小
+
+        Returns:
+            词面索引
+        """
+        loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        documents = []
+        for filename in sorted(os.listdir(data_dir)):
+            if filename.endswith(('.txt', '.pdf', '.md')):
+                documents.extend(loader.load_and_split(os.path.join(data_dir, filename)))
+        return cls(documents)
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[Document, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            k: 返回的文档数量
+
+        Returns:
+            (文档, BM25分数) 列表，按分数从高到低排列，不包含零分文档
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        n = len(self.documents)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[doc_id], score) for doc_id, score in ranked]
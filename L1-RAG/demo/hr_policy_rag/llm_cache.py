@@ -0,0 +1,148 @@
+"""
+LLM响应缓存模块：对完全相同的Prompt复用已生成的回答
+
+核心知识点：
+1. 精确匹配缓存：以"完整的Prompt消息 + 模型名称 + 温度"的哈希作为键，
+   任何一处不同都视为不同请求，保证命中的回答与重新调用在语义上等价
+2. 持久化与多进程共享：使用SQLite（WAL模式）存储，多个进程可以同时读写同一个缓存文件
+3. 容量控制：按最近访问时间淘汰最久未使用的条目（LRU），缓存文件大小有上限
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage
+
+
+class LLMCache:
+    """基于SQLite的LLM响应缓存"""
+
+    # 每写入多少条执行一次淘汰检查，避免每次写入都扫描
+    EVICT_INTERVAL = 64
+
+    def __init__(self, db_path: str, max_entries: int = 10000):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite数据库文件路径
+            max_entries: 最多保留的缓存条目数
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            # WAL模式下读写互不阻塞，适合多进程共享
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(messages: List[BaseMessage], model_name: str, temperature: float) -> str:
+        """
+        计算缓存键
+
+        Args:
+            messages: 已格式化的Prompt消息
+            model_name: 模型名称
+            temperature: 温度参数
+
+        Returns:
+            SHA256十六进制字符串
+        """
+        payload = json.dumps({
+            "messages": [[message.type, message.content] for message in messages],
+            "model": model_name,
+            "temperature": temperature
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的回答；未命中返回None
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            response: LLM回答
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, response, now, now)
+        )
+
+        with self._lock:
+            self._puts += 1
+            should_evict = self._puts % self.EVICT_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        淘汰超出容量的最久未使用条目
+
+        Returns:
+            删除的条目数
+        """
+        cursor = self._connect().execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        return cursor.rowcount
+
+    def clear(self):
+        """清空缓存"""
+        self._connect().execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
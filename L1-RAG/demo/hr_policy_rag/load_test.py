@@ -0,0 +1,413 @@
+"""
+压测模块：用本地的OpenAI兼容替身服务压测完整的RAG流程，不消耗真实API额度
+
+核心知识点：
+1. 替身服务：在本机启动实现 /v1/embeddings 和 /v1/chat/completions 的HTTP服务，
+   可配置首Token延迟、生成速度（Token/秒）和错误注入比例，模拟真实接口的耗时特征
+2. 开环压测：按目标QPS定时发出请求，不等待上一个请求完成；延迟从"计划发出时刻"开始计算，
+   系统过载时排队时间也计入延迟，避免闭环压测低估尾延迟（coordinated omission）
+3. 容量规划：报告实际吞吐量、P50/P90/P99延迟和错误率，找出系统能承受的最大QPS
+4. 延迟SLO：替身服务支持流式输出（SSE），设置截止时间后可观察首Token超时的降级比例和有上界的尾延迟
+"""
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+from embedding_backends import HashingEmbeddings
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """替身服务的HTTP请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        stand_in: OpenAIStandIn = self.server.stand_in
+
+        if self.path.endswith("/embeddings"):
+            status, payload = stand_in.handle_embeddings(body)
+        elif self.path.endswith("/chat/completions") and body.get("stream"):
+            return stand_in.stream_chat(self, body)
+        elif self.path.endswith("/chat/completions"):
+            status, payload = stand_in.handle_chat(body)
+        else:
+            status, payload = 404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}}
+
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 压测时每秒上百条访问日志没有意义
+        pass
+
+
+class OpenAIStandIn:
+    """本地OpenAI兼容替身服务"""
+
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        tokens_per_second: float = 50,
+        completion_tokens: int = 80,
+        embed_latency_ms: float = 30,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        dimension: int = 1536,
+        seed: int = 0
+    ):
+        """
+        初始化替身服务
+
+        Args:
+            latency_ms: 对话接口的首Token延迟（毫秒）
+            tokens_per_second: 对话接口的生成速度，总耗时 = 首Token延迟 + 回答Token数 / 生成速度
+            completion_tokens: 每个回答的Token数
+            embed_latency_ms: Embedding接口每次调用的延迟（毫秒）
+            error_rate: 注入错误的请求比例（0~1）
+            error_status: 注入错误时返回的HTTP状态码（500 服务错误，429 限流）
+            dimension: 返回的向量维度
+            seed: 错误注入的随机种子
+        """
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embed_latency_ms = embed_latency_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+        # 向量由本地哈希模型生成：相同文本得到相同向量，检索结果有意义
+        self.embedder = HashingEmbeddings(dimension=dimension, n_features=2 ** 12)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"embeddings": 0, "chat": 0, "injected_errors": 0, "cancelled": 0}
+
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """供OpenAI客户端使用的 base_url"""
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'OpenAIStandIn':
+        """在后台线程中启动服务（监听本机随机端口）"""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _inject_error(self, endpoint: str):
+        """按比例注入错误；返回错误响应或None"""
+        with self._lock:
+            self.counts[endpoint] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.counts["injected_errors"] += 1
+        if not failed:
+            return None
+        error_type = "rate_limit_error" if self.error_status == 429 else "server_error"
+        return self.error_status, {"error": {"message": "injected by load test", "type": error_type}}
+
+    def handle_embeddings(self, body: Dict):
+        """处理 /v1/embeddings"""
+        time.sleep(self.embed_latency_ms / 1000)
+        error = self._inject_error("embeddings")
+        if error is not None:
+            return error
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # 客户端可能发送tiktoken编码后的Token ID列表，转成字符串后同样能得到稳定的向量
+        texts = [item if isinstance(item, str) else " ".join(map(str, item)) for item in inputs]
+        vectors = self.embedder.embed_array(texts)
+
+        if body.get("encoding_format") == "base64":
+            embeddings = [base64.b64encode(vector.astype(np.float32).tobytes()).decode('ascii') for vector in vectors]
+        else:
+            embeddings = vectors.tolist()
+
+        return 200, {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": embedding} for i, embedding in enumerate(embeddings)],
+            "model": body.get("model", "stand-in"),
+            "usage": {"prompt_tokens": sum(len(text) for text in texts), "total_tokens": sum(len(text) for text in texts)}
+        }
+
+    def _completion(self) -> str:
+        """替身回答内容（长度为 completion_tokens 个字符）"""
+        return ("根据公司制度文档，" + "相关规定请参考上述文档片段。" * self.completion_tokens)[:self.completion_tokens]
+
+    def stream_chat(self, handler: BaseHTTPRequestHandler, body: Dict):
+        """
+        处理 stream=true 的 /v1/chat/completions：首Token延迟后按生成速度逐段发送SSE事件
+
+        Args:
+            handler: 当前HTTP请求处理器
+            body: 请求体
+        """
+        time.sleep(self.latency_ms / 1000)
+        error = self._inject_error("chat")
+        if error is not None:
+            status, payload = error
+            data = json.dumps(payload).encode('utf-8')
+            handler.send_response(status)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+            return
+
+        # 不预先知道长度，写完后关闭连接表示结束
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+
+        chunk_id, created, model = f"chatcmpl-standin-{time.time_ns()}", int(time.time()), body.get("model", "stand-in")
+
+        def event(delta: Dict, finish_reason: Optional[str] = None) -> bytes:
+            payload = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        # 每次发送5个Token；客户端取消（断开连接）后停止生成
+        content, step = self._completion(), 5
+        try:
+            handler.wfile.write(event({"role": "assistant", "content": ""}))
+            handler.wfile.flush()
+            for start in range(0, len(content), step):
+                handler.wfile.write(event({"content": content[start:start + step]}))
+                handler.wfile.flush()
+                time.sleep(step / self.tokens_per_second)
+            handler.wfile.write(event({}, "stop") + b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self._lock:
+                self.counts["cancelled"] += 1
+
+    def handle_chat(self, body: Dict):
+        """处理 /v1/chat/completions"""
+        time.sleep(self.latency_ms / 1000 + self.completion_tokens / self.tokens_per_second)
+        error = self._inject_error("chat")
+        if error is not None:
+            return error
+
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+        content = self._completion()
+        return 200, {
+            "id": f"chatcmpl-standin-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stand-in"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": prompt_tokens + self.completion_tokens
+            }
+        }
+
+
+class LoadGenerator:
+    """开环负载生成器：按固定间隔发出请求，不等待前一个请求完成"""
+
+    def __init__(self, rag_chain, questions: List[str], qps: float, duration: float, max_in_flight: int = 256):
+        """
+        初始化负载生成器
+
+        Args:
+            rag_chain: 被压测的RAG链
+            questions: 问题池（轮流使用，并附加序号避免命中查询缓存）
+            qps: 目标每秒请求数
+            duration: 压测持续时间（秒）
+            max_in_flight: 同时执行的最大请求数（超出的请求排队，排队时间计入延迟）
+        """
+        self.rag_chain = rag_chain
+        self.questions = questions
+        self.qps = qps
+        self.duration = duration
+        self.max_in_flight = max_in_flight
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _request(self, i: int, scheduled: float):
+        """执行一个请求并记录结果"""
+        question = f"{self.questions[i % len(self.questions)]}（{i}）"
+        error, degraded = None, None
+        try:
+            degraded = self.rag_chain.invoke(question, k=3, use_faq=False, use_cache=False).get("degraded")
+        except Exception as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with self._lock:
+            self.records.append({"latency": finished - scheduled, "finished": finished, "error": error,
+                                 "degraded": degraded})
+
+    def run(self) -> Dict:
+        """
+        执行压测
+
+        Returns:
+            统计结果
+        """
+        total = int(self.qps * self.duration)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for i in range(total):
+                scheduled = start + i / self.qps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._request, i, scheduled)
+        return self.summarize(start)
+
+    def summarize(self, start: float) -> Dict:
+        """计算吞吐量、延迟分位数和错误率"""
+        ok = [record for record in self.records if record["error"] is None]
+        errors: Dict[str, int] = {}
+        for record in self.records:
+            if record["error"] is not None:
+                errors[record["error"]] = errors.get(record["error"], 0) + 1
+
+        elapsed = max((record["finished"] for record in self.records), default=start) - start
+        latencies = np.array([record["latency"] for record in ok]) * 1000 if ok else np.zeros(1)
+        return {
+            "target_qps": self.qps,
+            "sent": len(self.records),
+            "succeeded": len(ok),
+            "error_rate": round(1 - len(ok) / max(1, len(self.records)), 4),
+            "errors": errors,
+            "excerpt_rate": round(sum(record["degraded"] == "excerpt" for record in ok) / max(1, len(ok)), 4),
+            "throughput_qps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "latency_p90_ms": round(float(np.percentile(latencies, 90)), 1),
+            "latency_p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            "latency_max_ms": round(float(latencies.max()), 1),
+        }
+
+
+def run_load_test(qps: float = 10, duration: float = 30, deadline: Optional[float] = None,
+                  **stand_in_options) -> Dict:
+    """
+    启动替身服务，构建知识库并按目标QPS压测 RAGChain
+
+    Args:
+        qps: 目标每秒请求数
+        duration: 压测持续时间（秒）
+        deadline: RAG链的请求截止时间（秒），None表示不设截止时间
+        **stand_in_options: 传给 OpenAIStandIn 的参数（延迟、生成速度、错误注入等）
+
+    Returns:
+        统计结果
+    """
+    from langchain_openai import OpenAIEmbeddings
+    from config import Config
+    from document_loader import DocumentLoader
+    from rag_chain import RAGChain
+    from vector_store import VectorStoreManager
+
+    print("=" * 60)
+    print("RAG压测（本地OpenAI替身服务）")
+    print("=" * 60)
+
+    # 构建索引时不注入错误，注入只作用于压测期间的请求
+    error_rate = stand_in_options.pop("error_rate", 0.0)
+    stand_in = OpenAIStandIn(**stand_in_options).start()
+    os.environ["OPENAI_BASE_URL"] = stand_in.base_url
+    os.environ["OPENAI_API_KEY"] = "load-test"
+    print(f"🧪 替身服务: {stand_in.base_url}")
+
+    try:
+        # 向量化同样走替身服务
+        loader = DocumentLoader(chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP)
+        documents = []
+        for filename in sorted(os.listdir(Config.DATA_DIR)):
+            if filename.endswith(('.txt', '.pdf', '.md')):
+                documents.extend(loader.load_and_split(os.path.join(Config.DATA_DIR, filename)))
+        # 客户端不重试：注入的错误应体现在错误率和尾延迟中，而不是被重试策略吸收
+        vector_manager = VectorStoreManager(
+            embeddings=OpenAIEmbeddings(model="text-embedding-3-small", max_retries=0),
+            hierarchical=Config.HIERARCHICAL_RETRIEVAL,
+            top_sections=Config.TOP_SECTIONS
+        )
+        vector_manager.create_vector_store(documents)
+        rag = RAGChain(
+            vector_manager,
+            model_name=Config.OPENAI_MODEL,
+            max_prompt_tokens=Config.MAX_PROMPT_TOKENS,
+            compress_context_tokens=Config.CONTEXT_MAX_TOKENS if Config.CONTEXT_COMPRESSION else None,
+            deadline_seconds=deadline,
+            excerpt_tokens=Config.EXCERPT_MAX_TOKENS,
+            max_retries=0
+        )
+        stand_in.error_rate = error_rate
+
+        print(f"🚀 目标 {qps} QPS，持续 {duration}s ...")
+        generator = LoadGenerator(rag, Config.FAQ_QUESTIONS, qps, duration)
+        # RAG链每个请求都会打印过程信息，压测期间屏蔽
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = generator.run()
+    finally:
+        stand_in.stop()
+
+    print(f"\n✅ 压测完成: 发出 {stats['sent']}，成功 {stats['succeeded']}，错误率 {stats['error_rate']:.2%} {stats['errors']}")
+    print(f"  吞吐量: {stats['throughput_qps']} QPS（目标 {qps}）")
+    print(f"  延迟: P50 {stats['latency_p50_ms']}ms | P90 {stats['latency_p90_ms']}ms | "
+          f"P99 {stats['latency_p99_ms']}ms | 最大 {stats['latency_max_ms']}ms")
+    if deadline is not None:
+        print(f"  截止时间 {deadline}s，原文摘录降级比例: {stats['excerpt_rate']:.2%} {rag.slo_stats}")
+    print(f"  替身服务调用: {stand_in.counts}")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RAG开环压测（本地OpenAI替身服务）")
+    parser.add_argument("--qps", type=float, default=10, help="目标每秒请求数")
+    parser.add_argument("--duration", type=float, default=30, help="压测持续时间（秒）")
+    parser.add_argument("--latency-ms", type=float, default=300, help="对话接口首Token延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="对话接口生成速度")
+    parser.add_argument("--completion-tokens", type=int, default=80, help="每个回答的Token数")
+    parser.add_argument("--embed-latency-ms", type=float, default=30, help="Embedding接口延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的状态码（500或429）")
+    parser.add_argument("--deadline", type=float, default=None, help="请求截止时间（秒），超时返回原文摘录")
+    args = parser.parse_args()
+
+    run_load_test(
+        qps=args.qps,
+        duration=args.duration,
+        deadline=args.deadline,
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embed_latency_ms=args.embed_latency_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
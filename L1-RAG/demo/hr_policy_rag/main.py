@@ -8,46 +8,166 @@
 """
 import os
 import sys
+import threading
+import time
+from typing import Dict, Optional
 from config import Config
 from document_loader import DocumentLoader
 from vector_store import VectorStoreManager
 from rag_chain import RAGChain
+from snapshot_store import SnapshotStore
+from ingest_pipeline import IngestionPipeline
+from out_of_core_index import OutOfCoreIndexBuilder
+from faq_index import FAQIndex
+from llm_cache import LLMCache
+from lexical_index import LexicalIndex
+from embedding_migration import EmbeddingMigration, migrate_knowledge_base
 
 
-def build_knowledge_base():
-    """构建知识库：加载文档、向量化、存储"""
+def create_vector_manager(embedding_model: Optional[str] = None) -> VectorStoreManager:
+    """按配置创建向量存储管理器（embedding_model 为空时使用 Config.EMBEDDING_MODEL）"""
+    return VectorStoreManager(
+        embedding_model=embedding_model or Config.EMBEDDING_MODEL,
+        hierarchical=Config.HIERARCHICAL_RETRIEVAL,
+        top_sections=Config.TOP_SECTIONS,
+        compress_chunks=Config.COMPRESS_CHUNKS,
+        reduce_dim=Config.EMBEDDING_REDUCED_DIM,
+        reduction=Config.EMBEDDING_REDUCTION,
+        cascade=Config.CASCADE_SEARCH,
+        cascade_candidates=Config.CASCADE_CANDIDATES,
+        follow_snapshot_model=Config.EMBEDDING_FOLLOW_SNAPSHOT
+    )
+
+
+def create_rag_chain(vector_manager: VectorStoreManager, attach_faq: bool = True) -> RAGChain:
+    """创建RAG链，并挂载FAQ答案索引（知识库版本变化时先重新生成失效的FAQ条目）"""
+    llm_cache = None
+    if Config.LLM_CACHE_ENABLED:
+        llm_cache = LLMCache(Config.LLM_CACHE_PATH, max_entries=Config.LLM_CACHE_MAX_ENTRIES)
+    rag = RAGChain(
+        vector_manager,
+        model_name=Config.OPENAI_MODEL,
+        llm_cache=llm_cache,
+        max_prompt_tokens=Config.MAX_PROMPT_TOKENS,
+        session_token_budget=Config.SESSION_TOKEN_BUDGET,
+        token_prices=Config.TOKEN_PRICES,
+        compress_context_tokens=Config.CONTEXT_MAX_TOKENS if Config.CONTEXT_COMPRESSION else None,
+        deadline_seconds=Config.SLO_DEADLINE_SECONDS,
+        excerpt_tokens=Config.EXCERPT_MAX_TOKENS,
+        chunk_timeout=Config.SLO_CHUNK_TIMEOUT_SECONDS,
+        request_timeout=Config.LLM_TIMEOUT_SECONDS,
+        max_retries=Config.LLM_MAX_RETRIES
+    )
+    
+    faq_index = FAQIndex.load(Config.FAQ_INDEX_PATH) if attach_faq else None
+    if faq_index is None:
+        return rag
+    
+    if faq_index.index_version != vector_manager.index_version:
+        print("🔄 知识库已更新，正在检查FAQ答案...")
+        regenerated = faq_index.refresh(rag, k=Config.TOP_K)
+        faq_index.save(Config.FAQ_INDEX_PATH)
+        print(f"✅ 重新生成 {regenerated} 条FAQ答案")
+    
+    rag.faq_index = faq_index
+    return rag
+
+
+def build_knowledge_base(progress: Optional[Dict] = None):
+    """
+    构建知识库：加载文档、向量化、存储
+    
+    Args:
+        progress: 可选的进度字典，流式入库时写入各阶段的实时指标
+    """
     print("=" * 60)
     print("步骤1: 构建知识库")
     print("=" * 60)
     
-    # 1. 加载文档
-    loader = DocumentLoader(
-        chunk_size=Config.CHUNK_SIZE,
-        chunk_overlap=Config.CHUNK_OVERLAP
-    )
-    
     # 查找数据目录中的所有文档
     data_dir = Config.DATA_DIR
-    documents = []
-    
-    for filename in os.listdir(data_dir):
-        if filename.endswith(('.txt', '.pdf', '.md')):
-            file_path = os.path.join(data_dir, filename)
-            print(f"\n📄 处理文件: {filename}")
-            docs = loader.load_and_split(file_path)
-            documents.extend(docs)
+    file_paths = [
+        os.path.join(data_dir, filename)
+        for filename in os.listdir(data_dir)
+        if filename.endswith(('.txt', '.pdf', '.md'))
+    ]
     
-    if not documents:
+    if not file_paths:
         print("❌ 未找到任何文档，请确保data目录下有文档文件")
         return None
     
-    # 2. 创建向量存储
-    print("\n" + "=" * 60)
-    print("步骤2: 向量化文档")
-    print("=" * 60)
+    vector_manager = create_vector_manager()
+    
+    if Config.OUT_OF_CORE_BUILD:
+        # 外存构建：向量落盘，在样本上训练IVF-PQ后分批写入索引，内存占用与语料规模基本无关
+        print("\n" + "=" * 60)
+        print("步骤2: 外存构建IVF-PQ索引")
+        print("=" * 60)
+        
+        builder = OutOfCoreIndexBuilder(
+            vector_manager,
+            Config.OUT_OF_CORE_WORK_DIR,
+            nlist=Config.IVF_NLIST,
+            pq_m=Config.PQ_M,
+            pq_bits=Config.PQ_BITS,
+            nprobe=Config.IVF_NPROBE,
+            add_batch_size=Config.OUT_OF_CORE_ADD_BATCH,
+            train_samples=Config.OUT_OF_CORE_TRAIN_SAMPLES,
+            chunk_size=Config.CHUNK_SIZE,
+            chunk_overlap=Config.CHUNK_OVERLAP,
+            load_workers=Config.INGEST_LOAD_WORKERS,
+            embed_workers=Config.INGEST_EMBED_WORKERS,
+            batch_size=Config.INGEST_BATCH_SIZE,
+            queue_size=Config.INGEST_QUEUE_SIZE
+        )
+        if progress is not None:
+            progress["ingest"] = builder.metrics
+        builder.run(file_paths)
+    elif Config.INGEST_PIPELINE:
+        # 流式入库：加载分块、向量化、写入索引三个阶段重叠执行
+        print("\n" + "=" * 60)
+        print("步骤2: 流式加载与向量化文档")
+        print("=" * 60)
+        
+        pipeline = IngestionPipeline(
+            vector_manager,
+            chunk_size=Config.CHUNK_SIZE,
+            chunk_overlap=Config.CHUNK_OVERLAP,
+            load_workers=Config.INGEST_LOAD_WORKERS,
+            embed_workers=Config.INGEST_EMBED_WORKERS,
+            batch_size=Config.INGEST_BATCH_SIZE,
+            queue_size=Config.INGEST_QUEUE_SIZE
+        )
+        if progress is not None:
+            progress["ingest"] = pipeline.metrics
+        pipeline.run(file_paths)
+    else:
+        # 1. 加载文档
+        loader = DocumentLoader(
+            chunk_size=Config.CHUNK_SIZE,
+            chunk_overlap=Config.CHUNK_OVERLAP
+        )
+        
+        documents = []
+        for file_path in file_paths:
+            print(f"\n📄 处理文件: {os.path.basename(file_path)}")
+            docs = loader.load_and_split(file_path)
+            documents.extend(docs)
+        
+        if not documents:
+            print("❌ 未从文档中分割出任何文本块")
+            return None
+        
+        # 2. 创建向量存储
+        print("\n" + "=" * 60)
+        print("步骤2: 向量化文档")
+        print("=" * 60)
+        
+        vector_manager.create_vector_store(documents)
     
-    vector_manager = VectorStoreManager(embedding_model=Config.EMBEDDING_MODEL)
-    vector_store = vector_manager.create_vector_store(documents)
+    if vector_manager.vector_store is None:
+        print("❌ 未从文档中分割出任何文本块")
+        return None
     
     # 3. 保存向量存储
     print("\n" + "=" * 60)
@@ -55,41 +175,305 @@ def build_knowledge_base():
     print("=" * 60)
     
     os.makedirs(os.path.dirname(Config.VECTOR_STORE_PATH), exist_ok=True)
-    vector_manager.save_vector_store(Config.VECTOR_STORE_PATH)
+    vector_manager.save_vector_store(Config.VECTOR_STORE_PATH, retain=Config.SNAPSHOT_RETENTION)
     
     print("\n✅ 知识库构建完成！")
     return vector_manager
 
 
-def load_knowledge_base():
-    """加载已存在的知识库"""
+def load_knowledge_base(progress: Optional[Dict] = None):
+    """
+    加载已存在的知识库（不存在时构建）
+    
+    Args:
+        progress: 可选的进度字典，构建时写入流式入库的实时指标
+    """
     print("=" * 60)
     print("加载知识库")
     print("=" * 60)
     
-    vector_manager = VectorStoreManager(embedding_model=Config.EMBEDDING_MODEL)
+    vector_manager = create_vector_manager()
+    
+    # 分发到服务节点的单文件包：只读映射打开，不在节点上构建
+    if Config.KB_BUNDLE_PATH:
+        vector_manager.open_bundle(Config.KB_BUNDLE_PATH)
+        print("✅ 知识库加载成功！")
+        return vector_manager
     
     try:
-        vector_manager.load_vector_store(Config.VECTOR_STORE_PATH)
+        vector_manager.load_vector_store(Config.VECTOR_STORE_PATH, version=Config.INDEX_VERSION)
         print("✅ 知识库加载成功！")
         return vector_manager
     except FileNotFoundError:
         print("❌ 知识库不存在，正在构建...")
-        return build_knowledge_base()
+        return build_knowledge_base(progress)
+
+
+class BackgroundKnowledgeBase:
+    """
+    后台加载知识库：启动后立即可以提问
+    
+    向量索引在后台线程中加载（不存在时构建），就绪之前的问题按 fallback 处理：
+    - "lexical": 先查FAQ（完全相同的问题），再用BM25词面检索到的文本块生成回答
+    - "wait": 排队等待索引就绪后再回答
+    重建或回滚时旧的RAG链继续服务，新索引就绪后再切换。
+    """
+    
+    def __init__(self, fallback: str = "lexical"):
+        """
+        初始化后台知识库
+        
+        Args:
+            fallback: 索引就绪前的处理方式，"lexical" 或 "wait"
+        """
+        self.fallback = fallback
+        self.rag: Optional[RAGChain] = None
+        self.vector_manager: Optional[VectorStoreManager] = None
+        
+        self.state = "idle"  # idle / loading / building / ready / failed
+        self.error: Optional[str] = None
+        self.progress: Dict = {}
+        self._started_at = 0.0
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        # 降级回答所需的资源（首次 start 时在后台线程中创建，只创建一次）
+        self._fallback_ready = threading.Event()
+        self._fallback_thread: Optional[threading.Thread] = None
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._fallback_faq: Optional[FAQIndex] = None
+        self._fallback_rag: Optional[RAGChain] = None
+        
+        # 在线Embedding模型迁移
+        self.migration: Optional[EmbeddingMigration] = None
+    
+    @property
+    def ready(self) -> bool:
+        """向量索引是否可用（重建期间旧索引仍可用）"""
+        return self.rag is not None
+    
+    def _busy_reason(self) -> Optional[str]:
+        """后台任务或迁移进行中时返回提示信息，否则返回None"""
+        if self._thread is not None and self._thread.is_alive():
+            return "⏳ 知识库正在后台处理中，请稍候"
+        if self.migration is not None and self.migration.active:
+            return "⏳ Embedding迁移进行中，请等待完成或输入 'migrate cancel' 取消"
+        return None
+    
+    def start(self, rebuild: bool = False) -> bool:
+        """
+        在后台线程中加载（或重建）知识库
+        
+        Args:
+            rebuild: 是否强制重新构建
+            
+        Returns:
+            是否启动了后台任务（已有任务或迁移进行中时返回False）
+        """
+        busy = self._busy_reason()
+        if busy is not None:
+            print(busy)
+            return False
+        
+        if self.fallback == "lexical" and self._fallback_thread is None:
+            self._fallback_thread = threading.Thread(target=self._prepare_fallback, daemon=True)
+            self._fallback_thread.start()
+        
+        self.state = "building" if rebuild else "loading"
+        self.error = None
+        self.progress = {}
+        self._started_at = time.time()
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, args=(rebuild,), daemon=True)
+        self._thread.start()
+        return True
+    
+    def rollback(self, version: Optional[str] = None) -> Optional[str]:
+        """
+        回滚到历史快照并重新加载：先确认可以启动加载，再切换发布版本
+        
+        Args:
+            version: 目标版本号，默认为当前版本的上一个版本
+            
+        Returns:
+            回滚后的版本号；后台任务或迁移进行中时不回滚，返回None
+        """
+        busy = self._busy_reason()
+        if busy is not None:
+            print(busy)
+            return None
+        
+        version = SnapshotStore(Config.VECTOR_STORE_PATH).rollback(version)
+        self.start()
+        return version
+    
+    def _prepare_fallback(self):
+        """后台线程：构建降级回答用的词面索引、FAQ和RAG链（与向量索引加载并行）"""
+        try:
+            self._lexical_index = LexicalIndex.from_directory(
+                Config.DATA_DIR, chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP
+            )
+            self._fallback_faq = FAQIndex.load(Config.FAQ_INDEX_PATH)
+            # 不加载向量索引的RAG链：检索结果由词面索引提供
+            self._fallback_rag = create_rag_chain(create_vector_manager(), attach_faq=False)
+        except Exception as e:
+            print(f"\n⚠️ 降级检索资源准备失败: {e}")
+        finally:
+            self._fallback_ready.set()
+    
+    def _run(self, rebuild: bool):
+        """后台线程：加载或构建索引，创建RAG链后原子地切换"""
+        try:
+            if rebuild:
+                vector_manager = build_knowledge_base(self.progress)
+            else:
+                vector_manager = load_knowledge_base(self.progress)
+            if vector_manager is None:
+                raise RuntimeError("无法加载或构建知识库")
+            
+            rag = create_rag_chain(vector_manager)
+            self.vector_manager, self.rag = vector_manager, rag
+            self.state = "ready"
+            print(f"\n✅ 知识库已就绪（耗时 {time.time() - self._started_at:.1f}s）")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"\n❌ 知识库加载失败: {e}")
+        finally:
+            self._done.set()
+    
+    def migrate(self, target_model: str):
+        """
+        在线迁移到新的Embedding模型：旧索引继续服务，后台限速重新向量化，完成后发布快照并切换RAG链
+        
+        Args:
+            target_model: 新的Embedding模型名称
+        """
+        if self.vector_manager is None or (self._thread is not None and self._thread.is_alive()):
+            print("⏳ 知识库尚未就绪，请稍后再迁移")
+            return
+        if self.migration is not None and self.migration.active:
+            print("⏳ Embedding迁移已在进行中")
+            return
+        
+        def promoted(vector_manager: VectorStoreManager):
+            rag = create_rag_chain(vector_manager)
+            self.vector_manager, self.rag = vector_manager, rag
+        
+        self.migration = migrate_knowledge_base(
+            self.vector_manager,
+            create_vector_manager(target_model),
+            Config.VECTOR_STORE_PATH,
+            requests_per_minute=Config.EMBEDDING_RATE_LIMIT_RPM,
+            tokens_per_minute=Config.EMBEDDING_RATE_LIMIT_TPM,
+            rate_share=Config.MIGRATION_RATE_SHARE,
+            batch_size=Config.MIGRATION_BATCH_SIZE,
+            retain=Config.SNAPSHOT_RETENTION,
+            on_promoted=promoted
+        )
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台任务结束
+        
+        Args:
+            timeout: 最长等待秒数
+            
+        Returns:
+            向量索引是否可用
+        """
+        self._done.wait(timeout)
+        return self.ready
+    
+    def status(self) -> Dict:
+        """
+        当前状态和进度
+        
+        Returns:
+            状态字典
+        """
+        status = {
+            "state": self.state,
+            "ready": self.ready,
+            "elapsed_seconds": round(time.time() - self._started_at, 1) if self._started_at else 0.0,
+            "index_version": self.vector_manager.index_version if self.vector_manager else None,
+            "error": self.error
+        }
+        ingest = self.progress.get("ingest")
+        if ingest is not None and self._thread is not None and self._thread.is_alive():
+            status["files"] = f"{ingest['load']['files_done']}/{ingest['load']['files_total']}"
+            status["chunks_indexed"] = ingest["index"]["chunks"]
+        if self.rag is not None and self.rag.deadline_seconds is not None:
+            stats = self.rag.slo_stats
+            status["excerpt_fallbacks"] = f"{stats['excerpt_fallbacks']}/{stats['deadline_requests']}"
+        if self.migration is not None:
+            progress = self.migration.progress()
+            status["migration"] = (f"{progress['state']} {progress['embedded']}/{progress['total']} "
+                                   f"({progress['percent']:.0f}%, ETA {progress['eta_seconds']:.0f}s)")
+        return status
+    
+    def answer(self, question: str, k: int = 3) -> dict:
+        """
+        回答问题：索引可用时走完整RAG流程，否则按 fallback 处理
+        
+        Args:
+            question: 用户问题
+            k: 检索的文档数量
+            
+        Returns:
+            与 RAGChain.invoke 结构相同的结果；降级回答带有 degraded 字段
+        """
+        rag = self.rag
+        if rag is not None:
+            return rag.invoke(question, k=k)
+        
+        if self.fallback == "wait":
+            print("⏳ 知识库加载中，问题已排队...")
+            while not self.wait(timeout=2) and self.state != "failed":
+                print(f"   {self.status()}")
+            if self.rag is None:
+                raise RuntimeError(f"知识库加载失败: {self.error}")
+            return self.rag.invoke(question, k=k)
+        
+        return self._fallback_answer(question, k)
+    
+    def _fallback_answer(self, question: str, k: int) -> dict:
+        """降级回答：FAQ完全匹配 → BM25词面检索 + LLM生成"""
+        if not self._fallback_ready.is_set():
+            # 词面索引在 start 时已开始后台构建，通常早于第一个问题完成
+            print("⏳ 关键词索引准备中...")
+            self._fallback_ready.wait()
+        if self._fallback_rag is None:
+            raise RuntimeError("知识库仍在加载，降级检索不可用")
+        
+        if self._fallback_faq is not None:
+            entry = self._fallback_faq.lookup_exact(question)
+            if entry is not None:
+                result = self._fallback_faq.to_result(question, entry)
+                result["usage"] = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0,
+                                   "context_tokens": 0, "trimmed_docs": 0}
+                result["session_usage"] = dict(self._fallback_rag.session_usage)
+                result["degraded"] = "faq"
+                return result
+        
+        docs = [doc for doc, _ in self._lexical_index.search(question, k=k)]
+        result = self._fallback_rag.invoke(question, k=k, use_faq=False, retrieved_docs=docs)
+        result["degraded"] = "lexical"
+        return result
 
 
-def interactive_qa(vector_manager: VectorStoreManager):
-    """交互式问答"""
+def interactive_qa(knowledge_base: BackgroundKnowledgeBase):
+    """交互式问答（知识库在后台加载，启动后即可提问）"""
     print("\n" + "=" * 60)
     print("HR制度智能问答系统")
     print("=" * 60)
     print("输入 'quit' 或 'exit' 退出")
     print("输入 'rebuild' 重新构建知识库")
+    print("输入 'rollback' 回滚到上一个知识库版本")
+    print("输入 'status' 查看知识库加载状态")
+    print("输入 'migrate <模型名>' 在线切换Embedding模型，'migrate cancel' 取消迁移")
     print("-" * 60)
     
-    # 创建RAG链
-    rag = RAGChain(vector_manager, model_name=Config.OPENAI_MODEL)
-    
     while True:
         try:
             # 获取用户输入
@@ -105,24 +489,56 @@ def interactive_qa(vector_manager: VectorStoreManager):
             
             # 重建知识库命令
             if question.lower() == 'rebuild':
-                vector_manager = build_knowledge_base()
-                if vector_manager:
-                    rag = RAGChain(vector_manager, model_name=Config.OPENAI_MODEL)
+                knowledge_base.start(rebuild=True)
+                continue
+            
+            # 回滚知识库命令
+            if question.lower() == 'rollback':
+                version = knowledge_base.rollback()
+                if version is not None:
+                    print(f"⏪ 已回滚到版本: {version}")
+                continue
+            
+            # Embedding模型迁移命令
+            if question.lower().startswith('migrate '):
+                target_model = question.split(maxsplit=1)[1]
+                if target_model == 'cancel':
+                    if knowledge_base.migration is not None:
+                        knowledge_base.migration.cancel()
+                else:
+                    knowledge_base.migrate(target_model)
+                continue
+            
+            # 状态查询命令
+            if question.lower() == 'status':
+                print(f"📊 {knowledge_base.status()}")
                 continue
             
             # 执行RAG查询
             print("\n" + "-" * 60)
-            result = rag.invoke(question, k=Config.TOP_K)
+            result = knowledge_base.answer(question, k=Config.TOP_K)
             
             # 显示结果
+            if result.get('degraded') == 'excerpt':
+                print("\n⚠️ 模型服务响应超时，本回答为制度原文摘录")
+            elif result.get('degraded'):
+                print(f"\n⚠️ 知识库仍在加载，本回答基于{'FAQ' if result['degraded'] == 'faq' else '关键词检索'}")
             print(f"\n📝 回答:\n{result['answer']}")
             
+            # 显示Token用量
+            usage, session = result['usage'], result['session_usage']
+            print(f"\n🧮 Token: Prompt {usage['prompt_tokens']} (上下文 {usage['context_tokens']}) + "
+                  f"回答 {usage['completion_tokens']}, 费用 ${usage['cost']:.5f} | "
+                  f"会话累计 {session['total_tokens']}, ${session['cost']:.5f}")
+            
             # 显示参考文档
             print(f"\n📚 参考文档 ({len(result['retrieved_docs'])} 条):")
             for i, doc in enumerate(result['retrieved_docs'], 1):
                 source = doc.metadata.get('source', 'unknown')
+                section = doc.metadata.get('section')
+                label = f"{source} | {section}" if section else source
                 preview = doc.page_content[:100].replace('\n', ' ')
-                print(f"  {i}. [{source}] {preview}...")
+                print(f"  {i}. [{label}] {preview}...")
             
             print("-" * 60)
             
@@ -146,15 +562,11 @@ def main():
         print("OPENAI_API_KEY=your_api_key_here")
         sys.exit(1)
     
-    # 加载或构建知识库
-    vector_manager = load_knowledge_base()
-    
-    if vector_manager is None:
-        print("❌ 无法加载或构建知识库")
-        sys.exit(1)
+    # 在后台加载或构建知识库，同时立即开始交互式问答
+    knowledge_base = BackgroundKnowledgeBase(fallback=Config.STARTUP_FALLBACK)
+    knowledge_base.start()
     
-    # 启动交互式问答
-    interactive_qa(vector_manager)
+    interactive_qa(knowledge_base)
 
 
 if __name__ == "__main__":
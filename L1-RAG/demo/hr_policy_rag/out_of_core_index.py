@@ -0,0 +1,294 @@
+"""
+外存索引构建模块：语料无法一次放入内存时，边向量化边落盘，再分批写入IVF-PQ索引
+
+核心知识点：
+1. 外存构建：向量化结果逐批追加到磁盘上的向量文件，文本块逐块写入数据文件，
+   元数据追加为列式数组，内存中不积累Document对象和向量列表
+2. IVF-PQ：先用K-Means把向量空间划分为 nlist 个簇（倒排表），检索时只扫描最近的 nprobe 个簇；
+   每个向量再用乘积量化（PQ）压缩为 pq_m 个字节的编码，百万级向量的索引只占几十到几百MB
+3. 抽样训练：簇中心和PQ码本只需要在一小部分随机样本上训练，与语料规模无关
+4. 分批写入：训练完成后按固定批次从内存映射的向量文件读取并写入索引，
+   峰值内存 ≈ 一个批次的向量 + 训练样本 + 索引中的压缩编码 + 每个文本块几十字节的列式元数据
+"""
+import os
+import random
+import shutil
+import time
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+from chunk_store import ChunkStore, ChunkStoreWriter
+from chunk_table import ChunkTable, MetadataColumnsBuilder, RowIds
+from ingest_pipeline import IngestionPipeline
+from vector_store import VectorStoreManager
+
+
+class OutOfCoreIndexBuilder(IngestionPipeline):
+    """
+    外存索引构建器
+
+    复用流式入库的"加载分块 → 向量化"阶段，写入阶段改为落盘：
+    1. 落盘：向量追加到 vectors.f32，文本块追加到数据文件，元数据追加到列式数组
+    2. 训练：从向量文件中随机抽取 train_samples 个向量训练IVF簇中心和PQ码本
+    3. 写入：按 add_batch_size 分批读取向量文件写入索引，完成后删除向量文件
+
+    构建结果直接挂到 vector_manager 上，之后照常调用 save_vector_store 保存快照。
+    外存构建不生成章节索引（章节摘要需要全部文本块向量常驻内存），检索直接查询IVF索引。
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    # IVF每个簇至少需要的训练样本数（FAISS的经验值）
+    MIN_POINTS_PER_CENTROID = 39
+
+    def __init__(
+        self,
+        vector_manager: VectorStoreManager,
+        work_dir: str,
+        nlist: int = 4096,
+        pq_m: int = 64,
+        pq_bits: int = 8,
+        nprobe: int = 16,
+        add_batch_size: int = 10000,
+        train_samples: int = 100000,
+        **pipeline_options
+    ):
+        """
+        初始化外存索引构建器
+
+        Args:
+            vector_manager: 向量存储管理器（提供Embedding模型并接收构建结果）
+            work_dir: 落盘目录，存放向量文件和文本块数据文件（需要足够的磁盘空间）
+            nlist: IVF簇数量（语料较小时自动减少）
+            pq_m: 每个向量的PQ子空间数量，即压缩编码的字节数（8位编码时）
+            pq_bits: 每个子空间的编码位数
+            nprobe: 检索时扫描的簇数量
+            add_batch_size: 训练后每次写入索引的向量数量
+            train_samples: 训练簇中心和码本的样本数量
+            **pipeline_options: 流式入库参数（chunk_size、embed_workers、batch_size等）
+        """
+        super().__init__(vector_manager, **pipeline_options)
+        self.work_dir = work_dir
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.nprobe = nprobe
+        self.add_batch_size = add_batch_size
+        self.train_samples = train_samples
+
+        self.build_dir: Optional[str] = None
+        self.count = 0
+        self.dimension: Optional[int] = None
+        self._vector_file = None
+        self._chunk_writer: Optional[ChunkStoreWriter] = None
+        self._metadata = MetadataColumnsBuilder()
+        self.metrics["build"] = {"index": None, "train_seconds": 0.0, "add_seconds": 0.0, "code_bytes": 0}
+
+    def _write(self, batch: List[Document], vectors: List[List[float]]):
+        """落盘：向量追加到向量文件，文本块和元数据追加到数据文件和列式数组"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._vector_file is None:
+            self._start_build_dir()
+            self.dimension = vectors.shape[1]
+            self._vector_file = open(os.path.join(self.build_dir, self.VECTORS_FILE), 'wb')
+            # 先不压缩写入；需要压缩时在全部写完后按样本训练字典再转存
+            self._chunk_writer = ChunkStoreWriter(os.path.join(self.build_dir, "raw"), codec="none")
+
+        self._vector_file.write(vectors.tobytes())
+        for doc in batch:
+            self._chunk_writer.append(doc.page_content)
+            self._metadata.append(doc.metadata)
+        self.count += len(batch)
+
+    def _start_build_dir(self):
+        """
+        为本次构建创建独立的子目录
+
+        上一次构建的索引可能仍在服务中并内存映射着旧目录里的数据文件，因此不能原地覆盖；
+        旧目录保留到本次构建成功挂载之后再由 _remove_previous_builds 删除，构建失败时上一次的结果不受影响。
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.build_dir = os.path.join(self.work_dir, f"build-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        os.makedirs(self.build_dir)
+
+    def _finish(self):
+        """训练IVF-PQ，分批写入向量，并把结果挂到向量存储管理器上"""
+        if self._vector_file is None:
+            return
+
+        self._vector_file.close()
+        chunk_store = self._chunk_writer.close()
+        vector_path = os.path.join(self.build_dir, self.VECTORS_FILE)
+        vectors = np.memmap(vector_path, dtype=np.float32, mode='r', shape=(self.count, self.dimension))
+
+        try:
+            index = self._train(vectors)
+            self._add(index, vectors)
+        finally:
+            del vectors
+            os.remove(vector_path)
+
+        if self.vector_manager.compress_chunks:
+            chunk_store = self._compress_chunks(chunk_store)
+
+        manager = self.vector_manager
+        manager.vector_store = FAISS(
+            embedding_function=manager.embeddings,
+            index=index,
+            docstore=ChunkTable(self._metadata.build(), chunk_store),
+            index_to_docstore_id=RowIds(self.count)
+        )
+        manager.section_index = None
+        self._remove_previous_builds()
+
+    def _remove_previous_builds(self):
+        """新索引挂载成功后删除之前构建（包括失败的构建）留下的目录；删除文件不影响已经建立的内存映射（POSIX语义）"""
+        for name in os.listdir(self.work_dir):
+            path = os.path.join(self.work_dir, name)
+            if path != self.build_dir:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _sample(self, vectors: np.ndarray) -> np.ndarray:
+        """从向量文件中随机抽取训练样本（按行号排序后读取，尽量顺序访问磁盘）"""
+        rows = sorted(random.Random(0).sample(range(self.count), min(self.count, self.train_samples)))
+        return np.ascontiguousarray(vectors[rows])
+
+    def create_index(self, dimension: int):
+        """
+        按语料规模创建索引
+
+        语料太小（不足以训练PQ码本）时退回精确的Flat索引；
+        簇数量不超过 样本数 / MIN_POINTS_PER_CENTROID，PQ子空间数量取能整除维度的最大值。
+
+        Args:
+            dimension: 写入索引的向量维度（降维后）
+
+        Returns:
+            未训练的FAISS索引
+        """
+        import faiss
+
+        samples = min(self.count, self.train_samples)
+        if samples < self.MIN_POINTS_PER_CENTROID * (1 << self.pq_bits):
+            return faiss.IndexFlatL2(dimension)
+
+        nlist = max(1, min(self.nlist, samples // self.MIN_POINTS_PER_CENTROID))
+        pq_m = max(m for m in range(1, min(self.pq_m, dimension) + 1) if dimension % m == 0)
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}x{self.pq_bits}")
+        faiss.extract_index_ivf(index).nprobe = min(self.nprobe, nlist)
+        return index
+
+    def _train(self, vectors: np.ndarray):
+        """在随机样本上拟合降维器（PCA）并训练索引"""
+        started = time.perf_counter()
+        sample = self._sample(vectors)
+
+        reducer = self.vector_manager.reducer
+        if reducer is not None:
+            if not reducer.fitted:
+                reducer.fit(sample)
+            sample = reducer.transform(sample)
+
+        index = self.create_index(sample.shape[1])
+        if not index.is_trained:
+            print(f"🎯 在 {len(sample)} 个样本上训练索引...")
+            index.train(sample)
+
+        metrics = self.metrics["build"]
+        metrics["index"] = type(index).__name__
+        metrics["train_seconds"] = time.perf_counter() - started
+        return index
+
+    def _add(self, index, vectors: np.ndarray):
+        """按固定批次从内存映射的向量文件读取并写入索引"""
+        started = time.perf_counter()
+        for start in range(0, self.count, self.add_batch_size):
+            batch = np.ascontiguousarray(vectors[start:start + self.add_batch_size])
+            if self.vector_manager.reducer is not None:
+                batch = self.vector_manager.reducer.transform(batch)
+            index.add(batch)
+            print(f"📥 写入索引 {index.ntotal}/{self.count}")
+
+        metrics = self.metrics["build"]
+        metrics["add_seconds"] = time.perf_counter() - started
+        metrics["code_bytes"] = index.sa_code_size() * index.ntotal
+
+    def _compress_chunks(self, raw: ChunkStore) -> ChunkStore:
+        """在随机样本上训练压缩字典，再逐块转存为压缩格式"""
+        count = len(raw)
+        samples = [raw.get(i) for i in random.Random(0).sample(range(count), min(count, 2000))]
+        writer = ChunkStoreWriter(os.path.join(self.build_dir, "chunks"), codec=None, samples=samples)
+        for i in range(count):
+            writer.append(raw.get(i))
+        raw.close()
+        shutil.rmtree(os.path.join(self.build_dir, "raw"))
+        return writer.close()
+
+    def print_summary(self):
+        """在流式入库耗时之外打印索引训练和写入的统计"""
+        super().print_summary()
+        build = self.metrics["build"]
+        if build["index"] is not None:
+            print(f"  索引类型: {build['index']}, 训练: {build['train_seconds']:.2f}s, "
+                  f"写入: {build['add_seconds']:.2f}s, 向量编码: {build['code_bytes'] / 1024 / 1024:.1f}MB")
+
+
+def demo_out_of_core_build(copies: int = 400):
+    """
+    演示外存构建：把示例文档复制多份作为大语料，用本地哈希Embedding构建IVF-PQ索引，
+    并与内存中的精确索引对比召回率和峰值内存
+
+    Args:
+        copies: 示例文档的复制份数
+    """
+    import resource
+    import tempfile
+
+    print("=" * 60)
+    print("外存索引构建演示")
+    print("=" * 60)
+
+    source = os.path.join(os.path.dirname(__file__), "data", "hr_policy.txt")
+    with open(source, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        os.makedirs(data_dir)
+        for copy in range(copies):
+            with open(os.path.join(data_dir, f"hr_policy_{copy}.txt"), 'w', encoding='utf-8') as f:
+                f.write(text.replace("公司", f"第{copy}分公司"))
+        file_paths = [os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))]
+
+        vector_manager = VectorStoreManager(embedding_model="local-hash")
+        builder = OutOfCoreIndexBuilder(vector_manager, os.path.join(tmp, "work"), nlist=128, pq_m=16,
+                                        add_batch_size=2000, batch_size=256)
+        builder.run(file_paths)
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        # 以精确检索为标准计算召回率（这里为了对比才把全部向量读入内存）
+        import faiss
+        index = vector_manager.vector_store.index
+        texts = [doc.page_content for doc in vector_manager.iter_documents()]
+        exact = faiss.IndexFlatL2(index.d)
+        exact.add(vector_manager.embeddings.embed_array(texts))
+
+        queries = vector_manager.embeddings.embed_array([f"第{copy}分公司年假如何申请？" for copy in range(0, copies, 7)])
+        _, expected = exact.search(queries, 10)
+        _, found = index.search(queries, 10)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, expected)])
+
+        print(f"\n文本块: {builder.count}，向量维度: {builder.dimension}")
+        print(f"recall@10（对比精确检索）: {recall:.3f}")
+        print(f"全维向量: {exact.ntotal * exact.d * 4 / 1024 / 1024:.1f}MB，"
+              f"IVF-PQ编码: {builder.metrics['build']['code_bytes'] / 1024 / 1024:.1f}MB")
+        print(f"构建峰值内存(RSS): {peak_mb:.0f}MB")
+
+        results = vector_manager.similarity_search("年假如何申请？", k=1)
+        print(f"\n🔍 检索测试: {results[0].page_content[:100]}...")
+        vector_manager.vector_store.docstore.chunk_store.close()
+
+
+if __name__ == "__main__":
+    demo_out_of_core_build()
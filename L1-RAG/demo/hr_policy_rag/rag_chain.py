@@ -5,34 +5,117 @@ RAG链模块：实现完整的检索增强生成流程
 1. RAG流程：检索(Retrieval) + 生成(Generation)
 2. Prompt工程：设计有效的提示词模板
 3. 上下文增强：将检索结果注入到生成模型的上下文中
+4. FAQ直答：高频问题命中预生成答案时跳过检索和生成
+5. 响应缓存：Prompt完全相同时复用已生成的回答
+6. Token预算：统计每次请求的Token与费用，超出预算时裁剪上下文或拒绝调用
+7. 上下文压缩：只保留文本块中与问题相关的句子，减少Prompt Token和生成延迟
+8. 延迟SLO：每个请求有截止时间，截止前没有收到首Token（或之后的片段间隔过长）时取消生成，
+   改为返回本地抽取的原文摘录（带引用），模型服务故障时尾延迟依然有上界
 """
+import asyncio
 import os
-from typing import List
+import threading
+import time
+from typing import List, Optional, Tuple
 from langchain.schema import Document
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 from vector_store import VectorStoreManager
+from faq_index import FAQIndex
+from llm_cache import LLMCache
+from token_counter import TokenCounter, TokenBudgetExceeded
+from context_compressor import ContextCompressor
 
 
 class RAGChain:
     """RAG链：实现检索增强生成"""
     
-    def __init__(self, vector_store_manager: VectorStoreManager, model_name: str = "gpt-3.5-turbo"):
+    # 超时降级回答的标注，提示用户这不是模型整理后的回答
+    EXCERPT_NOTICE = "⚠️ 回答生成超时，以下为制度原文摘录（未经整理，请以原文为准）："
+    
+    def __init__(
+        self,
+        vector_store_manager: VectorStoreManager,
+        model_name: str = "gpt-3.5-turbo",
+        faq_index: Optional[FAQIndex] = None,
+        llm_cache: Optional[LLMCache] = None,
+        max_prompt_tokens: Optional[int] = None,
+        session_token_budget: Optional[int] = None,
+        token_prices: Tuple[float, float] = (0.0005, 0.0015),
+        compress_context_tokens: Optional[int] = None,
+        deadline_seconds: Optional[float] = None,
+        excerpt_tokens: int = 200,
+        chunk_timeout: float = 10.0,
+        request_timeout: Optional[float] = 60.0,
+        max_retries: int = 2
+    ):
         """
         初始化RAG链
         
         Args:
             vector_store_manager: 向量存储管理器
             model_name: 使用的LLM模型名称
+            faq_index: 预生成的FAQ答案索引，命中时直接返回答案
+            llm_cache: LLM响应缓存，Prompt完全相同时复用已生成的回答
+            max_prompt_tokens: 单次请求的Prompt Token预算，超出时裁剪上下文
+            session_token_budget: 会话累计Token预算，超出后拒绝继续调用LLM
+            token_prices: 每1K Token的价格（Prompt, 回答），用于估算费用
+            compress_context_tokens: 上下文压缩后的Token预算，None表示不压缩
+            deadline_seconds: 默认的请求截止时间（秒，从 invoke 开始计时），None表示不限
+            excerpt_tokens: 超时降级时原文摘录的Token预算
+            chunk_timeout: 有截止时间时，收到首Token后相邻两个片段的最长间隔（秒）
+            request_timeout: 单次LLM请求的HTTP超时（秒），None表示使用客户端默认值
+            max_retries: LLM请求失败时的重试次数
         """
         self.vector_store_manager = vector_store_manager
+        self.faq_index = faq_index
+        self.llm_cache = llm_cache
+        self.model_name = model_name
+        self.temperature = 0.7  # 温度参数，控制生成的随机性
         self.llm = ChatOpenAI(
             model=model_name,
-            temperature=0.7,  # 温度参数，控制生成的随机性
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+            temperature=self.temperature,
+            # 未设置密钥时（本地Embedding后端离线启动）用占位值完成初始化，调用LLM时才会报错
+            openai_api_key=os.getenv("OPENAI_API_KEY") or "EMPTY",
+            timeout=request_timeout,
+            max_retries=max_retries
+        )
+        
+        # Token计数与预算
+        self.token_counter = TokenCounter(model_name)
+        self.max_prompt_tokens = max_prompt_tokens
+        self.session_token_budget = session_token_budget
+        self.token_prices = token_prices
+        self._usage_lock = threading.Lock()
+        self.session_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+        # 已通过预算检查、尚未生成完成的请求预留的Prompt Token（并发请求不能同时用掉同一份余额）
+        self._reserved_tokens = 0
+        
+        # 上下文压缩：句子与检索使用同一个Embedding模型打分，问题向量复用检索时的缓存
+        self.context_compressor = None
+        if compress_context_tokens:
+            self.context_compressor = ContextCompressor(
+                self.token_counter,
+                max_tokens=compress_context_tokens,
+                vector_manager=vector_store_manager
+            )
+        
+        # 延迟SLO：超时降级的原文摘录同样用抽取式压缩挑选句子；
+        # 此时已过截止时间，远程Embedding后端不再为句子发起请求，只按词面重叠挑选
+        self.deadline_seconds = deadline_seconds
+        local_backend = hasattr(vector_store_manager.embeddings, "embed_array")
+        self.excerpt_compressor = ContextCompressor(
+            self.token_counter,
+            max_tokens=excerpt_tokens,
+            vector_manager=vector_store_manager if local_backend else None
         )
+        self.slo_stats = {"deadline_requests": 0, "excerpt_fallbacks": 0, "timeouts": 0, "llm_errors": 0}
+        self.chunk_timeout = chunk_timeout
+        # 流式生成在一个常驻的事件循环中进行（首次使用时启动），超时后取消任务即关闭流
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
         
         # 定义Prompt模板
         # 这是RAG的核心：将检索到的文档作为上下文注入到Prompt中
@@ -65,11 +148,13 @@ class RAGChain:
         formatted_docs = []
         for i, doc in enumerate(docs, 1):
             source = doc.metadata.get('source', 'unknown')
+            section = doc.metadata.get('section')
             chunk_id = doc.metadata.get('chunk_id', 'unknown')
             content = doc.page_content
             
+            location = f"来源: {source}, 章节: {section}" if section else f"来源: {source}"
             formatted_docs.append(
-                f"[文档片段 {i} - 来源: {source}, ID: {chunk_id}]\n{content}\n"
+                f"[文档片段 {i} - {location}, ID: {chunk_id}]\n{content}\n"
             )
         
         return "\n".join(formatted_docs)
@@ -87,56 +172,361 @@ class RAGChain:
         """
         return self.vector_store_manager.similarity_search(query, k=k)
     
-    def generate(self, query: str, context: str) -> str:
+    def fit_context(self, query: str, docs: List[Document]) -> Tuple[List[Document], str]:
+        """
+        按Prompt Token预算裁剪上下文
+        
+        文档按相关度排序，超出预算时从最不相关的文档开始丢弃；
+        只剩一个文档仍超出预算时截断它的内容。
+        
+        Args:
+            query: 用户问题
+            docs: 检索到的文档列表
+            
+        Returns:
+            (保留的文档列表, 格式化后的上下文)
+        """
+        context = self.format_docs(docs)
+        if self.max_prompt_tokens is None:
+            return docs, context
+        
+        # 扣除系统提示词和问题本身占用的Token后，剩余的才是上下文预算
+        available = self.max_prompt_tokens - self.count_prompt_tokens(query, "")
+        kept = list(docs)
+        while kept and self.token_counter.count(self.format_docs(kept)) > available:
+            if len(kept) > 1:
+                kept.pop()
+                continue
+            
+            doc = kept[0]
+            header = self.token_counter.count(self.format_docs([Document(page_content="", metadata=doc.metadata)]))
+            kept[0] = Document(
+                page_content=self.token_counter.truncate(doc.page_content, available - header),
+                metadata=doc.metadata
+            )
+            break
+        
+        return kept, self.format_docs(kept)
+    
+    def count_prompt_tokens(self, query: str, context: str) -> int:
+        """
+        计算完整Prompt的Token数
+        
+        Args:
+            query: 用户问题
+            context: 上下文
+            
+        Returns:
+            Token数
+        """
+        messages = self.prompt_template.format_messages(context=context, question=query)
+        return self.token_counter.count_messages(messages)
+    
+    def generate(self, query: str, context: str, use_cache: bool = True) -> str:
         """
         基于上下文生成回答
         
         Args:
             query: 用户问题
             context: 检索到的文档上下文
+            use_cache: 是否使用LLM响应缓存（需要每次重新采样时关闭）
             
         Returns:
             生成的回答
         """
+        answer, _ = self._generate(query, context, use_cache)
+        return answer
+    
+    def _generate(self, query: str, context: str, use_cache: bool,
+                  first_token_timeout: Optional[float] = None) -> Tuple[Optional[str], bool]:
+        """生成回答，并返回是否命中了LLM响应缓存；设置了首Token超时且超时时回答为None"""
         # 构建完整的Prompt
         messages = self.prompt_template.format_messages(
             context=context,
             question=query
         )
         
+        # Prompt、模型和温度完全相同时直接复用缓存的回答
+        cache_key = None
+        if use_cache and self.llm_cache is not None:
+            cache_key = self.llm_cache.make_key(messages, self.model_name, self.temperature)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                return cached, True
+        
         # 调用LLM生成回答
-        response = self.llm.invoke(messages)
-        return response.content
+        if first_token_timeout is None:
+            answer = self.llm.invoke(messages).content
+        else:
+            answer = self._stream_with_deadline(messages, first_token_timeout)
+            if answer is None:
+                return None, False
+        
+        if cache_key is not None:
+            self.llm_cache.put(cache_key, answer)
+        return answer, False
     
-    def invoke(self, query: str, k: int = 3) -> dict:
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        流式生成使用的常驻事件循环
+        
+        异步HTTP客户端的连接池绑定在创建连接的事件循环上，因此所有请求共用一个循环，
+        而不是每次请求 asyncio.run 新建循环。
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+    
+    def _stream_with_deadline(self, messages: list, first_token_timeout: float) -> Optional[str]:
+        """
+        流式生成：在 first_token_timeout 秒内收到首个片段，且之后每个片段间隔不超过 chunk_timeout 秒，
+        则返回完整回答，否则取消
+        
+        取消时关闭流（连接断开，服务端停止生成），不会留下仍在等待模型服务的线程。
+        
+        Args:
+            messages: Prompt消息列表
+            first_token_timeout: 等待首个片段的秒数
+            
+        Returns:
+            完整回答；超时返回None
+        """
+        if first_token_timeout <= 0:
+            return None
+        
+        future = asyncio.run_coroutine_threadsafe(
+            self._astream_with_deadline(messages, first_token_timeout), self._event_loop()
+        )
+        return future.result()
+    
+    async def _astream_with_deadline(self, messages: list, first_token_timeout: float) -> Optional[str]:
+        """逐个等待流式片段，超时则取消等待中的读取并关闭流"""
+        stream = self.llm.astream(messages)
+        parts = []
+        timeout = first_token_timeout
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return "".join(parts)
+                except asyncio.TimeoutError:
+                    return None
+                parts.append(chunk.content)
+                timeout = self.chunk_timeout
+        finally:
+            await stream.aclose()
+    
+    def excerpt_answer(self, query: str, docs: List[Document]) -> Tuple[str, List[Document]]:
+        """
+        本地构建的降级回答：从检索到的文本块中抽取与问题最相关的句子，逐条附上引用
+        
+        Args:
+            query: 用户问题
+            docs: 检索到的文档列表
+            
+        Returns:
+            (摘录回答, 被引用的文档列表)
+        """
+        excerpts = self.excerpt_compressor.compress(query, docs)
+        cited = [(doc, short) for doc, short in zip(docs, excerpts) if short.page_content]
+        if not cited:
+            return f"{self.EXCERPT_NOTICE}\n\n暂未检索到相关规定。", []
+        
+        lines = [self.EXCERPT_NOTICE]
+        for doc, short in cited:
+            source = doc.metadata.get('source', 'unknown')
+            section = doc.metadata.get('section')
+            location = f"来源: {source}, 章节: {section}" if section else f"来源: {source}"
+            lines.append(f"\n{short.page_content}\n—— [{location}, ID: {doc.metadata.get('chunk_id', 'unknown')}]")
+        return "\n".join(lines), [doc for doc, _ in cited]
+    
+    def invoke(
+        self,
+        query: str,
+        k: int = 3,
+        use_faq: bool = True,
+        use_cache: bool = True,
+        retrieved_docs: Optional[List[Document]] = None,
+        deadline: Optional[float] = None
+    ) -> dict:
         """
         执行完整的RAG流程
         
         Args:
             query: 用户问题
             k: 检索的文档数量
+            use_faq: 是否允许直接返回FAQ答案（生成FAQ答案本身时需要关闭）
+            use_cache: 是否使用LLM响应缓存
+            retrieved_docs: 已检索好的文档（批量检索时传入），为None时在此检索
+            deadline: 本次请求的截止时间（秒），None时使用 deadline_seconds
             
         Returns:
-            包含问题、检索结果、回答的字典
+            包含问题、检索结果、回答的字典；超时降级时带有 degraded="excerpt"
         """
+        started = time.perf_counter()
+        if deadline is None:
+            deadline = self.deadline_seconds
+        
+        # 步骤0: 高频问题直接返回预生成的答案
+        if use_faq and self.faq_index is not None:
+            entry = self.faq_index.lookup(query, self.vector_store_manager)
+            if entry is not None:
+                print(f"⚡ 命中FAQ: {entry['question']} (相似度: {entry['score']:.3f})")
+                result = self.faq_index.to_result(query, entry)
+                result["usage"] = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0,
+                                   "context_tokens": 0, "trimmed_docs": 0}
+                result["session_usage"] = dict(self.session_usage)
+                return result
+        
         # 步骤1: 检索相关文档
-        print(f"🔍 正在检索相关文档...")
-        retrieved_docs = self.retrieve(query, k=k)
+        if retrieved_docs is None:
+            print(f"🔍 正在检索相关文档...")
+            retrieved_docs = self.retrieve(query, k=k)
+        
+        # 步骤2: 压缩上下文，只保留与问题相关的句子（引用的仍是原始文本块）
+        context_docs = retrieved_docs
+        if self.context_compressor is not None:
+            compressed = self.context_compressor.compress(query, retrieved_docs)
+            pairs = [(doc, short) for doc, short in zip(retrieved_docs, compressed) if short.page_content]
+            retrieved_docs = [doc for doc, _ in pairs]
+            context_docs = [short for _, short in pairs]
         
-        # 步骤2: 格式化文档为上下文
-        context = self.format_docs(retrieved_docs)
+        # 步骤3: 格式化文档为上下文（超出Prompt预算时裁剪）
+        used_docs, context = self.fit_context(query, context_docs)
+        retrieved_docs = retrieved_docs[:len(used_docs)]
         
-        # 步骤3: 生成回答
+        prompt_tokens = self.count_prompt_tokens(query, context)
+        reserved = self._reserve_tokens(prompt_tokens)
+        
+        # 步骤4: 生成回答（有截止时间时，首Token超时或模型服务出错则降级为原文摘录）
         print(f"🤖 正在生成回答...")
-        answer = self.generate(query, context)
+        try:
+            if deadline is None:
+                answer, cache_hit = self._generate(query, context, use_cache)
+            else:
+                remaining = deadline - (time.perf_counter() - started)
+                try:
+                    answer, cache_hit = self._generate(query, context, use_cache, first_token_timeout=remaining)
+                    reason = "timeout"
+                except Exception as e:
+                    print(f"⚠️ 生成失败: {e}")
+                    answer, cache_hit, reason = None, False, "llm_error"
+                
+                with self._usage_lock:
+                    self.slo_stats["deadline_requests"] += 1
+                    if answer is None:
+                        self.slo_stats["excerpt_fallbacks"] += 1
+                        self.slo_stats["timeouts" if reason == "timeout" else "llm_errors"] += 1
+                if answer is None:
+                    return self._excerpt_result(query, retrieved_docs, prompt_tokens if remaining > 0 else 0,
+                                                reason, reserved)
+            completion_tokens = self.token_counter.count(answer)
+        except BaseException:
+            self._release_tokens(reserved)
+            raise
+        
+        usage = self._record_usage(prompt_tokens, completion_tokens, cache_hit, reserved)
+        usage["context_tokens"] = self.token_counter.count(context)
+        usage["trimmed_docs"] = len(context_docs) - len(used_docs)
         
         return {
             "question": query,
             "retrieved_docs": retrieved_docs,
             "context": context,
-            "answer": answer
+            "answer": answer,
+            "cache_hit": cache_hit,
+            "usage": usage,
+            "session_usage": dict(self.session_usage)
         }
     
+    def _excerpt_result(self, query: str, retrieved_docs: List[Document], sent_prompt_tokens: int, reason: str,
+                        reserved: int = 0) -> dict:
+        """
+        超时降级：返回与 invoke 结构相同的原文摘录结果
+        
+        Args:
+            query: 用户问题
+            retrieved_docs: 检索到的文档列表
+            sent_prompt_tokens: 已发给模型服务的Prompt Token数（取消的请求同样可能计费）
+            reason: 降级原因，"timeout" 或 "llm_error"
+            reserved: 预算检查时为本次请求预留的Token数
+            
+        Returns:
+            结果字典，带有 degraded 和 fallback_reason 字段
+        """
+        print(f"⏱️ 生成未能在截止时间内完成，返回原文摘录（{reason}）")
+        answer, cited = self.excerpt_answer(query, retrieved_docs)
+        usage = self._record_usage(sent_prompt_tokens, 0, cache_hit=False, reserved=reserved)
+        usage["context_tokens"] = 0
+        usage["trimmed_docs"] = 0
+        return {
+            "question": query,
+            "retrieved_docs": cited,
+            "context": "",
+            "answer": answer,
+            "cache_hit": False,
+            "usage": usage,
+            "session_usage": dict(self.session_usage),
+            "degraded": "excerpt",
+            "fallback_reason": reason
+        }
+    
+    def _reserve_tokens(self, prompt_tokens: int) -> int:
+        """
+        检查会话预算并预留本次请求的Prompt Token
+        
+        检查和预留在同一把锁内完成，并发的 invoke（如批量问答）不会都通过检查后一起超出预算；
+        生成结束后由 _record_usage 按实际用量结算，出错时由 _release_tokens 归还。
+        
+        Args:
+            prompt_tokens: 本次请求的Prompt Token数
+            
+        Returns:
+            预留的Token数（未设置会话预算时为0）
+        """
+        if self.session_token_budget is None:
+            return 0
+        with self._usage_lock:
+            committed = self.session_usage["total_tokens"] + self._reserved_tokens
+            if committed + prompt_tokens > self.session_token_budget:
+                raise TokenBudgetExceeded(
+                    f"会话Token预算已用完（已用 {self.session_usage['total_tokens']}，"
+                    f"进行中预留 {self._reserved_tokens}，本次需要 {prompt_tokens}，预算 {self.session_token_budget}）"
+                )
+            self._reserved_tokens += prompt_tokens
+        return prompt_tokens
+    
+    def _release_tokens(self, reserved: int):
+        """归还未使用的预留Token"""
+        if reserved:
+            with self._usage_lock:
+                self._reserved_tokens -= reserved
+    
+    def _record_usage(self, prompt_tokens: int, completion_tokens: int, cache_hit: bool, reserved: int = 0) -> dict:
+        """记录一次请求的Token用量并结算预留；命中缓存的请求没有实际花费，不计入会话累计"""
+        prompt_price, completion_price = self.token_prices
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": 0.0 if cache_hit else cost
+        }
+        
+        # 批量模式下多个线程并发调用 invoke
+        with self._usage_lock:
+            self._reserved_tokens -= reserved
+            if not cache_hit:
+                self.session_usage["requests"] += 1
+                self.session_usage["prompt_tokens"] += prompt_tokens
+                self.session_usage["completion_tokens"] += completion_tokens
+                self.session_usage["total_tokens"] += prompt_tokens + completion_tokens
+                self.session_usage["cost"] += cost
+        return usage
+    
     def create_chain(self, k: int = 3):
         """
         创建LangChain风格的RAG链（使用链式调用）
@@ -0,0 +1,122 @@
+"""
+章节索引模块：实现"章节 → 文本块"两级分层检索
+
+核心知识点：
+1. 分层索引：先用章节级摘要向量粗筛章节，再只在命中章节的文本块中精排
+2. 章节摘要向量：由章节内所有文本块向量求平均并归一化得到，构建时无需额外的Embedding调用
+3. 检索开销：每次查询只需计算 章节数 + 命中章节文本块数 次相似度，而不是全部文本块
+"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+
+class SectionIndex:
+    """章节索引：保存章节摘要向量以及每个章节包含的文本块行号"""
+
+    SECTIONS_FILE = "sections.json"
+    VECTORS_FILE = "section_vectors.npy"
+
+    def __init__(self, sections: List[Dict], section_vectors: np.ndarray):
+        """
+        初始化章节索引
+
+        Args:
+            sections: 章节列表，每项包含 source、section（章节路径）和 rows（文本块在向量索引中的行号）
+            section_vectors: 章节摘要向量矩阵，形状为 (章节数, 向量维度)
+        """
+        self.sections = sections
+        self.section_vectors = section_vectors
+        # 文本块向量矩阵，由VectorStoreManager在创建或加载向量存储后挂载
+        self.chunk_vectors: Optional[np.ndarray] = None
+
+    @classmethod
+    def build(cls, documents: List[Document], vectors: np.ndarray) -> 'SectionIndex':
+        """
+        根据文本块及其向量构建章节索引
+
+        Args:
+            documents: 文本块列表（需包含 section 元数据）
+            vectors: 与文本块一一对应的向量矩阵
+
+        Returns:
+            章节索引对象
+        """
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for row, doc in enumerate(documents):
+            key = (doc.metadata.get('source', 'unknown'), doc.metadata.get('section', ''))
+            groups.setdefault(key, []).append(row)
+
+        sections = []
+        section_vectors = np.zeros((len(groups), vectors.shape[1]), dtype=np.float32)
+        for i, ((source, section), rows) in enumerate(groups.items()):
+            sections.append({"source": source, "section": section, "rows": rows})
+            centroid = vectors[rows].mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            section_vectors[i] = centroid / norm if norm > 0 else centroid
+
+        index = cls(sections, section_vectors)
+        index.chunk_vectors = vectors
+        return index
+
+    def search(self, query_vector: np.ndarray, k: int, top_sections: int) -> Tuple[List[int], List[float], int]:
+        """
+        两级检索：先选出最相关的章节，再在这些章节的文本块中计算距离
+
+        Args:
+            query_vector: 查询向量
+            k: 返回的文本块数量
+            top_sections: 第一级保留的章节数量
+
+        Returns:
+            (文本块行号列表, L2距离平方列表, 本次实际打分的文本块数量)
+        """
+        if self.chunk_vectors is None:
+            raise ValueError("章节索引未挂载文本块向量")
+
+        # 第一级：章节摘要向量与查询向量的内积（向量已归一化，等价于余弦相似度）
+        section_scores = self.section_vectors @ query_vector
+        n = min(top_sections, len(self.sections))
+        selected = np.argpartition(-section_scores, n - 1)[:n]
+
+        # 第二级：只在命中章节的文本块中计算L2距离（与FAISS默认度量保持一致）
+        rows = np.concatenate([np.asarray(self.sections[i]["rows"], dtype=np.int64) for i in selected])
+        diffs = self.chunk_vectors[rows] - query_vector
+        distances = np.einsum('ij,ij->i', diffs, diffs)
+
+        order = np.argsort(distances)[:k]
+        return rows[order].tolist(), distances[order].tolist(), len(rows)
+
+    def save(self, save_path: str):
+        """
+        将章节索引保存到向量存储目录
+
+        Args:
+            save_path: 向量存储目录
+        """
+        with open(os.path.join(save_path, self.SECTIONS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.sections, f, ensure_ascii=False)
+        np.save(os.path.join(save_path, self.VECTORS_FILE), self.section_vectors)
+
+    @classmethod
+    def load(cls, load_path: str) -> Optional['SectionIndex']:
+        """
+        从向量存储目录加载章节索引
+
+        Args:
+            load_path: 向量存储目录
+
+        Returns:
+            章节索引对象；旧版本的向量存储没有章节文件时返回None
+        """
+        sections_file = os.path.join(load_path, cls.SECTIONS_FILE)
+        vectors_file = os.path.join(load_path, cls.VECTORS_FILE)
+        if not (os.path.exists(sections_file) and os.path.exists(vectors_file)):
+            return None
+
+        with open(sections_file, 'r', encoding='utf-8') as f:
+            sections = json.load(f)
+        return cls(sections, np.load(vectors_file))
@@ -0,0 +1,301 @@
+"""
+索引快照模块：为向量存储提供版本化快照、原子发布和回滚
+
+核心知识点：
+1. 不可变快照：每次构建写入一个新的版本目录，发布后不再修改
+2. 原子发布：先写临时目录并生成校验清单，文件和目录fsync落盘后再通过 rename + 指针文件替换一次性切换版本
+3. 回滚与清理：指针可以切回任意历史版本，旧快照按保留数量清理（当前版本和上一个发布版本始终保留）
+
+目录结构：
+    vectorstore/
+    ├── CURRENT                            # 指向当前发布版本的指针文件
+    ├── PREVIOUS                           # 上一个发布版本（切换瞬间仍可能有读者在使用）
+    └── snapshots/
+        ├── v20240101-120000-000000-ab12/  # 已发布的快照（只读）
+        │   ├── manifest.json              # 文件清单与SHA256校验和
+        │   ├── index.faiss
+        │   └── index.pkl
+        └── .staging-xxxx/                 # 正在构建的临时目录
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class SnapshotStore:
+    """快照仓库：管理一个向量存储根目录下的所有版本"""
+
+    MANIFEST_FILE = "manifest.json"
+    CURRENT_FILE = "CURRENT"
+    PREVIOUS_FILE = "PREVIOUS"
+    SNAPSHOTS_DIR = "snapshots"
+    STAGING_PREFIX = ".staging-"
+    # 超过该时长仍未提交的临时目录视为崩溃遗留（避免误删正在进行的构建）
+    STALE_STAGING_SECONDS = 3600
+
+    def __init__(self, root: str):
+        """
+        初始化快照仓库
+
+        Args:
+            root: 向量存储根目录（即 Config.VECTOR_STORE_PATH）
+        """
+        self.root = root
+        self.snapshots_dir = os.path.join(root, self.SNAPSHOTS_DIR)
+
+    def begin(self) -> str:
+        """
+        创建一个临时构建目录
+
+        Returns:
+            临时目录路径，调用方把索引文件写入其中后再调用 commit
+        """
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        staging = os.path.join(self.snapshots_dir, f"{self.STAGING_PREFIX}{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        return staging
+
+    def commit(self, staging: str, metadata: Optional[Dict] = None) -> str:
+        """
+        为临时目录生成校验清单，并原子地重命名为正式版本目录
+
+        Args:
+            staging: begin 返回的临时目录
+            metadata: 写入清单的附加信息（如文档数量）
+
+        Returns:
+            新版本号
+        """
+        created_at = datetime.now()
+        version = f"v{created_at.strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:4]}"
+
+        files = {}
+        for name in sorted(os.listdir(staging)):
+            path = os.path.join(staging, name)
+            if os.path.isfile(path):
+                # 数据文件先落盘，避免崩溃后 CURRENT 指向只写了一半的快照
+                _fsync_file(path)
+                files[name] = {"sha256": _sha256(path), "size": os.path.getsize(path)}
+
+        manifest = {
+            "version": version,
+            "created_at": created_at.isoformat(),
+            "files": files,
+            "metadata": metadata or {}
+        }
+        with open(os.path.join(staging, self.MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(staging)
+
+        # 同一文件系统内的目录重命名是原子操作，再fsync父目录使重命名本身持久化
+        os.rename(staging, os.path.join(self.snapshots_dir, version))
+        _fsync_dir(self.snapshots_dir)
+        return version
+
+    def publish(self, version: str):
+        """
+        原子地将 CURRENT 指针切换到指定版本
+
+        Args:
+            version: 要发布的版本号
+        """
+        if version not in self.list_versions():
+            raise ValueError(f"快照版本不存在: {version}")
+
+        # 记录上一个发布版本：切换瞬间刚解析到旧版本的读者仍在使用它，gc 不能删除
+        previous = self.current_version()
+        if previous is not None and previous != version:
+            self._write_pointer(self.PREVIOUS_FILE, previous)
+        self._write_pointer(self.CURRENT_FILE, version)
+
+    def _write_pointer(self, name: str, version: str):
+        """先写临时文件再 os.replace，读者只会看到旧指针或新指针"""
+        pointer = os.path.join(self.root, name)
+        tmp = f"{pointer}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, pointer)
+        _fsync_dir(self.root)
+
+    def current_version(self) -> Optional[str]:
+        """
+        读取当前发布的版本号
+
+        Returns:
+            版本号；尚未发布过任何快照时返回None
+        """
+        return self._read_pointer(self.CURRENT_FILE)
+
+    def previous_version(self) -> Optional[str]:
+        """
+        读取上一个发布的版本号
+
+        Returns:
+            版本号；只发布过一次时返回None
+        """
+        return self._read_pointer(self.PREVIOUS_FILE)
+
+    def _read_pointer(self, name: str) -> Optional[str]:
+        """读取指针文件中的版本号"""
+        pointer = os.path.join(self.root, name)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+
+    def list_versions(self) -> List[str]:
+        """
+        列出所有已提交的快照版本（按时间从旧到新）
+
+        Returns:
+            版本号列表
+        """
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.snapshots_dir)
+            if not name.startswith(self.STAGING_PREFIX)
+            and os.path.isdir(os.path.join(self.snapshots_dir, name))
+        )
+
+    def resolve(self, version: str = "latest", verify: bool = True) -> str:
+        """
+        将版本号解析为快照目录
+
+        Args:
+            version: "latest" 表示当前发布版本，也可以固定为某个历史版本号
+            verify: 是否校验清单中的SHA256
+
+        Returns:
+            快照目录路径
+        """
+        if version == "latest":
+            version = self.current_version()
+            if version is None:
+                raise FileNotFoundError(f"尚未发布任何快照: {self.root}")
+
+        path = os.path.join(self.snapshots_dir, version)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"快照版本不存在: {version}")
+
+        if verify:
+            self.verify(version)
+        return path
+
+    def read_manifest(self, version: str) -> Dict:
+        """
+        读取快照的校验清单
+
+        Args:
+            version: 快照版本号
+
+        Returns:
+            清单内容（包含 files 和 metadata）
+        """
+        with open(os.path.join(self.snapshots_dir, version, self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def verify(self, version: str):
+        """
+        按清单校验快照文件是否完整
+
+        Args:
+            version: 快照版本号
+        """
+        path = os.path.join(self.snapshots_dir, version)
+        manifest = self.read_manifest(version)
+
+        for name, info in manifest["files"].items():
+            file_path = os.path.join(path, name)
+            if not os.path.exists(file_path) or _sha256(file_path) != info["sha256"]:
+                raise ValueError(f"快照 {version} 校验失败: {name}")
+
+    def rollback(self, version: Optional[str] = None) -> str:
+        """
+        回滚到指定版本，默认回滚到当前版本的上一个版本
+
+        Args:
+            version: 目标版本号
+
+        Returns:
+            回滚后的当前版本号
+        """
+        if version is None:
+            versions = self.list_versions()
+            current = self.current_version()
+            if current not in versions or versions.index(current) == 0:
+                raise ValueError("没有可以回滚的历史版本")
+            version = versions[versions.index(current) - 1]
+
+        self.verify(version)
+        self.publish(version)
+        return version
+
+    def gc(self, keep: int) -> List[str]:
+        """
+        清理旧快照：保留最新的 keep 个版本以及当前、上一个发布版本，并删除遗留的临时目录
+
+        Args:
+            keep: 保留的版本数量
+
+        Returns:
+            被删除的版本号列表
+        """
+        versions = self.list_versions()
+        retained = set(versions[-keep:]) if keep > 0 else set()
+        retained.add(self.current_version())
+        retained.add(self.previous_version())
+
+        removed = []
+        for version in versions:
+            if version not in retained:
+                shutil.rmtree(os.path.join(self.snapshots_dir, version), ignore_errors=True)
+                removed.append(version)
+
+        # 清理崩溃遗留的临时目录
+        if os.path.isdir(self.snapshots_dir):
+            now = time.time()
+            for name in os.listdir(self.snapshots_dir):
+                path = os.path.join(self.snapshots_dir, name)
+                if name.startswith(self.STAGING_PREFIX) and now - os.path.getmtime(path) > self.STALE_STAGING_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+
+        return removed
+
+
+def _fsync_file(path: str):
+    """把文件内容刷到磁盘"""
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path: str):
+    """把目录项（新建、重命名的文件）刷到磁盘；不支持目录fsync的平台（Windows）直接跳过"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _sha256(path: str) -> str:
+    """计算文件的SHA256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,8 @@
+"""测试配置：模块之间按平铺方式互相导入，把模块目录加入导入路径"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试只使用本地Embedding后端和模拟的LLM，不会发出请求；这里只是让ChatOpenAI能够完成初始化
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
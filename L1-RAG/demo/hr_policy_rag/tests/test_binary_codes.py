@@ -0,0 +1,84 @@
+"""二值编码级联检索：汉明距离与候选精排的结果应与暴力计算一致"""
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from binary_codes import BinaryCodes, hamming_distances, rerank
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    # 维度不是64的倍数，覆盖补0的最后一个字
+    return rng.standard_normal((500, 100)).astype(np.float32)
+
+
+def test_hamming_distances_match_bit_count(vectors):
+    codes = BinaryCodes.from_vectors(vectors, batch_size=128)
+    query = vectors[7] + 0.1
+
+    expected = ((vectors > 0) != (query > 0)).sum(axis=1)
+    np.testing.assert_array_equal(codes.hamming(query), expected)
+    # 分段大小不影响结果
+    np.testing.assert_array_equal(
+        hamming_distances(codes.columns, BinaryCodes.pack(query)[0], block_size=64), expected
+    )
+
+
+def test_cascade_with_all_candidates_equals_brute_force(vectors):
+    codes = BinaryCodes.from_vectors(vectors)
+    query = vectors[42] * 0.9
+
+    rows, distances = rerank(vectors, codes.candidates(query, len(vectors)), query, 10)
+
+    brute = ((vectors - query) ** 2).sum(axis=1)
+    expected = np.argsort(brute, kind="stable")[:10]
+    np.testing.assert_array_equal(rows, expected)
+    np.testing.assert_allclose(distances, brute[expected], rtol=1e-5)
+
+
+def test_candidates_contain_nearest_neighbour(vectors):
+    codes = BinaryCodes.from_vectors(vectors)
+    for row in (0, 123, 499):
+        assert row in codes.candidates(vectors[row], 20)
+
+
+def test_append_matches_from_vectors(vectors):
+    codes = BinaryCodes.from_vectors(vectors[:300])
+    codes.append(vectors[300:])
+    np.testing.assert_array_equal(codes.columns, BinaryCodes.from_vectors(vectors).columns)
+
+
+def test_vector_store_cascade_matches_flat_search():
+    from vector_store import VectorStoreManager
+
+    texts = [f"第{i}条：员工每年享有{i % 7 + 5}天带薪年假，需提前{i % 3 + 1}周申请" for i in range(60)]
+    docs = [Document(page_content=text, metadata={"chunk_id": i}) for i, text in enumerate(texts)]
+
+    flat = VectorStoreManager(embedding_model="local-hash")
+    flat.create_vector_store(docs)
+    # 候选数不小于文本块数时，级联检索等价于精确检索
+    cascade = VectorStoreManager(embeddings=flat.embeddings, cascade=True, cascade_candidates=len(docs))
+    cascade.vector_store = flat.vector_store
+
+    for query in ("年假需要提前几周申请？", "第12条规定"):
+        expected = [doc.page_content for doc, _ in flat.vector_store.similarity_search_with_score(query, k=5)]
+        found = [doc.page_content for doc, _ in cascade.similarity_search_with_score(query, k=5)]
+        assert found == expected
+
+
+def test_incremental_add_appends_codes():
+    from vector_store import VectorStoreManager
+
+    docs = [Document(page_content=f"第{i}条：病假需提供{i % 4 + 1}天内的医院证明", metadata={"chunk_id": i})
+            for i in range(40)]
+    manager = VectorStoreManager(embedding_model="local-hash", cascade=True)
+    manager.create_vector_store(docs[:30])
+    codes = manager._ensure_binary_codes()
+
+    new_docs = docs[30:]
+    manager.add_embeddings(new_docs, manager.embeddings.embed_documents([doc.page_content for doc in new_docs]))
+
+    # 追加到同一个编码对象上，结果与从全部浮点向量重新生成一致
+    assert manager._ensure_binary_codes() is codes
+    np.testing.assert_array_equal(codes.columns, BinaryCodes.from_vectors(manager._flat_vectors()).columns)
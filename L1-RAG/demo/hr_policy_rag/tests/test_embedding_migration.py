@@ -0,0 +1,112 @@
+"""Embedding模型在线迁移：双读按行号划分新旧索引并按覆盖比例融合，完成后的快照重启可加载"""
+import pytest
+from langchain.schema import Document
+
+from embedding_backends import HashingEmbeddings
+from embedding_migration import EmbeddingMigration, migrate_knowledge_base
+from vector_store import VectorStoreManager
+
+QUERY = "年假需要提前几周申请？"
+
+
+@pytest.fixture
+def docs():
+    return [
+        Document(page_content=f"第{i}条：员工每年享有{i % 7 + 5}天带薪年假，需提前{i % 3 + 1}周申请",
+                 metadata={"chunk_id": i})
+        for i in range(30)
+    ]
+
+
+@pytest.fixture
+def source(docs):
+    # 旧模型：与新模型参数不同的本地后端，两者的向量不在同一个空间
+    manager = VectorStoreManager(embeddings=HashingEmbeddings(seed=1))
+    manager.create_vector_store(docs)
+    return manager
+
+
+def migrate_rows(migration: EmbeddingMigration, docs, count: int):
+    """不启动后台线程，直接把前 count 个文本块写入新索引"""
+    batch = docs[:count]
+    migration.target.add_embeddings(batch, migration.target.embeddings.embed_documents(
+        [doc.page_content for doc in batch]))
+
+
+def chunk_ids(results):
+    return [doc.metadata["chunk_id"] for doc, _ in results]
+
+
+def test_progress_before_start(source):
+    migration = EmbeddingMigration(source, VectorStoreManager(embedding_model="local-hash"))
+    progress = migration.progress()
+    assert progress["embedded"] == 0
+    assert progress["chunks_per_second"] == 0.0
+
+
+def test_dual_read_before_and_after_migration(source, docs):
+    migration = EmbeddingMigration(source, VectorStoreManager(embedding_model="local-hash"))
+    assert chunk_ids(migration.similarity_search_with_score(QUERY, k=5)) == \
+        chunk_ids(source.vector_store.similarity_search_with_score(QUERY, k=5))
+
+    migrate_rows(migration, docs, len(docs))
+    assert chunk_ids(migration.similarity_search_with_score(QUERY, k=5)) == \
+        chunk_ids(migration.target.vector_store.similarity_search_with_score(QUERY, k=5))
+
+
+def test_dual_read_splits_rows_and_weights_by_coverage(source, docs):
+    migration = EmbeddingMigration(source, VectorStoreManager(embedding_model="local-hash"))
+    migrate_rows(migration, docs, 15)
+
+    new_best = chunk_ids(EmbeddingMigration._search_rows(
+        migration.target, migration.target.embed_query(QUERY), 3, 0, 15))
+    old_best = chunk_ids(EmbeddingMigration._search_rows(
+        source, source.embed_query(QUERY), 3, 15, len(docs)))
+    assert all(row < 15 for row in new_best) and all(row >= 15 for row in old_best)
+
+    # 两个索引各覆盖一半文本块，权重相同，按名次交替
+    results = chunk_ids(migration.similarity_search_with_score(QUERY, k=6))
+    assert results == [new_best[0], old_best[0], new_best[1], old_best[1], new_best[2], old_best[2]]
+
+    # 新索引覆盖更多文本块后，其前几名整体排在旧索引之前
+    migrate_rows(migration, docs[15:], 5)
+    new_best = chunk_ids(EmbeddingMigration._search_rows(
+        migration.target, migration.target.embed_query(QUERY), 4, 0, 20))
+    assert chunk_ids(migration.similarity_search_with_score(QUERY, k=4)) == new_best
+
+
+def test_promoted_snapshot_loads_with_recorded_model(source, tmp_path):
+    store_path = str(tmp_path / "vectorstore")
+    promoted = []
+    migration = migrate_knowledge_base(
+        source, VectorStoreManager(embedding_model="local-hash"), store_path,
+        batch_size=8, on_promoted=promoted.append
+    )
+    migration.wait(timeout=30)
+    assert migration.state == "done"
+    assert promoted and promoted[0].vector_store.index.ntotal == source.vector_store.index.ntotal
+    assert source.migration is None
+
+    # 重启时的配置仍是旧模型名称：默认拒绝加载
+    with pytest.raises(ValueError):
+        VectorStoreManager(embedding_model="text-embedding-3-small").load_vector_store(store_path)
+
+    # 显式开启后按快照中记录的模型加载
+    restarted = VectorStoreManager(embedding_model="text-embedding-3-small", follow_snapshot_model=True)
+    restarted.load_vector_store(store_path)
+    assert restarted.embedding_model == "local-hash"
+    assert chunk_ids(restarted.similarity_search_with_score(QUERY, k=3)) == \
+        chunk_ids(promoted[0].similarity_search_with_score(QUERY, k=3))
+
+
+def test_mismatched_snapshot_is_rejected(source, tmp_path):
+    store_path = str(tmp_path / "vectorstore")
+    built = VectorStoreManager(embedding_model="local-hash")
+    built.create_vector_store(list(source.iter_documents()))
+    built.save_vector_store(store_path)
+
+    # 快照记录了 local-hash，当前配置是其他模型：不能悄悄换成快照的模型
+    other = VectorStoreManager(embedding_model="text-embedding-3-small")
+    with pytest.raises(ValueError):
+        other.load_vector_store(store_path)
+    assert other.embedding_model == "text-embedding-3-small"
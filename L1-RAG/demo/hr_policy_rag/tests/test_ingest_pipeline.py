@@ -0,0 +1,42 @@
+"""流式入库：并发向量化的完成顺序不固定，写入索引的行号仍应与源文档顺序一致"""
+import random
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from document_loader import DocumentLoader
+from embedding_backends import create_embeddings
+from ingest_pipeline import IngestionPipeline
+from vector_store import VectorStoreManager
+
+
+class JitteredEmbeddings(Embeddings):
+    """每批随机延迟，让多个向量化线程乱序完成"""
+
+    def __init__(self):
+        self.inner = create_embeddings("local-hash")
+
+    def embed_documents(self, texts):
+        time.sleep(random.uniform(0, 0.02))
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+
+def test_rows_follow_source_order(tmp_path):
+    file_paths = []
+    for i in range(3):
+        path = tmp_path / f"policy_{i}.txt"
+        path.write_text("\n\n".join(f"文件{i}第{j}条：员工每年享有{j % 7 + 5}天带薪年假。" * 3 for j in range(20)),
+                        encoding="utf-8")
+        file_paths.append(str(path))
+
+    loader = DocumentLoader(chunk_size=100, chunk_overlap=10)
+    expected = [chunk.page_content for path in file_paths for chunk in loader.load_and_split(path)]
+
+    pipeline = IngestionPipeline(VectorStoreManager(embeddings=JitteredEmbeddings()), chunk_size=100,
+                                 chunk_overlap=10, load_workers=2, embed_workers=4, batch_size=2)
+    manager = pipeline.run(file_paths)
+
+    assert [doc.page_content for doc in manager.iter_documents()] == expected
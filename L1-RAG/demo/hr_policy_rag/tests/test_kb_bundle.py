@@ -0,0 +1,66 @@
+"""知识库单文件包：写入后再打开，文本块、元数据和检索结果应与原知识库一致"""
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from kb_bundle import KnowledgeBundle, write_bundle
+from vector_store import VectorStoreManager
+
+
+@pytest.fixture
+def manager():
+    docs = [
+        Document(
+            page_content=f"第{i}条：员工每年享有{i % 7 + 5}天带薪年假",
+            metadata={"source": f"policy_{i % 3}.md", "chunk_id": i, "section": f"第{i % 4}章",
+                      # 非整数、非字符串的元数据走 extras
+                      **({"tags": ["年假", "审批"]} if i % 5 == 0 else {})}
+        )
+        for i in range(40)
+    ]
+    manager = VectorStoreManager(embedding_model="local-hash", hierarchical=True)
+    manager.create_vector_store(docs)
+    return manager
+
+
+def test_bundle_round_trip(manager, tmp_path):
+    path = str(tmp_path / "kb.bundle")
+    metadata = write_bundle(manager, path, chunk_size=500, chunk_overlap=75)
+    assert metadata["num_documents"] == 40
+
+    opened = VectorStoreManager(embedding_model="local-hash", hierarchical=True)
+    opened.open_bundle(path)
+
+    original = list(manager.iter_documents())
+    restored = list(opened.iter_documents())
+    assert [doc.page_content for doc in restored] == [doc.page_content for doc in original]
+    assert [doc.metadata for doc in restored] == [doc.metadata for doc in original]
+
+    np.testing.assert_array_equal(opened.vector_store.index.vectors, manager._flat_vectors())
+    np.testing.assert_array_equal(opened.binary_codes.columns, manager._ensure_binary_codes().columns)
+
+    query = "年假有几天？"
+    expected = [doc.page_content for doc, _ in manager.vector_store.similarity_search_with_score(query, k=5)]
+    found = [doc.page_content for doc, _ in opened.vector_store.similarity_search_with_score(query, k=5)]
+    assert found == expected
+
+
+def test_bundle_verify_detects_corruption(manager, tmp_path):
+    path = str(tmp_path / "kb.bundle")
+    write_bundle(manager, path)
+    assert KnowledgeBundle(path).verify() == []
+
+    offset = KnowledgeBundle(path).sections["vectors"]["offset"]
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    assert KnowledgeBundle(path).verify() == ["vectors"]
+
+
+def test_bundle_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_bundle"
+    path.write_bytes(b"\0" * 8192)
+    with pytest.raises(ValueError):
+        KnowledgeBundle(str(path))
@@ -0,0 +1,129 @@
+"""RAGChain：流式生成在首Token超时、片段间隔超时时取消并关闭流；并发请求不会超出会话Token预算"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.schema import Document
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from rag_chain import RAGChain
+from token_counter import TokenBudgetExceeded
+from vector_store import VectorStoreManager
+
+
+class FakeStreamingLLM:
+    """按设定的首Token延迟和片段间隔流式返回，记录流是否被关闭"""
+
+    def __init__(self, first_delay: float = 0.0, gap: float = 0.0, parts=("年假", "为", "5天"), error=None):
+        self.first_delay = first_delay
+        self.gap = gap
+        self.parts = parts
+        self.error = error
+        self.closed = False
+
+    async def astream(self, messages):
+        try:
+            await asyncio.sleep(self.first_delay)
+            if self.error is not None:
+                raise self.error
+            for i, part in enumerate(self.parts):
+                if i:
+                    await asyncio.sleep(self.gap)
+                yield AIMessageChunk(content=part)
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def rag():
+    manager = VectorStoreManager(embedding_model="local-hash")
+    manager.create_vector_store([
+        Document(page_content="员工工作满1年后每年享有5天带薪年假。", metadata={"source": "hr.md", "chunk_id": 0}),
+        Document(page_content="病假需提供医院证明。", metadata={"source": "hr.md", "chunk_id": 1}),
+    ])
+    return RAGChain(manager, chunk_timeout=0.2)
+
+
+def test_stream_returns_full_answer(rag):
+    rag.llm = FakeStreamingLLM(first_delay=0.05, gap=0.05)
+    assert rag._stream_with_deadline([], first_token_timeout=1.0) == "年假为5天"
+    assert rag.llm.closed
+
+
+def test_first_token_timeout_cancels_stream(rag):
+    rag.llm = FakeStreamingLLM(first_delay=5.0)
+    started = time.perf_counter()
+    assert rag._stream_with_deadline([], first_token_timeout=0.1) is None
+    assert time.perf_counter() - started < 1.0
+    assert rag.llm.closed
+
+
+def test_chunk_gap_timeout_cancels_stream(rag):
+    rag.llm = FakeStreamingLLM(gap=5.0)
+    started = time.perf_counter()
+    assert rag._stream_with_deadline([], first_token_timeout=1.0) is None
+    assert time.perf_counter() - started < 1.0
+    assert rag.llm.closed
+
+
+def test_stream_error_propagates(rag):
+    rag.llm = FakeStreamingLLM(error=RuntimeError("服务不可用"))
+    with pytest.raises(RuntimeError):
+        rag._stream_with_deadline([], first_token_timeout=1.0)
+
+
+def test_expired_deadline_skips_llm(rag):
+    rag.llm = FakeStreamingLLM()
+    assert rag._stream_with_deadline([], first_token_timeout=0) is None
+    assert not rag.llm.closed
+
+
+def test_invoke_falls_back_to_excerpt_on_timeout(rag):
+    rag.llm = FakeStreamingLLM(first_delay=5.0)
+    result = rag.invoke("年假有几天？", k=2, use_faq=False, use_cache=False, deadline=0.3)
+    assert result["degraded"] == "excerpt"
+    assert result["answer"].startswith(RAGChain.EXCERPT_NOTICE)
+    assert rag.slo_stats["timeouts"] == 1
+
+    rag.llm = FakeStreamingLLM()
+    result = rag.invoke("年假有几天？", k=2, use_faq=False, use_cache=False, deadline=2.0)
+    assert result["answer"] == "年假为5天"
+    assert "degraded" not in result
+
+
+class SlowLLM:
+    """同时挂起所有调用，直到全部请求都通过了预算检查"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, messages):
+        self.release.wait(timeout=1.0)
+        return AIMessage(content="年假为5天")
+
+
+def test_concurrent_invokes_respect_session_budget(rag):
+    query = "年假有几天？"
+    _, context = rag.fit_context(query, rag.retrieve(query, k=2))
+    prompt_tokens = rag.count_prompt_tokens(query, context)
+    rag.session_token_budget = prompt_tokens * 2 + 10
+    rag.llm = SlowLLM()
+
+    def ask():
+        try:
+            return rag.invoke(query, k=2, use_faq=False, use_cache=False)
+        except TokenBudgetExceeded:
+            return None
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(ask) for _ in range(4)]
+        time.sleep(0.3)
+        rag.llm.release.set()
+        results = [future.result() for future in futures]
+
+    # 预留额度只够两个请求，其余请求在生成前被拒绝，结算后预留归零
+    assert sum(result is not None for result in results) == 2
+    assert rag._reserved_tokens == 0
+    assert rag.session_usage["prompt_tokens"] == prompt_tokens * 2
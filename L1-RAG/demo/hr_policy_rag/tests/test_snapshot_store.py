@@ -0,0 +1,46 @@
+"""索引快照：发布切换指针，清理时保留当前版本和上一个发布版本"""
+import pytest
+
+from snapshot_store import SnapshotStore
+
+
+def _commit(store: SnapshotStore, content: str) -> str:
+    staging = store.begin()
+    with open(f"{staging}/index.faiss", "w", encoding="utf-8") as f:
+        f.write(content)
+    return store.commit(staging)
+
+
+def test_publish_records_previous_version(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = _commit(store, "v1")
+    store.publish(first)
+    assert store.previous_version() is None
+
+    second = _commit(store, "v2")
+    store.publish(second)
+    assert store.current_version() == second
+    assert store.previous_version() == first
+
+
+def test_gc_keeps_current_and_previous(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    versions = [_commit(store, f"v{i}") for i in range(4)]
+    store.publish(versions[0])
+    store.publish(versions[1])
+
+    # 已提交但未发布的新版本不会挤掉正在被读者使用的旧版本
+    removed = store.gc(keep=1)
+    assert set(store.list_versions()) == {versions[0], versions[1], versions[3]}
+    assert removed == [versions[2]]
+
+
+def test_verify_detects_modified_file(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    version = _commit(store, "v1")
+    store.publish(version)
+    path = store.resolve()
+    with open(f"{path}/index.faiss", "w", encoding="utf-8") as f:
+        f.write("corrupted")
+    with pytest.raises(ValueError):
+        store.resolve()
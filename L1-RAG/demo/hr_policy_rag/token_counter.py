@@ -0,0 +1,117 @@
+"""
+Token计数模块：在本地估算Prompt和回答的Token数量与费用
+
+核心知识点：
+1. Token计数：优先使用tiktoken按模型的BPE编码精确计数；未安装或无法加载编码表时，
+   按"中日韩字符约1个Token、其他字符约4个字符1个Token"估算
+2. 消息开销：Chat接口每条消息有固定的格式开销（约4个Token），回复前还有约3个Token的引导
+3. 预算控制：单次请求的Prompt超出预算时裁剪上下文，会话累计超出预算时拒绝继续调用
+"""
+import re
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖
+    tiktoken = None
+
+
+# 中日韩统一表意文字及全角标点
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """会话累计Token超出预算"""
+
+
+class TokenCounter:
+    """Token计数器"""
+
+    # 每条消息的格式开销、回复引导开销（参考OpenAI官方的计数方法）
+    TOKENS_PER_MESSAGE = 4
+    TOKENS_PER_REPLY = 3
+
+    def __init__(self, model_name: str = "gpt-3.5-turbo"):
+        """
+        初始化Token计数器
+
+        Args:
+            model_name: 模型名称，用于选择对应的BPE编码
+        """
+        self.model_name = model_name
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = self._load_encoding(model_name)
+            except Exception:
+                # 离线环境无法下载编码表时退回估算
+                self.encoding = None
+
+    @staticmethod
+    def _load_encoding(model_name: str):
+        """加载模型对应的BPE编码，未知模型使用cl100k_base（加载失败时由调用方退回估算）"""
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        """
+        计算文本的Token数
+
+        Args:
+            text: 文本
+
+        Returns:
+            Token数
+        """
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count_messages(self, messages: List[BaseMessage]) -> int:
+        """
+        计算Chat消息列表的Prompt Token数
+
+        Args:
+            messages: 消息列表
+
+        Returns:
+            Token数
+        """
+        return sum(self.TOKENS_PER_MESSAGE + self.count(message.content) for message in messages) \
+            + self.TOKENS_PER_REPLY
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        把文本截断到不超过 max_tokens 个Token
+
+        Args:
+            text: 文本
+            max_tokens: 最大Token数
+
+        Returns:
+            截断后的文本
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens])
+
+        # 估算模式下按字符二分查找
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
@@ -5,32 +5,176 @@
 1. Embedding向量化：将文本转换为高维向量（语义的数学表达）
 2. 向量数据库：高效存储和检索向量数据
 3. 相似度计算：余弦相似度、欧氏距离等
+4. 分层检索：先按章节摘要向量选章节，再在章节内检索文本块
+5. 索引快照：版本化保存、原子发布和回滚
+6. 文本压缩：文本块内容以字典压缩形式存储，检索时只解压命中的文本块
+7. 后端一致性：索引记录构建它的Embedding后端，加载时与当前后端不一致则拒绝
+8. 列式文本块表：保存时把文本块转换为连续数组存储，加载后只为检索命中的文本块构建Document
+9. 向量降维：按前缀截断或PCA投影存储低维向量，查询向量做同样的变换
+10. 级联检索：先用符号位二值编码的汉明距离选出候选，再用浮点向量精排
+11. 单文件知识库包：向量、文本块和元数据打包为一个可内存映射的文件，只读打开耗时与规模无关
+12. 在线迁移：切换Embedding模型期间，检索由迁移任务在新旧两个索引上完成
 """
 import os
-from typing import List, Optional
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+import numpy as np
 from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_community.vectorstores.base import VectorStore
+from section_index import SectionIndex
+from snapshot_store import SnapshotStore
+from chunk_table import ChunkTable, RowIds
+from embedding_backends import create_embeddings, embedding_backend_id
+from dim_reduction import DimensionReducer
+from binary_codes import BinaryCodes, rerank
+from kb_bundle import KnowledgeBundle, MappedFlatIndex, write_bundle
 
 
 class VectorStoreManager:
     """向量存储管理器：负责文档向量化和向量数据库管理"""
     
-    def __init__(self, embedding_model: str = "text-embedding-3-small"):
+    # 流式入库时拟合PCA所需的最少向量数
+    PCA_FIT_SAMPLES = 4096
+    
+    def __init__(
+        self,
+        embedding_model: str = "text-embedding-3-small",
+        hierarchical: bool = False,
+        top_sections: int = 3,
+        compress_chunks: bool = False,
+        reduce_dim: Optional[int] = None,
+        reduction: str = "truncate",
+        embeddings: Optional[Embeddings] = None,
+        cascade: bool = False,
+        cascade_candidates: int = 400,
+        follow_snapshot_model: bool = False
+    ):
         """
         初始化向量存储管理器
         
         Args:
-            embedding_model: Embedding模型名称
+            embedding_model: Embedding模型名称（"local-hash" 表示本地CPU后端）
+            hierarchical: 是否启用"章节 → 文本块"两级检索
+            top_sections: 两级检索时第一级保留的章节数量
+            compress_chunks: 保存时是否将文本块内容压缩存储
+            reduce_dim: 降维后的向量维度，None表示保存全维向量
+            reduction: 降维方法，"truncate"（前缀截断）或 "pca"（在语料上拟合PCA）
+            embeddings: 已创建的Embedding模型（多个管理器共用同一实例时传入，优先于 embedding_model）
+            cascade: 是否使用"二值编码汉明距离选候选 → 浮点向量精排"的级联检索（优先于分层检索）
+            cascade_candidates: 级联检索第一级保留的候选数量
+            follow_snapshot_model: 快照由其他Embedding模型构建时，是否改用快照记录的模型加载（默认拒绝加载）
         """
-        # 初始化OpenAI Embedding模型
-        # 这个模型会将文本转换为1536维的向量
-        self.embeddings = OpenAIEmbeddings(
-            model=embedding_model,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # 初始化Embedding模型
+        # OpenAI模型会将文本转换为1536维的向量；"local-hash" 使用本地CPU后端
+        self.embeddings = embeddings or create_embeddings(embedding_model)
+        # 模型名称随快照保存，加载时据此重建Embedding后端（外部传入的实例无法从名称重建，记为None）
+        self.embedding_model = embedding_model if embeddings is None else None
+        self.follow_snapshot_model = follow_snapshot_model
         self.vector_store: Optional[VectorStore] = None
+        
+        # 分层检索配置
+        self.hierarchical = hierarchical
+        self.top_sections = top_sections
+        self.section_index: Optional[SectionIndex] = None
+        # 最近一次检索实际打分的文本块数量（用于观察分层检索的效果）
+        self.last_scored_chunks = 0
+        
+        self.compress_chunks = compress_chunks
+        
+        # 向量降维：PCA需要先积累足够的语料向量完成拟合，之前到达的批次暂存在 _unfitted 中
+        self.reducer = DimensionReducer(reduction, reduce_dim) if reduce_dim else None
+        self._unfitted: List[tuple] = []
+        
+        # 级联检索：二值编码与索引行一一对应，行数不一致时（新增了文本块）重新生成
+        self.cascade = cascade
+        self.cascade_candidates = cascade_candidates
+        self.binary_codes: Optional[BinaryCodes] = None
+        self._codes_lock = threading.Lock()
+        
+        # 当前加载或保存的快照版本（旧版本目录结构为None）
+        self.index_version: Optional[str] = None
+        # 进行中的Embedding模型迁移（见 embedding_migration.py），迁移期间检索走新旧双索引
+        self.migration = None
+        
+        # 最近查询的向量缓存：FAQ匹配、检索等环节对同一问题只调用一次Embedding
+        self._query_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = 128
+        self._query_lock = threading.Lock()
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        将查询文本转换为向量（带LRU缓存）
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            查询向量
+        """
+        with self._query_lock:
+            vector = self._query_vectors.get(query)
+            if vector is not None:
+                self._query_vectors.move_to_end(query)
+                return vector
+        
+        vector = self._reduce(np.asarray([self.embeddings.embed_query(query)], dtype=np.float32))[0]
+        self._remember_query(query, vector)
+        return vector
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        批量将查询文本转换为向量：未缓存的查询合并为一次Embedding调用
+        
+        Args:
+            queries: 查询文本列表
+            
+        Returns:
+            形状为 (len(queries), 维度) 的查询向量矩阵
+        """
+        vectors = {}
+        with self._query_lock:
+            for query in queries:
+                if query in self._query_vectors:
+                    vectors[query] = self._query_vectors[query]
+        
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        if missing:
+            embedded = self._reduce(np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32))
+            for query, vector in zip(missing, embedded):
+                vectors[query] = vector
+                self._remember_query(query, vector)
+        
+        return np.vstack([vectors[query] for query in queries])
+    
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        将任意文本（如上下文压缩时的候选句子）转换为与查询向量同一空间的向量，不写入查询缓存
+        
+        Args:
+            texts: 文本列表（非空）
+            
+        Returns:
+            形状为 (len(texts), 维度) 的向量矩阵
+        """
+        return self._reduce(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+    
+    def _reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """对向量做与索引一致的降维（未启用降维时原样返回）"""
+        if self.reducer is None:
+            return vectors
+        return self.reducer.transform(vectors)
+    
+    def _remember_query(self, query: str, vector: np.ndarray):
+        """写入查询向量缓存，超出容量时淘汰最久未使用的条目"""
+        with self._query_lock:
+            self._query_vectors[query] = vector
+            self._query_vectors.move_to_end(query)
+            if len(self._query_vectors) > self._query_cache_size:
+                self._query_vectors.popitem(last=False)
     
     def create_vector_store(self, documents: List[Document]) -> VectorStore:
         """
@@ -44,40 +188,237 @@ class VectorStoreManager:
         """
         print("🔄 开始向量化文档...")
         
-        # 使用FAISS创建向量存储
-        # FAISS会自动调用embedding模型将文档转换为向量
-        # 并建立索引以便快速检索
-        self.vector_store = FAISS.from_documents(
-            documents=documents,
-            embedding=self.embeddings
+        # 先调用embedding模型将文档转换为向量
+        # 同一份向量既用于FAISS索引，也用于计算章节摘要向量
+        texts = [doc.page_content for doc in documents]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        
+        # 降维（PCA在全部语料向量上拟合）
+        if self.reducer is not None:
+            vectors = self.reducer.fit(vectors).transform(vectors)
+        
+        # 使用FAISS创建向量存储并建立索引以便快速检索
+        self.vector_store = FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, vectors.tolist())),
+            embedding=self.embeddings,
+            metadatas=[doc.metadata for doc in documents]
         )
         
+        # 构建章节索引（章节摘要向量 = 章节内文本块向量的归一化均值）
+        self.section_index = SectionIndex.build(documents, vectors)
+        
         print(f"✅ 成功创建向量存储，包含 {len(documents)} 个文档块")
         return self.vector_store
     
-    def save_vector_store(self, save_path: str):
+    def add_embeddings(self, documents: List[Document], vectors: List[List[float]]):
+        """
+        增量写入已经向量化的文档（流式入库时由单个写入线程调用）
+        
+        Args:
+            documents: 文档列表
+            vectors: 与文档一一对应的向量（全维，降维在此完成）
+        """
+        if self.reducer is not None:
+            if not self.reducer.fitted:
+                # PCA需要足够多的样本才能拟合，先暂存
+                self._unfitted.append((documents, vectors))
+                if sum(len(batch) for batch, _ in self._unfitted) >= self.PCA_FIT_SAMPLES:
+                    self.flush()
+                return
+            vectors = self.reducer.transform(np.asarray(vectors, dtype=np.float32)).tolist()
+        
+        text_embeddings = list(zip([doc.page_content for doc in documents], vectors))
+        metadatas = [doc.metadata for doc in documents]
+        
+        if self.vector_store is not None:
+            self._ensure_writable()
+        
+        if self.vector_store is None:
+            self.vector_store = FAISS.from_embeddings(
+                text_embeddings=text_embeddings,
+                embedding=self.embeddings,
+                metadatas=metadatas
+            )
+        else:
+            with self._codes_lock:
+                before = self.vector_store.index.ntotal
+                self.vector_store.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas)
+                # 已有的二值编码与索引行数一致时只追加新行的编码，不必全部重新生成
+                if self.binary_codes is not None and len(self.binary_codes) == before and self._has_flat_vectors():
+                    self.binary_codes.append(np.asarray(vectors, dtype=np.float32))
+    
+    def _ensure_writable(self):
+        """
+        保存或加载后的文本块表是只读的，继续写入前转换回可写的InMemoryDocstore
+        
+        转换会为每个文本块物化一个Document对象（与保存前的内存占用相同），下次保存时再转换为文本块表
+        """
+        if isinstance(self.vector_store.index, MappedFlatIndex):
+            raise ValueError("知识库包中的索引是只读的内存映射，不能追加文本块，请加载快照或重新构建知识库")
+        
+        docstore = self.vector_store.docstore
+        if isinstance(docstore, ChunkTable):
+            mapping = self.vector_store.index_to_docstore_id
+            ids = [str(mapping[i]) for i in range(self.vector_store.index.ntotal)]
+            self.vector_store.docstore = InMemoryDocstore(
+                {doc_id: docstore.search(mapping[i]) for i, doc_id in enumerate(ids)}
+            )
+            self.vector_store.index_to_docstore_id = dict(enumerate(ids))
+    
+    def flush(self):
+        """用暂存的批次拟合PCA并写入索引（流式入库结束时调用）"""
+        if not self._unfitted:
+            return
+        
+        pending, self._unfitted = self._unfitted, []
+        self.reducer.fit(np.vstack([np.asarray(vectors, dtype=np.float32) for _, vectors in pending]))
+        for documents, vectors in pending:
+            self.add_embeddings(documents, vectors)
+    
+    def iter_documents(self) -> Iterator[Document]:
+        """按索引行号顺序遍历向量存储中的全部文本块"""
+        if self.vector_store is None:
+            raise ValueError("向量存储未初始化，请先创建或加载向量存储")
+        
+        for i in range(self.vector_store.index.ntotal):
+            yield self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[i])
+    
+    def build_section_index(self):
+        """根据向量存储中的全部文本块（重新）构建章节索引"""
+        documents = list(self.iter_documents())
+        index = self.vector_store.index
+        self.section_index = SectionIndex.build(documents, index.reconstruct_n(0, index.ntotal))
+    
+    def save_vector_store(self, save_path: str, retain: Optional[int] = None) -> str:
         """
         保存向量存储到磁盘
         
+        每次保存都会写入一个新的版本化快照，校验清单生成后再原子地发布，
+        读者不会看到写了一半的索引，旧版本也可以随时回滚。
+        
+        Args:
+            save_path: 保存路径（快照仓库根目录）
+            retain: 保留的历史快照数量，None表示不清理
+            
+        Returns:
+            新发布的快照版本号
+        """
+        if self.vector_store is None:
+            raise ValueError("向量存储未初始化，请先创建向量存储")
+        
+        snapshots = SnapshotStore(save_path)
+        
+        self._ensure_chunk_table()
+        
+        # 先写入临时目录
+        staging = snapshots.begin()
+        self.vector_store.save_local(staging)
+        self.vector_store.docstore.chunk_store.save(staging)
+        if self.section_index is not None:
+            self.section_index.save(staging)
+        if self.reducer is not None:
+            self.reducer.save(staging)
+        if self.cascade or self.binary_codes is not None:
+            if self._has_flat_vectors():
+                self._ensure_binary_codes().save(staging)
+            else:
+                print(f"⚠️ {type(self.vector_store.index).__name__} 索引不保存浮点向量，跳过二值编码（级联检索退回索引自身的检索）")
+        
+        # 生成校验清单并原子发布
+        version = snapshots.commit(staging, metadata={
+            "num_documents": self.vector_store.index.ntotal,
+            "embedding_backend": embedding_backend_id(self.embeddings),
+            "embedding_model": self.embedding_model,
+            "dimension": self.vector_store.index.d,
+            "reduction": self.reducer.description if self.reducer is not None else None
+        })
+        snapshots.publish(version)
+        self.index_version = version
+        print(f"✅ 向量存储已保存到: {save_path} (版本: {version})")
+        
+        if retain is not None:
+            removed = snapshots.gc(keep=retain)
+            if removed:
+                print(f"🧹 已清理 {len(removed)} 个旧快照")
+        
+        return version
+    
+    def _ensure_chunk_table(self) -> ChunkTable:
+        """
+        转换为列式文本块表：pickle中只保留列式元数据，文本单独写入数据文件（按配置压缩）
+        
+        Returns:
+            当前向量存储的文本块表
+        """
+        if not isinstance(self.vector_store.docstore, ChunkTable):
+            ntotal = self.vector_store.index.ntotal
+            self.vector_store.docstore = ChunkTable.from_docstore(
+                self.vector_store.docstore,
+                [self.vector_store.index_to_docstore_id[i] for i in range(ntotal)],
+                codec=None if self.compress_chunks else "none"
+            )
+            self.vector_store.index_to_docstore_id = RowIds(ntotal)
+        return self.vector_store.docstore
+    
+    def save_bundle(self, path: str, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> dict:
+        """
+        把当前知识库导出为单文件包（用于向多个服务节点分发）
+        
         Args:
-            save_path: 保存路径
+            path: 包文件路径
+            chunk_size: 构建时的文本块大小（记录在包中）
+            chunk_overlap: 构建时的文本块重叠大小（记录在包中）
+            
+        Returns:
+            包级元数据
         """
         if self.vector_store is None:
             raise ValueError("向量存储未初始化，请先创建向量存储")
         
-        # 确保目录存在
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        metadata = write_bundle(self, path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        print(f"✅ 知识库包已保存到: {path}")
+        return metadata
+    
+    def open_bundle(self, path: str) -> VectorStore:
+        """
+        只读打开单文件知识库包
+        
+        向量、二值编码、文本块和元数据列都直接映射自包文件，打开时只解析头信息和元数据词表，
+        耗时不随文本块数量增长；包中不含pickle，打开不受信任来源的包也不会执行代码。
+        
+        Args:
+            path: 包文件路径
+            
+        Returns:
+            向量存储对象
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"知识库包不存在: {path}")
         
-        # 保存向量存储
-        self.vector_store.save_local(save_path)
-        print(f"✅ 向量存储已保存到: {save_path}")
+        bundle = KnowledgeBundle(path)
+        self._check_embedding_backend(bundle.metadata)
+        
+        self.vector_store = bundle.open_vector_store(self.embeddings)
+        self.index_version = bundle.metadata.get("source_version")
+        self.reducer = bundle.reducer()
+        with self._query_lock:
+            self._query_vectors.clear()
+        
+        self.binary_codes = BinaryCodes(bundle.array("binary_codes"), bundle.metadata["dimension"])
+        self.section_index = bundle.section_index()
+        if self.section_index is not None:
+            self.section_index.chunk_vectors = self.vector_store.index.vectors
+        
+        print(f"✅ 成功打开知识库包: {path} ({bundle.metadata['num_documents']} 个文本块)")
+        return self.vector_store
     
-    def load_vector_store(self, load_path: str) -> VectorStore:
+    def load_vector_store(self, load_path: str, version: str = "latest") -> VectorStore:
         """
         从磁盘加载向量存储
         
         Args:
-            load_path: 加载路径
+            load_path: 加载路径（快照仓库根目录，或旧版本直接保存的目录）
+            version: "latest" 加载当前发布的快照，也可以固定为某个历史版本号
             
         Returns:
             向量存储对象
@@ -85,16 +426,74 @@ class VectorStoreManager:
         if not os.path.exists(load_path):
             raise FileNotFoundError(f"向量存储不存在: {load_path}")
         
+        # 解析快照版本；兼容旧版本直接写在目录下的索引文件
+        snapshots = SnapshotStore(load_path)
+        if snapshots.current_version() is not None or version != "latest":
+            index_path = snapshots.resolve(version)
+            self.index_version = os.path.basename(index_path)
+            self._check_embedding_backend(snapshots.read_manifest(self.index_version)["metadata"])
+        elif os.path.exists(os.path.join(load_path, "index.faiss")):
+            index_path = load_path
+            self.index_version = None
+        else:
+            raise FileNotFoundError(f"向量存储不存在: {load_path}")
+        
         # 加载向量存储
         self.vector_store = FAISS.load_local(
-            load_path=load_path,
+            folder_path=index_path,
             embeddings=self.embeddings,
             allow_dangerous_deserialization=True  # FAISS需要此参数
         )
         
-        print(f"✅ 成功加载向量存储: {load_path}")
+        # 查询向量必须与索引使用同一个降维器；切换索引后旧的查询向量缓存失效
+        self.reducer = DimensionReducer.load(index_path)
+        with self._query_lock:
+            self._query_vectors.clear()
+        
+        # 文本块表需要挂载数据文件
+        if isinstance(self.vector_store.docstore, ChunkTable):
+            self.vector_store.docstore.attach(index_path)
+        
+        # 二值编码（没有保存时在第一次级联检索时生成）
+        self.binary_codes = BinaryCodes.load(index_path, self.vector_store.index.d)
+        
+        # 加载章节索引，并从FAISS索引中取回文本块向量
+        self.section_index = SectionIndex.load(index_path)
+        if self.section_index is not None:
+            index = self.vector_store.index
+            self.section_index.chunk_vectors = index.reconstruct_n(0, index.ntotal)
+        
+        print(f"✅ 成功加载向量存储: {index_path}")
         return self.vector_store
     
+    def _check_embedding_backend(self, metadata: dict):
+        """
+        校验快照的Embedding后端与当前后端一致
+        
+        不同后端（或不同参数）的向量处在不同的空间中，混用时检索结果毫无意义，后端不一致时默认拒绝加载。
+        启用 follow_snapshot_model 且快照记录了构建时的模型名称时（如在线迁移后发布的快照），
+        改用该模型加载并打印警告。未记录后端的旧快照跳过校验。
+        
+        Args:
+            metadata: 快照清单中的元数据
+        """
+        built_with = metadata.get("embedding_backend")
+        current = embedding_backend_id(self.embeddings)
+        model = metadata.get("embedding_model")
+        if (self.follow_snapshot_model and built_with is not None and built_with != current
+                and model and model != self.embedding_model):
+            embeddings = create_embeddings(model)
+            if embedding_backend_id(embeddings) == built_with:
+                print(f"⚠️ 快照由Embedding模型 {model} 构建，与当前配置 {self.embedding_model} 不一致，"
+                      f"按快照记录的模型加载（EMBEDDING_FOLLOW_SNAPSHOT）")
+                self.embeddings, self.embedding_model = embeddings, model
+                current = built_with
+        if built_with is not None and built_with != current:
+            raise ValueError(
+                f"向量索引由Embedding后端 {built_with} 构建，与当前后端 {current} 不一致，"
+                f"请修改 EMBEDDING_MODEL、重新构建知识库，或设置 EMBEDDING_FOLLOW_SNAPSHOT=1 按快照记录的模型加载"
+            )
+    
     def similarity_search(self, query: str, k: int = 3) -> List[Document]:
         """
         相似度搜索：根据查询文本找到最相关的文档
@@ -114,7 +513,7 @@ class VectorStoreManager:
         # 1. 将查询文本转换为向量
         # 2. 计算查询向量与所有文档向量的相似度（默认使用余弦相似度）
         # 3. 返回最相似的k个文档
-        results = self.vector_store.similarity_search(query, k=k)
+        results = [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
         
         return results
     
@@ -132,8 +531,119 @@ class VectorStoreManager:
         if self.vector_store is None:
             raise ValueError("向量存储未初始化，请先创建或加载向量存储")
         
+        migration = self.migration
+        if migration is not None:
+            return migration.similarity_search_with_score(query, k)
+        if self.cascade and self._has_flat_vectors():
+            return self._cascade_search(self.embed_query(query), k)
+        if self.hierarchical and self.section_index is not None:
+            return self._hierarchical_search(self.embed_query(query), k)
+        
         # 返回文档和相似度分数
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        results = self.vector_store.similarity_search_with_score_by_vector(self.embed_query(query).tolist(), k=k)
+        self.last_scored_chunks = self.vector_store.index.ntotal
+        
+        return results
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 3) -> List[List[Document]]:
+        """
+        批量相似度搜索：一次Embedding调用 + 一次FAISS矩阵检索
+        
+        Args:
+            queries: 查询文本列表
+            k: 每个查询返回的文档数量
+            
+        Returns:
+            与 queries 一一对应的文档列表
+        """
+        if self.vector_store is None:
+            raise ValueError("向量存储未初始化，请先创建或加载向量存储")
+        if not queries:
+            return []
+        
+        migration = self.migration
+        if migration is not None:
+            return [[doc for doc, _ in migration.similarity_search_with_score(query, k)] for query in queries]
+        
+        query_vectors = self.embed_queries(queries)
+        
+        if self.cascade and self._has_flat_vectors():
+            return [[doc for doc, _ in self._cascade_search(vector, k)] for vector in query_vectors]
+        if self.hierarchical and self.section_index is not None:
+            return [[doc for doc, _ in self._hierarchical_search(vector, k)] for vector in query_vectors]
+        
+        _, rows = self.vector_store.index.search(np.ascontiguousarray(query_vectors), k)
+        self.last_scored_chunks = self.vector_store.index.ntotal
+        return [
+            [
+                self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[row])
+                for row in query_rows if row != -1
+            ]
+            for query_rows in rows
+        ]
+    
+    def _has_flat_vectors(self) -> bool:
+        """索引是否保存了浮点向量（Flat索引或知识库包）；IVF-PQ等压缩索引只有编码，无法级联检索"""
+        index = self.vector_store.index
+        return isinstance(index, MappedFlatIndex) or hasattr(index, "get_xb")
+    
+    def _flat_vectors(self) -> np.ndarray:
+        """FAISS Flat索引中全部文本块的浮点向量（零拷贝视图）"""
+        import faiss
+        
+        index = self.vector_store.index
+        if isinstance(index, MappedFlatIndex):
+            return index.vectors
+        if not hasattr(index, "get_xb"):
+            raise ValueError(f"级联检索需要Flat索引保存的浮点向量，当前索引类型为 {type(index).__name__}")
+        return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    
+    def _ensure_binary_codes(self) -> BinaryCodes:
+        """返回与索引行数一致的二值编码，缺失或过期时从浮点向量重新生成"""
+        with self._codes_lock:
+            if self.binary_codes is None or len(self.binary_codes) != self.vector_store.index.ntotal:
+                self.binary_codes = BinaryCodes.from_vectors(self._flat_vectors())
+            return self.binary_codes
+    
+    def _cascade_search(self, query_vector: np.ndarray, k: int) -> List[tuple]:
+        """
+        级联检索：汉明距离扫描全部二值编码选出候选，再用浮点向量精排
+        
+        Args:
+            query_vector: 查询向量
+            k: 返回最相关的k个文档
+            
+        Returns:
+            (文档, L2距离) 元组列表，分数含义与FAISS默认检索一致
+        """
+        codes = self._ensure_binary_codes()
+        candidates = codes.candidates(query_vector, max(k, self.cascade_candidates))
+        rows, distances = rerank(self._flat_vectors(), candidates, query_vector, k)
+        self.last_scored_chunks = len(candidates)
+        
+        return [
+            (self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[int(row)]), float(distance))
+            for row, distance in zip(rows, distances)
+        ]
+    
+    def _hierarchical_search(self, query_vector: np.ndarray, k: int) -> List[tuple]:
+        """
+        两级检索：先选出最相关的章节，再只在这些章节的文本块中检索
+        
+        Args:
+            query_vector: 查询向量
+            k: 返回最相关的k个文档
+            
+        Returns:
+            (文档, L2距离) 元组列表，分数含义与FAISS默认检索一致
+        """
+        rows, distances, scored = self.section_index.search(query_vector, k, self.top_sections)
+        self.last_scored_chunks = scored
+        
+        results = []
+        for row, distance in zip(rows, distances):
+            docstore_id = self.vector_store.index_to_docstore_id[row]
+            results.append((self.vector_store.docstore.search(docstore_id), distance))
         
         return results
 
@@ -158,7 +668,7 @@ def demo_vector_store():
     documents = loader.load_and_split(file_path)
     
     # 2. 创建向量存储
-    vector_manager = VectorStoreManager()
+    vector_manager = VectorStoreManager(hierarchical=True)
     vector_store = vector_manager.create_vector_store(documents)
     
     # 3. 测试相似度搜索
@@ -175,9 +685,10 @@ def demo_vector_store():
     for query in test_queries:
         print(f"\n🔍 查询: {query}")
         results = vector_manager.similarity_search_with_score(query, k=2)
+        print(f"  📊 本次打分文本块数: {vector_manager.last_scored_chunks}")
         
         for i, (doc, score) in enumerate(results, 1):
-            print(f"\n  结果 {i} (相似度: {score:.4f}):")
+            print(f"\n  结果 {i} (相似度: {score:.4f}, 章节: {doc.metadata.get('section') or '-'}):")
             print(f"  {doc.page_content[:200]}...")
     
     # 4. 保存向量存储